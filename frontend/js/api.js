@@ -2,7 +2,7 @@
 const API_BASE = '/api/auth';
 
 class APIClient {
-    async request(method, endpoint, data = null) {
+    async request(method, endpoint, data = null, retry = true) {
         const options = {
             method,
             headers: {
@@ -11,6 +11,12 @@ class APIClient {
             credentials: 'include' // Important for session cookies
         };
         
+        // Token mode (AUTH_MODE = token/both): send the access token when we have one
+        const accessToken = sessionStorage.getItem('accessToken');
+        if (accessToken) {
+            options.headers['Authorization'] = `Bearer ${accessToken}`;
+        }
+        
         if (data) {
             options.body = JSON.stringify(data);
         }
@@ -19,16 +25,54 @@ class APIClient {
             const response = await fetch(`${API_BASE}${endpoint}`, options);
             const responseData = await response.json();
             
+            // Expired access token: renew it once with the refresh token and retry
+            if (response.status === 401 && accessToken && retry && await this.refreshTokens()) {
+                return this.request(method, endpoint, data, false);
+            }
+            
             if (!response.ok) {
                 throw new Error(responseData.message || 'Request failed');
             }
             
+            this.storeTokens(responseData);
             return responseData;
         } catch (error) {
             throw error;
         }
     }
     
+    storeTokens(responseData) {
+        if (responseData && responseData.accessToken) {
+            sessionStorage.setItem('accessToken', responseData.accessToken);
+        }
+        if (responseData && responseData.refreshToken) {
+            sessionStorage.setItem('refreshToken', responseData.refreshToken);
+        }
+    }
+    
+    clearTokens() {
+        sessionStorage.removeItem('accessToken');
+        sessionStorage.removeItem('refreshToken');
+    }
+    
+    async refreshTokens() {
+        const refreshToken = sessionStorage.getItem('refreshToken');
+        if (!refreshToken) {
+            return false;
+        }
+        const response = await fetch(`${API_BASE}/refresh`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ refreshToken })
+        });
+        if (!response.ok) {
+            this.clearTokens();
+            return false;
+        }
+        this.storeTokens(await response.json());
+        return true;
+    }
+    
     // Auth endpoints
     async register(name, email, password, confirmPassword) {
         return this.request('POST', '/register', {
@@ -77,11 +121,16 @@ class APIClient {
     }
     
     async getAccessLogs() {
-        return this.request('GET', '/access-logs');
+        // Only the fields the dashboard renders; unchanged lists are revalidated via ETag
+        return this.request('GET', '/access-logs?fields=action,success,ipAddress,location,deviceInfo,timestamp');
     }
     
     async logout() {
-        return this.request('POST', '/logout');
+        try {
+            return await this.request('POST', '/logout');
+        } finally {
+            this.clearTokens();
+        }
     }
 }
 
@@ -0,0 +1,127 @@
+"""
+Consulta paginada do histórico de acessos (GET /api/auth/access-logs).
+
+- Paginação por cursor (keyset) em (login_time, id), do mais recente para o
+  mais antigo: `cursor=` continua a partir do último item da página anterior
+  sem OFFSET, usando o índice (user_id, login_time)
+- `fields=` seleciona só as colunas necessárias para os campos pedidos (sem
+  carregar objetos do ORM nem as colunas JSON que não forem usadas)
+- `since=` (modo delta) retorna só os acessos mais novos que o cursor
+  informado, normalmente o `latestCursor` da resposta anterior
+- O ETag é calculado a partir do acesso mais recente do usuário (uma leitura
+  pelo índice) e dos parâmetros; com If-None-Match igual a resposta é 304,
+  sem a consulta da página e sem serialização
+"""
+import base64
+import hashlib
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from models import db, AccessLog, format_location, format_device_info
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Campo da API -> (colunas necessárias, formatação a partir da linha)
+FIELDS = {
+    'id': (['id'], lambda row: row.id),
+    'userId': (['user_id'], lambda row: row.user_id),
+    'action': (['action'], lambda row: row.action),
+    'success': (['success'], lambda row: row.success),
+    'ipAddress': (['ip_address'], lambda row: row.ip_address),
+    'userAgent': (['user_agent'], lambda row: row.user_agent),
+    'location': (['location'], lambda row: format_location(row.location)),
+    'deviceInfo': (['device_info'], lambda row: format_device_info(row.device_info)),
+    'timestamp': (['login_time'], lambda row: row.login_time.isoformat() if row.login_time else None),
+    'blockedReason': (['blocked_reason'], lambda row: row.blocked_reason),
+    'sessionBlocked': (['session_blocked'], lambda row: row.session_blocked),
+}
+
+
+class InvalidQuery(ValueError):
+    """Parâmetro inválido na consulta (resposta 400)"""
+
+
+def encode_cursor(login_time, log_id):
+    raw = f'{login_time.isoformat()}|{log_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        login_time, log_id = raw.split('|', 1)
+        return datetime.fromisoformat(login_time), log_id
+    except ValueError:
+        raise InvalidQuery('Cursor inválido')
+
+
+def parse_params(args):
+    """Valida os parâmetros da requisição; retorna (campos, limite, cursor, since)"""
+    fields = list(FIELDS)
+    if args.get('fields'):
+        fields = [name.strip() for name in args['fields'].split(',') if name.strip()]
+        unknown = [name for name in fields if name not in FIELDS]
+        if unknown or not fields:
+            raise InvalidQuery(f"Campos inválidos: {', '.join(unknown) or args['fields']}")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidQuery('Limite inválido')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQuery(f'O limite deve estar entre 1 e {MAX_LIMIT}')
+
+    cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+    since = decode_cursor(args['since']) if args.get('since') else None
+    if cursor and since:
+        raise InvalidQuery('Use cursor ou since, não os dois')
+    return fields, limit, cursor, since
+
+
+def latest_marker(user_id):
+    """(login_time, id) do acesso mais recente do usuário, ou None"""
+    row = db.session.execute(
+        select(AccessLog.login_time, AccessLog.id)
+        .where(AccessLog.user_id == user_id)
+        .order_by(AccessLog.login_time.desc(), AccessLog.id.desc())
+        .limit(1)
+    ).first()
+    return tuple(row) if row else None
+
+
+def compute_etag(user_id, marker, query_string):
+    """Valor do ETag (fraco): muda quando entra um acesso novo ou quando os parâmetros mudam"""
+    state = f"{user_id}|{marker[0].isoformat() if marker else ''}|{marker[1] if marker else ''}|{query_string}"
+    return hashlib.sha1(state.encode()).hexdigest()
+
+
+def fetch_page(user_id, fields, limit, cursor=None, since=None):
+    """Retorna o corpo da resposta: logs, nextCursor e latestCursor"""
+    columns = {'login_time', 'id'}
+    for name in fields:
+        columns.update(FIELDS[name][0])
+    key = tuple_(AccessLog.login_time, AccessLog.id)
+
+    query = select(*(getattr(AccessLog, column) for column in sorted(columns))) \
+        .where(AccessLog.user_id == user_id) \
+        .order_by(AccessLog.login_time.desc(), AccessLog.id.desc()) \
+        .limit(limit + 1)
+    if cursor:
+        query = query.where(key < tuple_(*cursor))
+    if since:
+        query = query.where(key > tuple_(*since))
+    rows = db.session.execute(query).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    body = {
+        'logs': [{name: FIELDS[name][1](row) for name in fields} for row in rows],
+        'nextCursor': encode_cursor(rows[-1].login_time, rows[-1].id) if rows and has_more else None,
+        'latestCursor': encode_cursor(rows[0].login_time, rows[0].id) if rows else (
+            encode_cursor(*since) if since else None
+        ),
+    }
+    if since:
+        # Mais de `limit` acessos novos: o cliente deve recarregar do início
+        body['truncated'] = has_more
+    return body
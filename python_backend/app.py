@@ -1,93 +1,219 @@
-from flask import Flask, send_from_directory, session as flask_session
+"""
+Aplicação Flask do AMFA.
+
+`create_app(config)` monta a aplicação sem abrir conexões com o banco: o
+engine do SQLAlchemy só conecta na primeira consulta, as threads de fundo
+(auditoria, força bruta) só iniciam no primeiro uso e o esquema não é
+verificado na inicialização. As tabelas são criadas/atualizadas por um
+comando explícito:
+
+    flask --app app init-db
+
+(ou `python serve.py --init-db` em produção; run.py aplica no modo de
+desenvolvimento). `from app import app` continua funcionando: a aplicação
+padrão é criada no primeiro acesso ao atributo.
+"""
+import os
+from flask import Flask, session as flask_session
 from flask_cors import CORS
-from flask_session import Session
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import os
 from config import Config
 from models import db
 from routes import auth_bp
+from security import check_location_providers
+from brute_force import brute_force_guard
+from audit_writer import audit_writer
+from tokens import denylist
+import session_store
+from static_assets import StaticAssets
+from limiter_storage import storage_timer
+import metrics
+import profiler
+import query_budget
 
-# Cria a aplicação Flask e define a pasta de arquivos estáticos (frontend)
-app = Flask(__name__, static_folder='../frontend', static_url_path='/static')
-app.config.from_object(Config)
+# Limite de requisições (Rate Limiting)
 
+# Evita abusos e ataques de força bruta limitando o número de requisições
+# (RATELIMIT_STORAGE_URI/STRATEGY/DEFAULT; contadores compartilhados pelos workers, ver limiter_storage.py)
+limiter = Limiter(get_remote_address)
 
-# Configuração do banco de dados
 
-app.config['SQLALCHEMY_DATABASE_URI'] = Config.DATABASE_URL
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,  # Testa conexão antes de usar
-    'pool_recycle': 300,    # Renova conexões a cada 5 min
-    'pool_size': 10,
-    'max_overflow': 20
-}
-db.init_app(app)
+def create_app(config=Config):
+    """Cria e configura a aplicação (sem acessar o banco)"""
+    if not config.DATABASE_URL:
+        raise ValueError("A variável DATABASE_URL é obrigatória")
+    # As chaves padrão são públicas: com elas qualquer um forja sessões e tokens
+    if config.AUTH_MODE in ('token', 'both') and not config.TOKEN_SECRET:
+        raise ValueError(f"A variável TOKEN_SECRET é obrigatória com AUTH_MODE={config.AUTH_MODE}")
+    if os.getenv('NODE_ENV') == 'production' and not os.getenv('SESSION_SECRET'):
+        raise ValueError("A variável SESSION_SECRET é obrigatória em produção")
+    # Um nome errado só apareceria como KeyError no primeiro login
+    check_location_providers(config.GEOIP_PROVIDERS)
 
+    # Cria a aplicação Flask e define a pasta de arquivos estáticos (frontend)
+    app = Flask(__name__, static_folder='../frontend', static_url_path='/static')
+    app.config.from_object(config)
 
-# Configuração da sessão
 
-# Define como as sessões serão armazenadas e gerenciadas
-app.config['SESSION_SQLALCHEMY'] = db
-Session(app)
+    # Configuração do banco de dados
 
+    app.config['SQLALCHEMY_DATABASE_URI'] = config.DATABASE_URL
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': True,  # Testa conexão antes de usar
+        'pool_recycle': 300,    # Renova conexões a cada 5 min
+        'pool_size': 10,
+        'max_overflow': 20
+    }
+    db.init_app(app)
 
-# Configuração de CORS
 
-# Permite que o frontend acesse a API de outro domínio/origem
-CORS(app, supports_credentials=True)
+    # Configuração da sessão
 
+    # Define como as sessões serão armazenadas e gerenciadas (SESSION_BACKEND, ver session_store.py)
+    session_store.init_app(app, db)
 
-# Limite de requisições (Rate Limiting)
 
-# Evita abusos e ataques de força bruta limitando o número de requisições
-limiter = Limiter(
-    get_remote_address,
-    app=app,
-    default_limits=["200 per hour"],
-    storage_uri="memory://"
-)
-
-
-# Inicialização do banco
-
-# Cria as tabelas se ainda não existirem
-with app.app_context():
-    db.create_all()
-    print("Tabelas do banco criadas com sucesso")
-
-
-# Registro das rotas (blueprints)
-
-# Conecta o módulo de autenticação (auth_bp) à aplicação principal
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-
-# Função principal para servir o frontend
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    """
-    Serve o frontend (SPA) e arquivos estáticos.
-    Se a rota for da API, retorna 404.
-    Se for um arquivo existente, serve diretamente.
-    Caso contrário, retorna o index.html.
-    """
-    # Ignora rotas da API
-    if path.startswith('api/'):
-        return '', 404
-    
-    # Se o arquivo existir, serve diretamente
-    file_path = os.path.join(app.static_folder, path)
-    if path and os.path.exists(file_path) and os.path.isfile(file_path):
-        return send_from_directory(app.static_folder, path)
-    
-    # Caso contrário, retorna o index.html (SPA)
-    return send_from_directory(app.static_folder, 'index.html')
+    # Configuração de CORS
+
+    # Permite que o frontend acesse a API de outro domínio/origem
+    CORS(app, supports_credentials=True)
+
+
+    # Perfil de execução sob demanda (primeiro a começar e último a terminar)
+
+    # Amostra de requisições ou cabeçalho X-Profile autenticado; perfis em PROFILE_DIR (ver profiler.py)
+    profiler.init_app(app)
+
+
+    # Métricas (antes do limitador, para medir também as respostas 429)
+
+    # Latência por rota, estágios, consultas SQL e contadores em GET /metrics (ver metrics.py)
+    if config.METRICS_ENABLED:
+        metrics.init_app(app)
+
+
+    # Consultas por requisição
+
+    # Orçamento de consultas por rota, instruções repetidas (N+1) e cabeçalhos X-Query-* (ver query_budget.py)
+    query_budget.init_app(app)
+
+
+    # Limite de requisições
+
+    limiter.init_app(app)
+    storage_timer.instrument(limiter.storage)
+    if config.METRICS_ENABLED:
+        limiter.exempt(app.view_functions['metrics'])
+
+
+    # Serviços de fundo (iniciados no primeiro uso)
+
+    # Contadores de força bruta reconstruídos de login_attempts na primeira verificação
+    if config.BRUTE_FORCE_BACKEND == 'memory':
+        brute_force_guard.init_app(app)
+
+    # Gravação em lote de access_logs/login_attempts
+    audit_writer.init_app(app)
+
+    # Tokens revogados recarregados do banco por uma thread de fundo
+    if config.AUTH_MODE in ('token', 'both'):
+        denylist.init_app(app)
+
+
+    # Registro das rotas (blueprints)
+
+    # Conecta o módulo de autenticação (auth_bp) à aplicação principal
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+
+    # Função principal para servir o frontend
+
+    # Arquivos do frontend em memória, com fingerprint e pré-comprimidos (ver static_assets.py)
+    assets = StaticAssets(app.static_folder)
+    app.extensions['static_assets'] = assets
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        """
+        Serve o frontend (SPA) e arquivos estáticos.
+        Se a rota for da API, retorna 404.
+        Se for um arquivo conhecido, serve a versão em memória.
+        Caso contrário, retorna o index.html.
+        """
+        # Ignora rotas da API
+        if path.startswith('api/'):
+            return '', 404
+
+        # Arquivo do manifesto (nome original ou com fingerprint)
+        asset = assets.get(path) if path else None
+
+        # Caso contrário, retorna o index.html (SPA); sem ele no frontend, 404
+        asset = asset or assets.index
+        if asset is None:
+            return '', 404
+        return assets.response(asset)
+
+
+    # Estatísticas dos serviços exportadas no /metrics
+
+    if config.METRICS_ENABLED:
+        register_metrics_collectors(app)
+
+
+    # Comandos (flask --app app <comando>)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Cria/atualiza as tabelas e os índices do banco"""
+        init_db(app)
+
+    return app
+
+
+def register_metrics_collectors(app):
+    """Exporta os stats() dos serviços como gauges do /metrics"""
+    from hashing import hashing_service
+    from mail_queue import mail_queue
+    from security import location_cache, shared_location_cache
+
+    metrics.register_collector('http_session', app.session_interface.stats)
+    metrics.register_collector('static_assets', app.extensions['static_assets'].stats)
+    metrics.register_collector('ratelimit_storage', storage_timer.stats)
+    metrics.register_collector('location_cache', location_cache.stats)
+    if shared_location_cache is not None:
+        metrics.register_collector('location_shared_cache', shared_location_cache.stats)
+    metrics.register_collector('hashing', hashing_service.stats)
+    metrics.register_collector('mail_queue', mail_queue.stats)
+    metrics.register_collector('audit_writer', audit_writer.stats)
+    metrics.register_collector('brute_force', brute_force_guard.stats)
+    metrics.register_collector('token_denylist', denylist.stats)
+    metrics.register_collector('profiler', profiler.request_profiler.stats)
+
+
+def init_db(app):
+    """Aplica as migrações pendentes e cria a tabela de sessões, se necessário"""
+    from migrations import upgrade
+
+    with app.app_context():
+        upgrade(db.engine)
+        app.session_interface.backend.create_schema()
+    print("Esquema do banco atualizado")
+
+
+def __getattr__(name):
+    # `from app import app` (run.py, scripts, gunicorn app:app): aplicação padrão criada no primeiro acesso
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Execução da aplicação
 
 # Inicia o servidor Flask na porta 5000
 if __name__ == '__main__':
+    app = create_app()
+    init_db(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
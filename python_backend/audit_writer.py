@@ -0,0 +1,309 @@
+"""
+Gravação em lote (write-behind) dos registros de auditoria.
+
+Os AccessLog e LoginAttempt das rotas de autenticação não são mais gravados
+com um commit por requisição: vão para uma fila do processo e uma thread de
+fundo grava tudo a cada AUDIT_FLUSH_SECONDS, ou antes disso quando a fila
+chega a AUDIT_FLUSH_BATCH registros, com INSERTs de várias linhas em uma
+única transação (junto com o estado de localização, ver location_state.py).
+
+- A fila é limitada (AUDIT_MAX_PENDING); registros que não cabem, ou que
+  sobram quando o processo encerra sem conseguir gravar, são contados em
+  `lost` nas estatísticas
+- Lote que falha por conexão (banco fora do ar, travado) volta ao início da
+  fila, até AUDIT_MAX_RETRIES vezes seguidas; lote que falha pelos dados (uma
+  linha inválida) ou que esgotou as tentativas é gravado em metades até
+  isolar as linhas que falham sozinhas, que vão para o arquivo de
+  dead-letter em AUDIT_DEAD_LETTER_DIR (uma linha JSON por registro). Assim
+  um registro ruim não prende a fila atrás dele
+- No encerramento a fila é esvaziada (atexit), com tempo limite
+- Enquanto um registro não é gravado, o IP conhecido (has_pending_success) e
+  as coordenadas do login (pending_locations) continuam visíveis para as
+  verificações de risco do mesmo processo
+- Sem init_app (scripts) ou com AUDIT_WRITE_BEHIND desativado, os registros
+  são gravados na hora
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy.exc import InterfaceError, OperationalError
+from config import Config
+from models import db, AccessLog, LoginAttempt, generate_uuid, get_sp_now
+from location_state import location_state_cache, record_locations
+import metrics
+
+
+class AuditWriter:
+    """Fila de AccessLog/LoginAttempt gravada em lote por uma thread de fundo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._access_logs = deque()
+        self._login_attempts = deque()
+        # Registros na fila ou em gravação, consultados pelas verificações de risco
+        self._pending_ips = {}
+        self._pending_locations = {}
+        self._app = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Falhas de conexão seguidas do lote no início da fila
+        self._retries = 0
+        self._counters = {
+            'access_logs': 0, 'login_attempts': 0, 'persisted': 0,
+            'flushes': 0, 'flush_errors': 0, 'dead_letter': 0, 'lost': 0
+        }
+
+    # Ciclo de vida
+
+    def init_app(self, app):
+        # A thread de fundo inicia com o primeiro registro (_enqueue)
+        self._app = app
+
+    def start(self):
+        if self._pid == os.getpid() or self._app is None:
+            return
+        # Depois de um fork a fila herdada pertence ao processo pai
+        with self._lock:
+            self._access_logs.clear()
+            self._login_attempts.clear()
+            self._pending_ips.clear()
+            self._pending_locations.clear()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        """Grava os registros pendentes e encerra a thread"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(Config.AUDIT_SHUTDOWN_TIMEOUT + 1)
+        self._pid = None
+        with self._lock:
+            left = len(self._access_logs) + len(self._login_attempts)
+            self._counters['lost'] += left
+        if left:
+            print(f'{left} registros de auditoria não foram gravados no encerramento')
+
+    @property
+    def write_behind(self):
+        return Config.AUDIT_WRITE_BEHIND and self._app is not None
+
+    # API usada pelas rotas e por security.py
+
+    def log_access(self, user_id, action, success, ip_address=None, user_agent=None,
+                   location=None, device_info=None, blocked_reason=None):
+        """Registra um AccessLog; retorna o dict da linha"""
+        row = {
+            'id': generate_uuid(),
+            'user_id': user_id,
+            'action': action,
+            'success': success,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'location': location,
+            'device_info': device_info,
+            'login_time': get_sp_now(),
+            'blocked_reason': blocked_reason,
+            'session_blocked': False
+        }
+        if not self.write_behind:
+            self._count('access_logs')
+            self._write(db.session.connection(), [row], [])
+            db.session.commit()
+            return row
+        self._enqueue(self._access_logs, row)
+        return row
+
+    def log_attempt(self, row):
+        """Registra uma linha de login_attempts (id, email, ip_address, success, attempted_at)"""
+        if not self.write_behind:
+            self._count('login_attempts')
+            self._write(db.session.connection(), [], [row])
+            db.session.commit()
+            return
+        self._enqueue(self._login_attempts, row)
+
+    def has_pending_success(self, user_id, ip_address):
+        """Se há um acesso bem-sucedido do usuário por este IP ainda não gravado"""
+        with self._lock:
+            return (user_id, ip_address) in self._pending_ips
+
+    def pending_locations(self, user_id):
+        """[(login_time, lat, lng, success)] ainda não gravados, do mais recente para o mais antigo"""
+        with self._lock:
+            return list(reversed(self._pending_locations.get(user_id, ())))
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._access_logs) + len(self._login_attempts)
+            counters = dict(self._counters)
+        return {'pending': pending, **counters}
+
+    # Fila
+
+    def _enqueue(self, target, row):
+        self.start()
+        with self._lock:
+            self._counters['access_logs' if target is self._access_logs else 'login_attempts'] += 1
+            if len(self._access_logs) + len(self._login_attempts) >= Config.AUDIT_MAX_PENDING:
+                self._counters['lost'] += 1
+                return
+            target.append(row)
+            if target is self._access_logs:
+                self._track(row, 1)
+            size = len(self._access_logs) + len(self._login_attempts)
+        if size >= Config.AUDIT_FLUSH_BATCH:
+            self._wakeup.set()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _track(self, row, delta):
+        """Atualiza os índices de registros pendentes (chamar com o lock)"""
+        user_id = row['user_id']
+        if not user_id:
+            return
+        if row['success']:
+            key = (user_id, row['ip_address'])
+            count = self._pending_ips.get(key, 0) + delta
+            if count > 0:
+                self._pending_ips[key] = count
+            else:
+                self._pending_ips.pop(key, None)
+        location = row['location']
+        if location and location.get('lat') and location.get('lng'):
+            entries = self._pending_locations.setdefault(user_id, [])
+            entry = (row['login_time'], float(location['lat']), float(location['lng']), row['success'])
+            if delta > 0:
+                entries.append(entry)
+            else:
+                entries.remove(entry)
+            if not entries:
+                del self._pending_locations[user_id]
+
+    # Thread de fundo
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(Config.AUDIT_FLUSH_SECONDS)
+            self._wakeup.clear()
+            stopping = self._stop.is_set()
+            with self._app.app_context():
+                self._flush(deadline=time.monotonic() + Config.AUDIT_SHUTDOWN_TIMEOUT if stopping else None)
+            if stopping:
+                return
+
+    def _take_batch(self):
+        with self._lock:
+            access_logs = [self._access_logs.popleft()
+                           for _ in range(min(len(self._access_logs), Config.AUDIT_FLUSH_BATCH))]
+            room = Config.AUDIT_FLUSH_BATCH - len(access_logs)
+            login_attempts = [self._login_attempts.popleft()
+                              for _ in range(min(len(self._login_attempts), room))]
+        return access_logs, login_attempts
+
+    def _flush(self, deadline=None):
+        """Grava a fila em lotes de AUDIT_FLUSH_BATCH; no encerramento, até o prazo"""
+        while True:
+            access_logs, login_attempts = self._take_batch()
+            if not access_logs and not login_attempts:
+                return
+            try:
+                self._commit(access_logs, login_attempts)
+                self._retries = 0
+                continue
+            except Exception as e:
+                self._count('flush_errors')
+                error = e
+            count = len(access_logs) + len(login_attempts)
+            if isinstance(error, (OperationalError, InterfaceError)) and self._retries < Config.AUDIT_MAX_RETRIES:
+                # Falha de conexão: devolve o lote ao início da fila para a próxima rodada
+                self._retries += 1
+                print(f'Falha ao gravar {count} registros de auditoria (tentativa {self._retries}): {error}')
+                with self._lock:
+                    self._access_logs.extendleft(reversed(access_logs))
+                    self._login_attempts.extendleft(reversed(login_attempts))
+                if deadline is None or time.monotonic() >= deadline:
+                    return
+                time.sleep(0.5)
+                continue
+            # Erro nos dados (ou falhas repetidas): isola as linhas que não gravam
+            print(f'Falha ao gravar {count} registros de auditoria; gravando em partes: {error}')
+            self._retries = 0
+            self._isolate(access_logs, [])
+            self._isolate([], login_attempts)
+
+    def _commit(self, access_logs, login_attempts):
+        with metrics.span('audit_flush'), db.engine.begin() as conn:
+            self._write(conn, access_logs, login_attempts)
+        with self._lock:
+            self._counters['persisted'] += len(access_logs) + len(login_attempts)
+            self._counters['flushes'] += 1
+        self._untrack(access_logs)
+
+    def _untrack(self, access_logs):
+        with self._lock:
+            for row in access_logs:
+                self._track(row, -1)
+        # Uma leitura entre a invalidação e o commit pode ter trazido o estado antigo
+        for user_id in {row['user_id'] for row in access_logs if row['user_id']}:
+            location_state_cache.delete(user_id)
+
+    def _isolate(self, access_logs, login_attempts):
+        """Grava o lote em metades até restarem só as linhas que falham sozinhas"""
+        rows = access_logs or login_attempts
+        if not rows:
+            return
+        try:
+            self._commit(access_logs, login_attempts)
+            return
+        except Exception as e:
+            self._count('flush_errors')
+            if len(rows) == 1:
+                self._dead_letter('access_logs' if access_logs else 'login_attempts', rows[0], e)
+                return
+        middle = len(rows) // 2
+        if access_logs:
+            self._isolate(access_logs[:middle], [])
+            self._isolate(access_logs[middle:], [])
+        else:
+            self._isolate([], login_attempts[:middle])
+            self._isolate([], login_attempts[middle:])
+
+    def _dead_letter(self, table, row, error):
+        """Guarda o registro que não grava em um arquivo JSON lines (ou o conta como perdido)"""
+        if table == 'access_logs':
+            self._untrack([row])
+        try:
+            os.makedirs(Config.AUDIT_DEAD_LETTER_DIR, exist_ok=True)
+            path = os.path.join(Config.AUDIT_DEAD_LETTER_DIR, f'audit-{os.getpid()}.jsonl')
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'table': table, 'error': str(error), 'row': row}, default=str) + '\n')
+            self._count('dead_letter')
+            print(f"Registro de auditoria {row['id']} ({table}) movido para {path}: {error}")
+        except OSError as e:
+            self._count('lost')
+            print(f"Registro de auditoria {row['id']} ({table}) perdido: {error}; dead-letter: {e}")
+
+    @staticmethod
+    def _write(conn, access_logs, login_attempts):
+        if access_logs:
+            conn.execute(AccessLog.__table__.insert(), access_logs)
+            # Inserções em lote não disparam o after_insert do ORM
+            record_locations(conn, access_logs)
+        if login_attempts:
+            conn.execute(LoginAttempt.__table__.insert(), login_attempts)
+
+
+# Instância compartilhada pelo processo
+audit_writer = AuditWriter()
+atexit.register(audit_writer.stop)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem de emails: custo por mensagem de renderizar o template
+e de montar os bytes MIME entregues ao SMTP.
+
+- compilação: leitura e divisão dos templates de um idioma (uma vez por processo)
+- render: preenchimento de um template já compilado (assunto, HTML e texto)
+- MIME: build_message (cabeçalhos das partes constantes, um único join) x o
+  caminho anterior (MIMEMultipart/MIMEText do pacote email serializados com
+  as_bytes(), como o send_message do smtplib fazia)
+
+Nenhum email é enviado; a fila e o SMTP não são usados.
+
+Uso:
+    python benchmarks/bench_email_render.py [--iterations 20000] [--locale pt_BR]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import email_templates  # noqa: E402
+from email_templates import LocaleCatalog, get_catalog  # noqa: E402
+from mail_queue import build_message  # noqa: E402
+from config import Config  # noqa: E402
+
+LOCATION = 'São Paulo, São Paulo, BR'
+
+MESSAGES = {
+    'verification_code': lambda c: dict(name='Maria Silva', code='123456',
+                                        expiry_minutes=Config.VERIFICATION_CODE_EXPIRY_MINUTES),
+    'security_alert': lambda c: dict(name='Maria Silva', code='654321', ip_address='203.0.113.7',
+                                     location=LOCATION, timestamp=c.format_datetime(datetime.now()),
+                                     expiry_minutes=Config.SECURITY_CODE_EXPIRY_MINUTES),
+    'security_block': lambda c: dict(name='Maria Silva', reason=c.message('block_reason.brute_force'),
+                                     ip_address='203.0.113.7', location=LOCATION,
+                                     blocked_until=c.format_datetime(datetime.now())),
+}
+
+
+def legacy_message(record):
+    """Montagem anterior: árvore do pacote email serializada pelo gerador"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = record['subject']
+    msg['From'] = f"Cyber Security Platform <{Config.SMTP_FROM}>"
+    msg['To'] = record['to']
+    if record.get('text'):
+        msg.attach(MIMEText(record['text'], 'plain'))
+    msg.attach(MIMEText(record['html'], 'html'))
+    return msg.as_bytes()
+
+
+def per_message_us(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--locale', default=Config.MAIL_LOCALE, choices=email_templates.available_locales())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    LocaleCatalog(args.locale)
+    print(f'compilação dos templates ({args.locale}): {(time.perf_counter() - start) * 1000:.2f} ms')
+
+    catalog = get_catalog(args.locale)
+    print(f"\n{'mensagem':<18} {'render':>10} {'MIME':>10} {'MIME antes':>12} {'bytes':>8}")
+    for template, make_values in MESSAGES.items():
+        values = make_values(catalog)
+        subject, html_body, text_body = catalog.render(template, **values)
+        record = {
+            'id': f'{time.time_ns()}-bench', 'to': 'maria@example.com', 'subject': subject,
+            'html': html_body, 'text': text_body, 'enqueued_at': time.time()
+        }
+        render_us = per_message_us(lambda: catalog.render(template, **values), args.iterations)
+        mime_us = per_message_us(lambda: build_message(record), args.iterations)
+        legacy_us = per_message_us(lambda: legacy_message(record), max(1, args.iterations // 10))
+        print(f'{template:<18} {render_us:>8.1f}µs {mime_us:>8.1f}µs {legacy_us:>10.1f}µs '
+              f'{len(build_message(record)):>8}')
+
+
+if __name__ == '__main__':
+    main()
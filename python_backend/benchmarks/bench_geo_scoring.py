@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark da pontuação de localização no tamanho real do histórico.
+
+O histórico pontuado é o estado de localização: até LOCATION_STATE_SIZE
+logins bem-sucedidos e outros tantos falhos (40 linhas com o padrão), mais
+os ainda na fila da auditoria. Compara, para 5, 20 e 40 linhas:
+
+- o laço por linha com security.calculate_distance (referência)
+- geo_scoring.score_location (uma passada, termos do ponto atual fora do laço)
+- a versão vetorizada com NumPy, se instalado, incluindo a montagem dos
+  arrays (feita a cada login)
+
+conferindo que todos dão o mesmo resultado.
+
+Uso:
+    python benchmarks/bench_geo_scoring.py [--sizes 5 20 40] [--repeat 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ['GEO_SHARED_CACHE_PATH'] = ''
+
+from geo_scoring import (  # noqa: E402
+    score_location, EARTH_RADIUS_KM, IMPOSSIBLE_DISTANCE_KM, MIN_TIME_HOURS,
+    TRAVEL_WINDOW, PROXIMITY_DISTANCE_KM, PROXIMITY_WINDOW, MIN_VELOCITY_HOURS
+)
+from security import calculate_distance  # noqa: E402
+
+
+def score_location_loop(rows, current_location, now):
+    """Mesmo resultado de score_location, calculado linha a linha"""
+    travel = {'isImpossible': False}
+    max_velocity = None
+    nearest = None
+    for login_time, lat, lng, success in rows:
+        distance = calculate_distance(lat, lng, current_location['lat'], current_location['lng'])
+        hours = (now - login_time).total_seconds() / 3600
+        if login_time >= now - TRAVEL_WINDOW:
+            velocity = distance / max(hours, MIN_VELOCITY_HOURS)
+            max_velocity = velocity if max_velocity is None else max(max_velocity, velocity)
+            if not travel['isImpossible'] and distance > IMPOSSIBLE_DISTANCE_KM and hours < MIN_TIME_HOURS:
+                travel = {'isImpossible': True, 'distance': round(distance), 'timeDiff': round(hours, 2)}
+        if success and login_time >= now - PROXIMITY_WINDOW:
+            nearest = distance if nearest is None else min(nearest, distance)
+    proximity = {'isNearby': False}
+    if nearest is not None:
+        proximity = {'isNearby': nearest <= PROXIMITY_DISTANCE_KM, 'distance': round(nearest)}
+    return {
+        'impossibleTravel': travel,
+        'proximity': proximity,
+        'maxVelocity': None if max_velocity is None else round(max_velocity, 1)
+    }
+
+
+def score_location_numpy(rows, current_location, now):
+    """Mesmo resultado de score_location, com arrays NumPy montados a partir das linhas"""
+    import numpy as np
+    count = len(rows)
+    timestamps = np.fromiter((row[0].timestamp() for row in rows), dtype=np.float64, count=count)
+    lats = np.radians(np.fromiter((row[1] for row in rows), dtype=np.float64, count=count))
+    lngs = np.radians(np.fromiter((row[2] for row in rows), dtype=np.float64, count=count))
+    success = np.fromiter((row[3] for row in rows), dtype=np.bool_, count=count)
+
+    lat, lng = np.radians(current_location['lat']), np.radians(current_location['lng'])
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    distances = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    hours = (now.timestamp() - timestamps) / 3600
+
+    travel = {'isImpossible': False}
+    max_velocity = None
+    in_travel_window = timestamps >= (now - TRAVEL_WINDOW).timestamp()
+    if in_travel_window.any():
+        velocities = distances[in_travel_window] / np.maximum(hours[in_travel_window], MIN_VELOCITY_HOURS)
+        max_velocity = round(float(velocities.max()), 1)
+        impossible = np.flatnonzero(in_travel_window & (distances > IMPOSSIBLE_DISTANCE_KM) & (hours < MIN_TIME_HOURS))
+        if impossible.size:
+            index = impossible[0]
+            travel = {'isImpossible': True, 'distance': round(float(distances[index])),
+                      'timeDiff': round(float(hours[index]), 2)}
+    proximity = {'isNearby': False}
+    known = success & (timestamps >= (now - PROXIMITY_WINDOW).timestamp())
+    if known.any():
+        nearest = float(distances[known].min())
+        proximity = {'isNearby': nearest <= PROXIMITY_DISTANCE_KM, 'distance': round(nearest)}
+    return {'impossibleTravel': travel, 'proximity': proximity, 'maxVelocity': max_velocity}
+
+
+def make_history(size, now, rng):
+    """Logins espalhados pelos últimos 30 dias, em ordem decrescente"""
+    rows = []
+    for i in range(size):
+        login_time = now - timedelta(seconds=(i + 1) * (30 * 24 * 3600 // (size + 1)))
+        rows.append((login_time, rng.uniform(-35, 5), rng.uniform(-75, -35), rng.random() < 0.8))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 20, 40])
+    parser.add_argument('--repeat', type=int, default=2000, help='execuções por medição')
+    args = parser.parse_args()
+
+    try:
+        import numpy  # noqa: F401
+        variants = [('laço', score_location_loop), ('uma passada', score_location), ('NumPy', score_location_numpy)]
+    except ImportError:
+        print('NumPy não instalado: a versão vetorizada fica de fora\n')
+        variants = [('laço', score_location_loop), ('uma passada', score_location)]
+
+    rng = random.Random(42)
+    now = datetime(2025, 1, 1, 12, 0, 0)
+    current = {'lat': -23.55, 'lng': -46.63}
+
+    print(f"{'histórico':>10}" + ''.join(f'{name + " (µs)":>18}' for name, _ in variants))
+    for size in args.sizes:
+        rows = make_history(size, now, rng)
+        expected = score_location_loop(rows, current, now)
+        timings = []
+        for name, fn in variants:
+            actual = fn(rows, current, now)
+            if actual != expected:
+                print(f'Resultados diferentes para {size} linhas:\n  laço: {expected}\n  {name}: {actual}')
+                return 1
+            timings.append(timeit.timeit(lambda: fn(rows, current, now), number=args.repeat) / args.repeat * 1e6)
+        print(f'{size:>10}' + ''.join(f'{us:>18.1f}' for us in timings))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Cenários de carga de ponta a ponta contra a API de autenticação.
+
+Sobe a aplicação de produção (serve.py: gunicorn, por padrão 1 worker) com
+um banco temporário, geolocalização falsa e um servidor SMTP local que
+descarta as mensagens (benchmarks/fakes.py), e dispara cada cenário em
+malha aberta: as requisições saem na taxa alvo (--rps) independentemente
+das respostas, e a latência conta a partir do horário agendado (a fila do
+próprio gerador entra na medida, como entraria para um cliente real).
+
+Cenários (--scenarios nome[:rps] ...):
+
+- login_mix: logins de usuários cadastrados (a maioria do IP de casa,
+  alguns com senha errada ou de outra cidade) e GET /me com a sessão obtida
+- credential_stuffing: logins com senhas aleatórias em milhares de e-mails
+  (quase todos inexistentes) a partir de milhares de IPs
+- registration_burst: cadastros novos (bcrypt + email de verificação)
+- dashboard: sessões já abertas atualizando GET /me e GET /access-logs
+  (com If-None-Match, como o navegador)
+
+Por endpoint: vazão, percentis de latência, taxa de erro (5xx e falhas de
+conexão), distribuição de status e consultas SQL por requisição; e, por
+rota, os estágios com mais tempo no servidor. Consultas e estágios vêm da
+diferença do /metrics antes e depois do cenário (com mais de um worker,
+refletem só o worker que respondeu a coleta).
+
+O limite de requisições por IP é elevado (todo o tráfego sai de 127.0.0.1);
+os bloqueios por força bruta continuam ativos (429 no credential_stuffing).
+
+Uso:
+    python benchmarks/bench_load.py [--scenarios login_mix:20 dashboard:50 ...] [--rps 20]
+                                    [--duration 20] [--users 200] [--workers 1] [--threads N]
+                                    [--bcrypt-rounds N] [--output resultado.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import fakes  # noqa: E402
+
+PASSWORD = 'Senha-de-carga-123'
+
+# Executado no processo do servidor: provedor de geolocalização falso antes
+# de a aplicação ser criada (os workers herdam pelo fork)
+LAUNCHER = r'''
+import os, sys
+sys.path.insert(0, 'benchmarks')
+import fakes
+fakes.install_fake_geo()
+from config import Config
+Config.BCRYPT_LOG_ROUNDS = int(os.environ['BENCH_BCRYPT_ROUNDS'])
+import bcrypt, routes
+# Login de e-mail inexistente com o mesmo custo de um existente
+routes.DUMMY_BCRYPT_HASH = bcrypt.hashpw(b'dummy', bcrypt.gensalt(Config.BCRYPT_LOG_ROUNDS))
+import serve
+from hashing import hashing_service
+options = serve.build_options(os.environ['BENCH_BIND'], int(os.environ['BENCH_WORKERS']),
+                              int(os.environ['BENCH_THREADS']))
+hashing_service.workers = max(1, (os.cpu_count() or 1) // options['workers'])
+serve.AMFAServer(options).run()
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def random_ip(rng):
+    return f'{rng.randint(11, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+
+
+# Ambiente
+
+def prepare_database(users, rounds, rng):
+    """Cria o esquema e cadastra os usuários (todos com a mesma senha), cada um com um
+    acesso anterior bem-sucedido a partir do IP de casa, no banco do teste"""
+    from datetime import timedelta
+    import bcrypt
+    from app import create_app, init_db
+    from models import db, User, AccessLog, UserLocation, get_sp_now
+
+    app = create_app()
+    init_db(app)
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+    now = get_sp_now()
+    accounts = [
+        {'email': f'user{i}@bench.local', 'password': PASSWORD, 'ip': random_ip(rng)}
+        for i in range(users)
+    ]
+    last_login = now - timedelta(days=1)
+    homes = [(i, account['ip'], fakes.fake_location(account['ip'])) for i, account in enumerate(accounts)]
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [
+                {'id': f'bench-user-{i}', 'name': f'Usuário {i}', 'email': account['email'],
+                 'password': password_hash, 'role': 'user', 'is_email_confirmed': True,
+                 'email_verification_attempts': 0, 'created_at': now, 'updated_at': now}
+                for i, account in enumerate(accounts)
+            ])
+            conn.execute(AccessLog.__table__.insert(), [
+                {'id': f'bench-access-{i}', 'user_id': f'bench-user-{i}', 'action': 'login', 'success': True,
+                 'ip_address': ip, 'location': location, 'login_time': last_login, 'session_blocked': False}
+                for i, ip, location in homes
+            ])
+            conn.execute(UserLocation.__table__.insert(), [
+                {'id': f'bench-location-{i}', 'user_id': f'bench-user-{i}', 'access_log_id': f'bench-access-{i}',
+                 'ip_address': ip, 'lat': location['lat'], 'lng': location['lng'], 'success': True,
+                 'login_time': last_login}
+                for i, ip, location in homes
+            ])
+        db.engine.dispose()
+    return accounts
+
+
+def start_server(env, port):
+    process = subprocess.Popen(
+        [sys.executable, '-c', LAUNCHER], cwd=BACKEND_DIR, env=env, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/auth/me')
+            conn.getresponse().read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError('o servidor não respondeu')
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    process.wait(60)
+
+
+# Cliente HTTP
+
+class Client:
+    """Conexão keep-alive de uma thread do gerador"""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                return response.status, response.msg, data
+            except (OSError, http.client.HTTPException):
+                self.conn.close()
+                self.conn = None
+                # Conexão keep-alive fechada pelo servidor: tenta uma vez em uma nova
+                if attempt:
+                    raise
+
+
+def session_cookie(headers):
+    from config import Config
+
+    prefix = Config.SESSION_COOKIE_NAME + '='
+    for value in headers.get_all('Set-Cookie') or ():
+        if value.startswith(prefix):
+            return value.split(';', 1)[0]
+    return None
+
+
+class Request:
+    __slots__ = ('method', 'path', 'route', 'body', 'headers', 'account')
+
+    def __init__(self, method, path, route, body=None, headers=None, account=None):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.body = body
+        self.headers = headers or {}
+        self.account = account
+
+    @property
+    def endpoint(self):
+        return f"{self.method} {self.path.split('?', 1)[0]}"
+
+
+# Cenários
+
+class Scenario:
+    name = None
+
+    def __init__(self, accounts, rng):
+        self.accounts = accounts
+        self.rng = rng
+
+    def setup(self, client):
+        """Preparação fora da medição (ex.: abrir sessões)"""
+
+    def next_request(self):
+        raise NotImplementedError
+
+    def on_response(self, request, status, headers, data):
+        if request.account is not None and status == 200 and request.path.startswith('/api/auth/login'):
+            request.account['cookie'] = session_cookie(headers) or request.account.get('cookie')
+
+    def login(self, account, password=None, ip=None):
+        return Request('POST', '/api/auth/login', 'auth.login',
+                       body={'email': account['email'], 'password': password or account['password']},
+                       headers={'X-Forwarded-For': ip or account['ip']}, account=account)
+
+
+class LoginMix(Scenario):
+    name = 'login_mix'
+
+    def next_request(self):
+        account = self.rng.choice(self.accounts)
+        roll = self.rng.random()
+        if roll < 0.25 and account.get('cookie'):
+            return Request('GET', '/api/auth/me', 'auth.get_current_user',
+                           headers={'Cookie': account['cookie'], 'X-Forwarded-For': account['ip']})
+        if roll < 0.35:
+            return self.login(account, password='senha-errada')
+        if roll < 0.40:
+            # Viagem: outro IP (outra cidade) exige o código de segurança
+            return self.login(account, ip=random_ip(self.rng))
+        return self.login(account)
+
+
+class CredentialStuffing(Scenario):
+    name = 'credential_stuffing'
+
+    def __init__(self, accounts, rng):
+        super().__init__(accounts, rng)
+        real = [account['email'] for account in accounts[:max(1, len(accounts) // 20)]]
+        self.emails = real + [f'vazado{i}@example.com' for i in range(5000)]
+        self.ips = [random_ip(rng) for _ in range(2000)]
+
+    def next_request(self):
+        return Request('POST', '/api/auth/login', 'auth.login', body={
+            'email': self.rng.choice(self.emails), 'password': secrets.token_urlsafe(9)
+        }, headers={'X-Forwarded-For': self.rng.choice(self.ips)})
+
+
+class RegistrationBurst(Scenario):
+    name = 'registration_burst'
+
+    def __init__(self, accounts, rng):
+        super().__init__(accounts, rng)
+        self.run_id = secrets.token_hex(3)
+        self.count = 0
+
+    def next_request(self):
+        self.count += 1
+        return Request('POST', '/api/auth/register', 'auth.register', body={
+            'name': f'Novo {self.count}', 'email': f'novo{self.count}-{self.run_id}@bench.local',
+            'password': PASSWORD
+        }, headers={'X-Forwarded-For': random_ip(self.rng)})
+
+
+class Dashboard(Scenario):
+    name = 'dashboard'
+
+    def setup(self, client):
+        self.sessions = []
+        for account in self.accounts[:50]:
+            if not account.get('cookie'):
+                request = self.login(account)
+                status, headers, data = client.request(request.method, request.path, request.body, request.headers)
+                self.on_response(request, status, headers, data)
+            if account.get('cookie'):
+                self.sessions.append(account)
+        if not self.sessions:
+            raise RuntimeError('nenhuma sessão aberta para o dashboard')
+
+    def next_request(self):
+        account = self.rng.choice(self.sessions)
+        headers = {'Cookie': account['cookie'], 'X-Forwarded-For': account['ip']}
+        if self.rng.random() < 0.6:
+            return Request('GET', '/api/auth/me', 'auth.get_current_user', headers=headers, account=account)
+        if account.get('etag'):
+            headers['If-None-Match'] = account['etag']
+        return Request('GET', '/api/auth/access-logs?limit=20', 'auth.get_access_logs',
+                       headers=headers, account=account)
+
+    def on_response(self, request, status, headers, data):
+        super().on_response(request, status, headers, data)
+        if request.route == 'auth.get_access_logs' and status == 200:
+            request.account['etag'] = headers.get('ETag')
+
+
+SCENARIOS = {cls.name: cls for cls in (LoginMix, CredentialStuffing, RegistrationBurst, Dashboard)}
+
+
+# /metrics
+
+_SAMPLE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape(client, token):
+    """Contagens do /metrics: requisições e consultas por rota, tempo por (rota, estágio)"""
+    status, _, data = client.request('GET', '/metrics', headers={'Authorization': f'Bearer {token}'})
+    if status != 200:
+        raise RuntimeError(f'/metrics respondeu {status}')
+    requests, queries, stages = Counter(), Counter(), Counter()
+    for line in data.decode().splitlines():
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.group(1), dict(_LABEL.findall(match.group(2))), float(match.group(3))
+        if name == 'amfa_http_request_duration_seconds_count':
+            requests[labels['route']] += value
+        elif name == 'amfa_db_query_duration_seconds_count':
+            queries[labels['route']] += value
+        elif name == 'amfa_stage_duration_seconds_sum':
+            stages[(labels['route'], labels['stage'])] += value
+    return requests, queries, stages
+
+
+# Gerador de carga
+
+def run_scenario(scenario, rps, duration, concurrency, port):
+    jobs = queue.Queue()
+    samples = []  # (endpoint, rota, latência, status ou None)
+
+    def worker():
+        client = Client(port)
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            scheduled, request = job
+            try:
+                status, headers, data = client.request(request.method, request.path, request.body, request.headers)
+                scenario.on_response(request, status, headers, data)
+            except (OSError, http.client.HTTPException):
+                status = None
+            samples.append((request.endpoint, request.route, time.monotonic() - scheduled, status))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    total = int(rps * duration)
+    start = time.monotonic()
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        jobs.put((scheduled, scenario.next_request()))
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - start
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def report(name, rps, samples, elapsed, before, after, emails):
+    requests = after[0] - before[0]
+    queries = after[1] - before[1]
+    stages = after[2] - before[2]
+
+    by_endpoint = defaultdict(list)
+    for endpoint, route, latency, status in samples:
+        by_endpoint[(endpoint, route)].append((latency, status))
+
+    print(f'\n== {name}: alvo {rps:g} req/s, obtido {len(samples) / elapsed:.1f} req/s '
+          f'em {elapsed:.1f}s, {emails} email(s) entregues ao SMTP')
+    print(f"{'endpoint':<30} {'req':>6} {'req/s':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} "
+          f"{'erros':>6} {'SQL/req':>8}  status")
+    endpoints = {}
+    for (endpoint, route), values in sorted(by_endpoint.items()):
+        latencies = sorted(latency for latency, _ in values)
+        statuses = Counter('erro' if status is None else status for _, status in values)
+        errors = sum(count for status, count in statuses.items() if status == 'erro' or status >= 500)
+        served = requests.get(route, 0)
+        per_request = queries.get(route, 0) / served if served else None
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'throughput': len(values) / elapsed,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p90_ms': percentile(latencies, 0.9) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+            'error_rate': errors / len(values),
+            'queries_per_request': per_request,
+            'status': {str(status): count for status, count in statuses.items()},
+        }
+        row = endpoints[endpoint]
+        print(f"{endpoint:<30} {row['requests']:>6} {row['throughput']:>7.1f} {row['p50_ms']:>6.1f}ms "
+              f"{row['p90_ms']:>6.1f}ms {row['p99_ms']:>6.1f}ms {row['max_ms']:>6.1f}ms {row['error_rate']:>6.1%} "
+              f"{per_request if per_request is not None else float('nan'):>8.1f}  "
+              + ' '.join(f'{status}:{count}' for status, count in sorted(statuses.items(), key=str)))
+
+    # Onde o servidor gastou o tempo, por rota (média por requisição)
+    by_route = defaultdict(list)
+    for (route, stage), seconds in stages.items():
+        if seconds > 0:
+            by_route[route].append((seconds, stage))
+    for route, entries in sorted(by_route.items()):
+        if route == 'metrics':
+            continue
+        served = requests.get(route, 0)
+        if not served:
+            continue
+        top = ', '.join(f'{stage} {seconds / served * 1000:.1f}ms' for seconds, stage in sorted(entries, reverse=True)[:4])
+        print(f'  {route}: {top}')
+    background = queries.get('-', 0)
+    if background:
+        print(f'  consultas em segundo plano (auditoria, sincronização): {background:.0f}')
+    return {'target_rps': rps, 'achieved_rps': len(samples) / elapsed, 'emails': emails, 'endpoints': endpoints}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), help='nome[:rps] dos cenários, em ordem')
+    parser.add_argument('--rps', type=float, default=20, help='taxa alvo dos cenários sem :rps')
+    parser.add_argument('--duration', type=float, default=20, help='segundos por cenário')
+    parser.add_argument('--users', type=int, default=200, help='usuários cadastrados antes da carga')
+    parser.add_argument('--concurrency', type=int, default=64, help='requisições simultâneas no máximo')
+    parser.add_argument('--workers', type=int, default=1, help='workers do gunicorn')
+    parser.add_argument('--threads', type=int, help='threads por worker (padrão: SERVER_THREADS)')
+    parser.add_argument('--bcrypt-rounds', type=int, help='custo do bcrypt no servidor (padrão: BCRYPT_LOG_ROUNDS)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='grava os resultados em JSON')
+    args = parser.parse_args()
+
+    plan = []
+    for item in args.scenarios:
+        name, _, rps = item.partition(':')
+        if name not in SCENARIOS:
+            parser.error(f'cenário desconhecido: {name} (opções: {", ".join(SCENARIOS)})')
+        plan.append((name, float(rps) if rps else args.rps))
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='amfa-bench-load-')
+    port = free_port()
+    token = secrets.token_hex(16)
+    sink = fakes.SmtpSink().start()
+    # Antes de importar a configuração: o processo do teste também usa o banco temporário
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        RATELIMIT_STORAGE_URI=f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}",
+        RATELIMIT_DEFAULT='100000000 per hour',
+        SESSION_SQLITE_PATH=os.path.join(workdir, 'sessions.db'),
+        MAIL_SPOOL_DIR=os.path.join(workdir, 'mail_spool'),
+        GEO_SHARED_CACHE_PATH='',
+        METRICS_ENABLED='true',
+        METRICS_TOKEN=token,
+        AUTH_MODE='session',
+        **sink.environment()
+    )
+    from config import Config
+
+    rounds = args.bcrypt_rounds or Config.BCRYPT_LOG_ROUNDS
+    env = dict(
+        os.environ,
+        BENCH_BIND=f'127.0.0.1:{port}',
+        BENCH_WORKERS=str(args.workers),
+        BENCH_THREADS=str(args.threads or Config.SERVER_THREADS),
+        BENCH_BCRYPT_ROUNDS=str(rounds)
+    )
+
+    print(f'Cadastrando {args.users} usuários (bcrypt custo {rounds})...')
+    accounts = prepare_database(args.users, rounds, rng)
+    process = start_server(env, port)
+    print(f"Servidor em 127.0.0.1:{port} ({args.workers} worker(s) x {env['BENCH_THREADS']} threads), "
+          f'{os.cpu_count()} núcleo(s)')
+
+    results = {}
+    try:
+        control = Client(port)
+        for name, rps in plan:
+            scenario = SCENARIOS[name](accounts, rng)
+            scenario.setup(control)
+            before = scrape(control, token)
+            emails_before = sink.messages
+            samples, elapsed = run_scenario(scenario, rps, args.duration, args.concurrency, port)
+            # Dá tempo para a fila de email entregar o que foi enfileirado
+            time.sleep(1)
+            after = scrape(control, token)
+            results[name] = report(name, rps, samples, elapsed, before, after, sink.messages - emails_before)
+    finally:
+        stop_server(process)
+        sink.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'workers': args.workers, 'bcrypt_rounds': rounds, 'scenarios': results}, f, indent=2)
+        print(f'\nResultados gravados em {args.output}')
+
+
+if __name__ == '__main__':
+    main()
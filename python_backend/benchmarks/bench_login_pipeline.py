@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark do pipeline de login: sequencial x concorrente.
+
+Roda o endpoint /api/auth/login real (SQLite temporário, bcrypt com o custo
+configurado) com latências simuladas para a API de geolocalização e para
+cada ida ao banco (como um Postgres remoto). O modo sequencial usa
+LOGIN_PIPELINE_WORKERS = 0, que executa cada estágio na própria thread.
+
+Uso:
+    python benchmarks/bench_login_pipeline.py [--requests 50] [--geo-ms 150] [--db-ms 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Ambiente isolado: banco temporário, sem email e sem rede
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix='amfa-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+os.environ['SMTP_USER'] = ''
+os.environ['GEOIP_PROVIDERS'] = 'http'
+os.environ['GEO_SHARED_CACHE_PATH'] = ''
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50, help='logins por modo')
+    parser.add_argument('--geo-ms', type=float, default=150, help='latência simulada da geolocalização')
+    parser.add_argument('--db-ms', type=float, default=3, help='latência simulada por comando SQL')
+    args = parser.parse_args()
+
+    import bcrypt
+    from sqlalchemy import event
+    from app import create_app, init_db
+    from config import Config
+    from models import db, User, AccessLog
+    import security
+
+    SAO_PAULO = {'city': 'São Paulo', 'region': 'São Paulo', 'country': 'Brazil', 'lat': -23.55, 'lng': -46.63}
+
+    def fake_geo(ip_address):
+        time.sleep(args.geo_ms / 1000)
+        return dict(SAO_PAULO)
+
+    security.LOCATION_PROVIDERS['http'] = fake_geo
+
+    app = create_app()
+    init_db(app)
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def simulate_round_trip(*_):
+            time.sleep(args.db_ms / 1000)
+
+        password = 'benchmark-password'
+        user = User(
+            name='Bench',
+            email='bench@example.com',
+            password=bcrypt.hashpw(password.encode(), bcrypt.gensalt(Config.BCRYPT_LOG_ROUNDS)).decode(),
+            is_email_confirmed=True
+        )
+        db.session.add(user)
+        db.session.commit()
+        # Login anterior na mesma cidade: o fluxo passa pela proximidade e termina em sucesso
+        db.session.add(AccessLog(user_id=user.id, action='login', success=True,
+                                 ip_address='200.255.255.255', location=SAO_PAULO))
+        db.session.commit()
+
+    client = app.test_client()
+    results = {}
+    request_number = 0
+    for mode, workers in (('sequencial', 0), ('pipeline', 16)):
+        Config.LOGIN_PIPELINE_WORKERS = workers
+        latencies = []
+        for _ in range(args.requests):
+            request_number += 1
+            # IP novo a cada login: cache frio de geolocalização e sem limite por IP
+            ip = f'200.{request_number // 65536 % 256}.{request_number // 256 % 256}.{request_number % 256}'
+            security.location_cache.clear()
+            start = time.perf_counter()
+            response = client.post(
+                '/api/auth/login',
+                json={'email': 'bench@example.com', 'password': password},
+                headers={'X-Forwarded-For': ip},
+                environ_base={'REMOTE_ADDR': ip}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200 or 'user' not in response.json:
+                print(f'Resposta inesperada ({mode}): {response.status_code} {response.json}')
+                return 1
+        results[mode] = latencies
+
+    print(f'{args.requests} logins por modo, geo={args.geo_ms}ms, db={args.db_ms}ms/comando, '
+          f'bcrypt custo {Config.BCRYPT_LOG_ROUNDS}')
+    print(f"{'modo':<12}{'p50 (ms)':>12}{'p99 (ms)':>12}{'média (ms)':>12}")
+    for mode, latencies in results.items():
+        print(f'{mode:<12}{percentile(latencies, 0.50):>12.1f}{percentile(latencies, 0.99):>12.1f}'
+              f'{statistics.mean(latencies):>12.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark do armazenamento do limitador de requisições com vários workers.
+
+Para cada URI, N processos disputam o mesmo limite (ex.: 200 por hora) como
+os workers do gunicorn. Confere que o total aceito respeita o limite (com
+memory:// cada processo aceita o limite inteiro) e mede o tempo de cada
+verificação (o custo que o limitador soma à requisição).
+
+Uso:
+    python benchmarks/bench_rate_limiter.py [--uris memory:// sqlite:////tmp/bench-rl.db redis://localhost:6379]
+                                            [--workers 4] [--checks 2000] [--limit 200] [--strategy moving-window]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from limits import parse  # noqa: E402
+from limits.storage import storage_from_string  # noqa: E402
+from limits.strategies import STRATEGIES  # noqa: E402
+import limiter_storage  # noqa: E402,F401  (registra o esquema sqlite://)
+
+
+def worker(uri, strategy, limit, checks, start_event, results):
+    storage = storage_from_string(uri)
+    limiter = STRATEGIES[strategy](storage)
+    item = parse(f'{limit} per hour')
+    timings = []
+    accepted = 0
+    start_event.wait()
+    for _ in range(checks):
+        start = time.perf_counter()
+        accepted += limiter.hit(item, 'bench', '127.0.0.1')
+        timings.append(time.perf_counter() - start)
+    results.put((accepted, timings))
+
+
+def run(uri, strategy, workers, limit, checks):
+    storage_from_string(uri).reset()
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(uri, strategy, limit, checks, start_event, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    start_event.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    accepted = sum(outcome[0] for outcome in outcomes)
+    timings = sorted(t for outcome in outcomes for t in outcome[1])
+    print(
+        f'{uri:<45} aceitas={accepted:>5} (limite {limit}) '
+        f'p50={statistics.median(timings) * 1e6:>7.1f}µs '
+        f'p99={timings[int(len(timings) * 0.99) - 1] * 1e6:>7.1f}µs '
+        f'máx={timings[-1] * 1e6:>8.1f}µs'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uris', nargs='+', default=[
+        'memory://', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'amfa-bench-ratelimit.db')
+    ])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--checks', type=int, default=2000, help='verificações por worker')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--strategy', default='moving-window', choices=['moving-window', 'fixed-window'])
+    args = parser.parse_args()
+
+    print(f'{args.workers} workers x {args.checks} verificações, estratégia {args.strategy}')
+    for uri in args.uris:
+        run(uri, args.strategy, args.workers, args.limit, args.checks)
+
+
+if __name__ == '__main__':
+    main()
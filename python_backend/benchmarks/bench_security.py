@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Benchmark das primitivas de segurança, com resultados em JSON comparados a
+uma linha de base.
+
+Funções medidas:
+
+- calculate_distance, is_private_ip, extract_device_info,
+  hash_verification_code (CPU, sem banco)
+- get_location_from_ip com o provedor falso de benchmarks/fakes.py (cache
+  do processo vazio e cheio)
+- check_brute_force com BRUTE_FORCE_BACKEND 'db' (COUNT em login_attempts)
+  e 'memory' (janelas em memória); os limites de tentativas são elevados
+  para que a medição fique no caminho de leitura, sem criar bloqueios
+- check_impossible_travel e check_location_proximity (user_locations),
+  com o cache de estado de localização vazio ("frio") e cheio
+
+O banco (SQLite temporário por padrão, ou --database-url, ex.: Postgres
+local) recebe dados gerados com semente fixa: --rows linhas em
+login_attempts e em access_logs (10 mil a 10 milhões), --users usuários e o
+estado de localização de cada um. Um banco já populado com os mesmos
+números é reaproveitado; um banco com outros dados não é alterado.
+
+Não há rede: a geolocalização usa o provedor falso e o email fica
+desativado (SMTP_USER vazio).
+
+Os resultados vão para benchmarks/results/ e são comparados com a linha de
+base de benchmarks/baselines/ do mesmo banco e tamanho, se existir; com
+--save-baseline o resultado passa a ser a linha de base. Casos mais lentos
+que a base além de --threshold são listados e o script termina com código 1.
+
+Uso:
+    python benchmarks/bench_security.py [--rows 10000] [--users 1000] [--database-url URL]
+                                        [--iterations 2000] [--threshold 0.2] [--save-baseline]
+"""
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(BACKEND_DIR, 'benchmarks')
+sys.path.insert(0, BACKEND_DIR)
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+BASELINES_DIR = os.path.join(BENCH_DIR, 'baselines')
+
+# Linhas por INSERT em lote na geração dos dados
+SEED_BATCH = 20000
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36 Edg/124.0',
+    'python-requests/2.31.0',
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='linhas em login_attempts e em access_logs')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--database-url', help='banco a usar (padrão: SQLite temporário)')
+    parser.add_argument('--iterations', type=int, default=2000, help='chamadas medidas por caso')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cases', nargs='+', help='só os casos com estes nomes')
+    parser.add_argument('--output', help='arquivo JSON de resultado (padrão: benchmarks/results/...)')
+    parser.add_argument('--baseline', help='linha de base (padrão: benchmarks/baselines/security-<banco>-<linhas>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='grava o resultado como linha de base')
+    parser.add_argument('--threshold', type=float, default=0.2, help='aumento relativo da mediana tratado como regressão')
+    return parser.parse_args()
+
+
+args = parse_args()
+
+# Ambiente isolado, definido antes de importar a aplicação
+if not args.database_url:
+    args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='amfa-bench-security-'), 'bench.db')}"
+os.environ['DATABASE_URL'] = args.database_url
+os.environ['SMTP_USER'] = ''
+os.environ['GEO_SHARED_CACHE_PATH'] = ''
+os.environ['METRICS_ENABLED'] = 'false'
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ.setdefault('SESSION_BACKEND', 'sqlalchemy')
+os.environ['BRUTE_FORCE_BACKEND'] = 'memory'  # O caso 'db' troca o backend só durante a chamada
+
+from sqlalchemy import func, select  # noqa: E402
+from app import create_app, init_db  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, get_sp_now, User, AccessLog, LoginAttempt, SecurityBlock, UserLocation  # noqa: E402
+from email_service import hash_verification_code  # noqa: E402
+from location_state import location_state_cache  # noqa: E402
+import security  # noqa: E402
+from security import (  # noqa: E402
+    calculate_distance, is_private_ip, extract_device_info, get_location_from_ip,
+    check_brute_force, check_impossible_travel, check_location_proximity
+)
+from brute_force import brute_force_guard  # noqa: E402
+import fakes  # noqa: E402
+
+
+# Dados
+
+def seed(rows, users, rng):
+    """Gera usuários, tentativas de login, acessos e o estado de localização"""
+    now = get_sp_now()
+    user_ids = [f'bench-user-{i}' for i in range(users)]
+    emails = [f'user{i}@bench.local' for i in range(users)]
+    # Endereços de quem ataca (e-mails que não existem e IPs de fora)
+    attacker_emails = [f'guess{i}@bench.local' for i in range(max(10, users // 10))]
+    ips = [f'{rng.randint(11, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+           for _ in range(users * 2)]
+    home_ips = {user_id: ips[i] for i, user_id in enumerate(user_ids)}
+
+    def moment(max_days):
+        # 1% das linhas dentro da janela de força bruta, o resto espalhado na retenção
+        if rng.random() < 0.01:
+            return now - timedelta(seconds=rng.uniform(0, Config.BRUTE_FORCE_WINDOW_MINUTES * 60))
+        return now - timedelta(seconds=rng.uniform(0, max_days * 86400))
+
+    with db.engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'id': user_id, 'name': f'Usuário {i}', 'email': emails[i], 'password': 'bench',
+             'role': 'user', 'is_email_confirmed': True, 'email_verification_attempts': 0,
+             'created_at': now, 'updated_at': now}
+            for i, user_id in enumerate(user_ids)
+        ])
+
+    start = time.perf_counter()
+    for offset in range(0, rows, SEED_BATCH):
+        batch = []
+        for i in range(offset, min(rows, offset + SEED_BATCH)):
+            known = rng.random() < 0.8
+            index = rng.randrange(users)
+            batch.append({
+                'id': f'bench-attempt-{i}',
+                'email': emails[index] if known else rng.choice(attacker_emails),
+                'ip_address': home_ips[user_ids[index]] if known and rng.random() < 0.7 else rng.choice(ips),
+                'success': known and rng.random() < 0.85,
+                'attempted_at': moment(Config.LOGIN_ATTEMPT_RETENTION_DAYS),
+            })
+        with db.engine.begin() as conn:
+            conn.execute(LoginAttempt.__table__.insert(), batch)
+        print(f'\r  login_attempts {min(rows, offset + SEED_BATCH)}/{rows}', end='', flush=True)
+    print()
+
+    # Os LOCATION_STATE_SIZE acessos bem-sucedidos e os LOCATION_STATE_SIZE falhos mais
+    # recentes de cada usuário
+    recent = {(user_id, success): [] for user_id in user_ids for success in (True, False)}
+    for offset in range(0, rows, SEED_BATCH):
+        batch = []
+        for i in range(offset, min(rows, offset + SEED_BATCH)):
+            user_id = user_ids[rng.randrange(users)]
+            # A maioria dos acessos sai do IP (e da cidade) de casa
+            ip_address = home_ips[user_id] if rng.random() < 0.8 else rng.choice(ips)
+            location = fakes.fake_location(ip_address)
+            row = {
+                'id': f'bench-access-{i}',
+                'user_id': user_id,
+                'action': 'login',
+                'success': rng.random() < 0.9,
+                'ip_address': ip_address,
+                'user_agent': rng.choice(USER_AGENTS),
+                'location': location,
+                'device_info': None,
+                'login_time': moment(min(Config.ACCESS_LOG_RETENTION_DAYS, 90)),
+                'session_blocked': False,
+            }
+            batch.append(row)
+            entry = (row['login_time'], row['id'], row)
+            group = recent[(user_id, row['success'])]
+            if len(group) < Config.LOCATION_STATE_SIZE:
+                heapq.heappush(group, entry)
+            elif entry > group[0]:
+                heapq.heapreplace(group, entry)
+        with db.engine.begin() as conn:
+            conn.execute(AccessLog.__table__.insert(), batch)
+        print(f'\r  access_logs {min(rows, offset + SEED_BATCH)}/{rows}', end='', flush=True)
+    print()
+
+    with db.engine.begin() as conn:
+        conn.execute(UserLocation.__table__.insert(), [
+            {'id': f'bench-location-{row["id"]}', 'user_id': row['user_id'], 'access_log_id': row['id'],
+             'ip_address': row['ip_address'], 'lat': row['location']['lat'], 'lng': row['location']['lng'],
+             'success': row['success'], 'login_time': row['login_time']}
+            for entries in recent.values() for _, _, row in entries
+        ])
+        # Bloqueios antigos (já expirados), como os que a tabela acumula
+        conn.execute(SecurityBlock.__table__.insert(), [
+            {'id': f'bench-block-{i}', 'email': rng.choice(emails + attacker_emails), 'ip_address': rng.choice(ips),
+             'block_reason': 'brute_force', 'blocked_at': now - timedelta(days=30),
+             'blocked_until': now - timedelta(days=rng.uniform(1, 30)), 'is_active': True,
+             'created_at': now - timedelta(days=30)}
+            for i in range(max(1, rows // 1000))
+        ])
+    print(f'  dados gerados em {time.perf_counter() - start:.1f}s')
+
+
+def prepare_data(rows, users, rng):
+    """Reaproveita o banco se ele já tem exatamente os dados gerados; popula se estiver vazio"""
+    with db.engine.connect() as conn:
+        counts = {
+            'users': conn.execute(select(func.count()).select_from(User.__table__)).scalar(),
+            'login_attempts': conn.execute(select(func.count()).select_from(LoginAttempt.__table__)).scalar(),
+            'access_logs': conn.execute(select(func.count()).select_from(AccessLog.__table__)).scalar(),
+        }
+    if counts == {'users': users, 'login_attempts': rows, 'access_logs': rows}:
+        print('Banco já populado com estes tamanhos: dados reaproveitados')
+        return
+    if any(counts.values()):
+        sys.exit(f'O banco já tem outros dados ({counts}); use um banco vazio ou os mesmos --rows/--users')
+    print(f'Gerando {rows} linhas em login_attempts e access_logs para {users} usuários...')
+    seed(rows, users, rng)
+
+
+def load_inputs(rng, count):
+    """Entradas das verificações sorteadas entre os dados do banco"""
+    attempts = db.session.execute(
+        select(LoginAttempt.email, LoginAttempt.ip_address).order_by(LoginAttempt.id).limit(5000)
+    ).all()
+    user_ids = db.session.execute(select(User.id).order_by(User.id)).scalars().all()
+    db.session.commit()
+    return {
+        'attempts': [tuple(rng.choice(attempts)) for _ in range(count)],
+        'user_ids': [rng.choice(user_ids) for _ in range(count)],
+        'locations': [fakes.location_for(rng.randrange(len(fakes.CITIES))) for _ in range(count)],
+    }
+
+
+# Casos: cada um devolve fn(i), chamada uma vez por iteração; `batch` chamadas
+# são medidas juntas nas funções rápidas (o custo do relógio some da média)
+
+CASES = {}
+
+
+def case(name, batch=1):
+    def decorator(builder):
+        CASES[name] = (builder, batch)
+        return builder
+    return decorator
+
+
+@case('calculate_distance', batch=100)
+def _(inputs):
+    points = [(loc['lat'], loc['lng']) for loc in inputs['locations']]
+    return lambda i: calculate_distance(*points[i % len(points)], *points[(i + 1) % len(points)])
+
+
+@case('is_private_ip', batch=100)
+def _(inputs):
+    ips = [ip for _, ip in inputs['attempts']][:500] + ['10.0.0.1', '192.168.1.20', '172.16.5.4', '127.0.0.1', '::1']
+    return lambda i: is_private_ip(ips[i % len(ips)])
+
+
+@case('extract_device_info', batch=100)
+def _(inputs):
+    return lambda i: extract_device_info(USER_AGENTS[i % len(USER_AGENTS)])
+
+
+@case('hash_verification_code', batch=100)
+def _(inputs):
+    codes = [str(i).zfill(6) for i in range(1000)]
+    return lambda i: hash_verification_code(codes[i % len(codes)])
+
+
+@case('get_location_from_ip[frio]')
+def _(inputs):
+    ips = [ip for _, ip in inputs['attempts']]
+
+    def run(i):
+        security.location_cache.clear()
+        get_location_from_ip(ips[i % len(ips)])
+    return run
+
+
+@case('get_location_from_ip[cache]', batch=100)
+def _(inputs):
+    ips = [ip for _, ip in inputs['attempts']][:100]
+    return lambda i: get_location_from_ip(ips[i % len(ips)])
+
+
+@case('check_brute_force[db]')
+def _(inputs):
+    attempts = inputs['attempts']
+
+    def run(i):
+        Config.BRUTE_FORCE_BACKEND = 'db'
+        try:
+            check_brute_force(*attempts[i % len(attempts)], db)
+        finally:
+            Config.BRUTE_FORCE_BACKEND = 'memory'
+    return run
+
+
+@case('check_brute_force[memory]')
+def _(inputs):
+    attempts = inputs['attempts']
+    brute_force_guard.start()
+    return lambda i: check_brute_force(*attempts[i % len(attempts)], db)
+
+
+def _location_case(check, cold):
+    def builder(inputs):
+        user_ids, locations = inputs['user_ids'], inputs['locations']
+        if not cold:
+            # Poucos usuários: todos ficam no cache já no aquecimento
+            user_ids = user_ids[:25]
+
+        def run(i):
+            if cold:
+                location_state_cache.clear()
+            check(user_ids[i % len(user_ids)], locations[i % len(locations)], db)
+        return run
+    return builder
+
+
+case('check_impossible_travel[frio]')(_location_case(check_impossible_travel, cold=True))
+case('check_impossible_travel[cache]')(_location_case(check_impossible_travel, cold=False))
+case('check_location_proximity[frio]')(_location_case(check_location_proximity, cold=True))
+case('check_location_proximity[cache]')(_location_case(check_location_proximity, cold=False))
+
+
+def measure(fn, iterations, batch):
+    """Tempo por chamada (s) de cada iteração medida"""
+    for i in range(min(iterations, 50) * batch):
+        fn(i)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        for j in range(i * batch, (i + 1) * batch):
+            fn(j)
+        samples.append((time.perf_counter() - start) / batch)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'iterations': len(ordered),
+        'median_us': round(statistics.median(ordered) * 1e6, 3),
+        'p95_us': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6, 3),
+        'mean_us': round(statistics.fmean(ordered) * 1e6, 3),
+        'min_us': round(ordered[0] * 1e6, 3),
+    }
+
+
+# Linha de base
+
+def compare(results, baseline, threshold):
+    """Imprime a comparação com a base; retorna os casos que pioraram além do limite"""
+    regressions = []
+    print(f"\n{'caso':<34} {'base':>10} {'atual':>10} {'variação':>9}")
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<34} {'-':>10} {result['median_us']:>8.2f}µs {'novo':>9}")
+            continue
+        change = result['median_us'] / base['median_us'] - 1 if base['median_us'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  <- regressão'
+        print(f"{name:<34} {base['median_us']:>8.2f}µs {result['median_us']:>8.2f}µs {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    rng = random.Random(args.seed)
+    app = create_app()
+    init_db(app)
+
+    # Sem bloqueios novos durante a medição: só o caminho de leitura
+    Config.MAX_LOGIN_ATTEMPTS_PER_EMAIL = Config.MAX_LOGIN_ATTEMPTS_PER_IP = 10 ** 9
+    fakes.install_fake_geo()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        prepare_data(args.rows, args.users, rng)
+        inputs = load_inputs(rng, 5000)
+
+        results = {
+            'meta': {
+                'dialect': dialect,
+                'rows': args.rows,
+                'users': args.users,
+                'seed': args.seed,
+                'iterations': args.iterations,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'timestamp': get_sp_now().isoformat(timespec='seconds'),
+            },
+            'results': {}
+        }
+
+        print(f"\n{'caso':<34} {'mediana':>10} {'p95':>10} {'média':>10}")
+        for name, (builder, batch) in CASES.items():
+            if args.cases and name not in args.cases:
+                continue
+            fn = builder(inputs)
+            # As verificações imprimem o resultado de cada chamada; o texto não vai para o terminal
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples = measure(fn, args.iterations, batch)
+            summary = summarize(samples)
+            results['results'][name] = summary
+            print(f"{name:<34} {summary['median_us']:>8.2f}µs {summary['p95_us']:>8.2f}µs {summary['mean_us']:>8.2f}µs")
+            db.session.rollback()
+
+    label = f'security-{dialect}-{args.rows}'
+    output = args.output or os.path.join(RESULTS_DIR, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f'\nResultado gravado em {output}')
+
+    baseline_path = args.baseline or os.path.join(BASELINES_DIR, f'{label}.json')
+    regressions = []
+    if os.path.isfile(baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        differs = {key: (baseline['meta'].get(key), results['meta'][key])
+                   for key in ('dialect', 'rows', 'users', 'seed', 'machine', 'cpus')
+                   if baseline['meta'].get(key) != results['meta'][key]}
+        if differs:
+            print(f'Atenção: ambiente diferente da linha de base {differs}')
+        regressions = compare(results, baseline, args.threshold)
+    elif not args.save_baseline:
+        print(f'Sem linha de base em {baseline_path} (crie com --save-baseline)')
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f'Linha de base gravada em {baseline_path}')
+        return
+
+    if regressions:
+        print(f"\n{len(regressions)} caso(s) mais lento(s) que a base além de {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark do servidor: desenvolvimento (run.py) x produção (serve.py).
+
+Sobe cada modo como um processo separado (SQLite temporário, limite de
+requisições alto para não virar 429) e dispara requisições com N clientes
+simultâneos usando conexões persistentes (keep-alive), medindo vazão e
+latência:
+
+- dev: app.run(debug=True), como run.py (um processo, Werkzeug)
+- prod: python serve.py (gunicorn com preload, workers gthread)
+
+As rotas usadas são GET /api/auth/me sem sessão (cookie, limitador, JSON) e
+GET / (index.html do frontend).
+
+Uso:
+    python benchmarks/bench_server.py [--clients 16] [--seconds 10] [--workers N] [--threads N]
+"""
+import argparse
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ['/api/auth/me', '/']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, args):
+    workdir = tempfile.mkdtemp(prefix=f'amfa-bench-{mode}-')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        RATELIMIT_STORAGE_URI=f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}",
+        SESSION_SQLITE_PATH=os.path.join(workdir, 'sessions.db'),
+        RATELIMIT_DEFAULT='100000000 per hour',
+        GEO_SHARED_CACHE_PATH='',
+        SMTP_USER=''
+    )
+    if mode == 'dev':
+        command = [sys.executable, '-c', (
+            'from app import create_app, init_db; app = create_app(); init_db(app); '
+            f"app.run(host='127.0.0.1', port={port}, debug=True)"
+        )]
+    else:
+        command = [sys.executable, 'serve.py', '--init-db', '--bind', f'127.0.0.1:{port}']
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        if args.threads:
+            command += ['--threads', str(args.threads)]
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=env, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/auth/me')
+            conn.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'servidor {mode} não respondeu')
+
+
+def stop_server(process):
+    # O modo dev cria um processo filho (recarga automática): encerra o grupo
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait(30)
+
+
+def client(port, seconds, latencies, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    deadline = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < deadline:
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500 or response.status == 429:
+                errors.append(response.status)
+            if response.getheader('Connection', '').lower() == 'close':
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            errors.append('conexão')
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run(mode, args):
+    port = free_port()
+    process = start_server(mode, port, args)
+    try:
+        latencies, errors = [], []
+        threads = [
+            threading.Thread(target=client, args=(port, args.seconds, latencies, errors))
+            for _ in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop_server(process)
+
+    print(
+        f'{mode:<5} {len(latencies) / args.seconds:>8.0f} req/s   '
+        f'p50={percentile(latencies, 0.5) * 1000:>7.2f}ms  '
+        f'p99={percentile(latencies, 0.99) * 1000:>7.2f}ms  erros={len(errors)}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='clientes simultâneos')
+    parser.add_argument('--seconds', type=float, default=10, help='duração por modo')
+    parser.add_argument('--workers', type=int, help='workers do modo prod (padrão: SERVER_WORKERS)')
+    parser.add_argument('--threads', type=int, help='threads por worker do modo prod (padrão: SERVER_THREADS)')
+    parser.add_argument('--modes', nargs='+', default=['dev', 'prod'], choices=['dev', 'prod'])
+    args = parser.parse_args()
+
+    print(f'{args.clients} clientes, {args.seconds:g}s por modo, {os.cpu_count()} núcleos')
+    for mode in args.modes:
+        run(mode, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark da inicialização: da importação de app.py até a primeira resposta.
+
+Cada rodada é um processo Python novo (sem módulos em cache) com um SQLite
+temporário já migrado. Mede:
+
+- import: `import app`
+- create_app: montagem da aplicação
+- 1ª requisição: GET /api/auth/me (sessão, limitador, JSON)
+- conexões: conexões abertas com o banco até a primeira resposta (o
+  create_app não deve abrir nenhuma)
+- init-db: o que a importação de app.py fazia antes a cada início (migrações
+  e verificação do esquema), agora só no comando `flask --app app init-db`
+
+Uso:
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado em um processo novo por rodada
+PROBE = r'''
+import json, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connections = []
+event.listen(Pool, 'connect', lambda *_: connections.append(1))
+
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/auth/me')
+first = time.perf_counter()
+first_connections = len(connections)
+app_module.init_db(app)
+migrated = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': first - created,
+    'total': first - start,
+    'connections': first_connections,
+    'status': response.status_code,
+    'init_db': migrated - first
+}))
+'''
+
+
+def run_probe(env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='amfa-bench-startup-')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        RATELIMIT_STORAGE_URI=f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}",
+        GEO_SHARED_CACHE_PATH='',
+        SMTP_USER=''
+    )
+    run_probe(env)  # Cria o esquema e aquece o cache de disco
+
+    results = [run_probe(env) for _ in range(args.runs)]
+    print(f'{args.runs} processos novos (mediana):')
+    for key, label in [('import', 'import app'), ('create_app', 'create_app()'),
+                       ('first_request', '1ª requisição'), ('total', 'total até a 1ª resposta'),
+                       ('init_db', 'init-db (fora do início)')]:
+        print(f'  {label:<26} {statistics.median(r[key] for r in results) * 1000:>8.1f} ms')
+    print(f"  conexões até a 1ª resposta {max(r['connections'] for r in results)}")
+
+
+if __name__ == '__main__':
+    main()
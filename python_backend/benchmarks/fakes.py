@@ -0,0 +1,115 @@
+"""
+Substitutos sem rede usados pelos benchmarks.
+
+- fake_location: provedor de geolocalização determinístico (o mesmo IP
+  sempre cai na mesma cidade), registrado em security.LOCATION_PROVIDERS
+  por install_fake_geo() no lugar de ipapi.co e da base GeoIP
+- SmtpSink: servidor SMTP local que aceita qualquer login e descarta as
+  mensagens, só contando quantas chegaram
+"""
+import socketserver
+import threading
+import zlib
+
+# (cidade, região, país, latitude, longitude)
+CITIES = [
+    ('São Paulo', 'São Paulo', 'Brazil', -23.5505, -46.6333),
+    ('Campinas', 'São Paulo', 'Brazil', -22.9099, -47.0626),
+    ('Rio de Janeiro', 'Rio de Janeiro', 'Brazil', -22.9068, -43.1729),
+    ('Belo Horizonte', 'Minas Gerais', 'Brazil', -19.9167, -43.9345),
+    ('Curitiba', 'Paraná', 'Brazil', -25.4284, -49.2733),
+    ('Porto Alegre', 'Rio Grande do Sul', 'Brazil', -30.0346, -51.2177),
+    ('Recife', 'Pernambuco', 'Brazil', -8.0476, -34.8770),
+    ('Lisbon', 'Lisbon', 'Portugal', 38.7223, -9.1393),
+    ('New York', 'New York', 'United States', 40.7128, -74.0060),
+    ('Tokyo', 'Tokyo', 'Japan', 35.6762, 139.6503),
+]
+
+
+def location_for(index):
+    city, region, country, lat, lng = CITIES[index % len(CITIES)]
+    return {'city': city, 'region': region, 'country': country, 'lat': lat, 'lng': lng}
+
+
+def fake_location(ip_address):
+    """Localização fixa por IP, sem rede"""
+    return location_for(zlib.crc32(ip_address.encode()))
+
+
+def install_fake_geo():
+    """Faz get_location_from_ip usar só o provedor falso"""
+    from config import Config
+    import security
+
+    security.LOCATION_PROVIDERS['fake'] = fake_location
+    Config.GEOIP_PROVIDERS = ['fake']
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """O mínimo do SMTP que o smtplib usa: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.wfile.write(b'250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+            elif command == b'AUTH':
+                self.reply('235 2.7.0 Authentication successful')
+            elif command == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    size += len(data_line)
+                self.server.sink.received(size)
+                self.reply('250 2.0.0 OK')
+            elif command == b'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class _SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SmtpSink:
+    """Servidor SMTP em uma thread, em 127.0.0.1 numa porta livre"""
+
+    def __init__(self):
+        self._server = _SmtpServer(('127.0.0.1', 0), _SmtpHandler)
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def received(self, size):
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def environment(self):
+        """Variáveis para a aplicação enviar emails a este servidor"""
+        return {
+            'SMTP_HOST': '127.0.0.1', 'SMTP_PORT': str(self.port), 'SMTP_USER': 'bench',
+            'SMTP_PASSWORD': 'bench', 'SMTP_FROM': 'noreply@bench.local', 'SMTP_STARTTLS': 'false'
+        }
@@ -0,0 +1,207 @@
+"""
+Contadores de força bruta em memória com persistência assíncrona.
+
+Mantém, por e-mail e por IP, uma janela deslizante com os horários das
+tentativas de login falhas dos últimos BRUTE_FORCE_WINDOW_MINUTES, e responde
+às verificações de MAX_LOGIN_ATTEMPTS_PER_EMAIL/IP sem ir ao banco.
+
+- As tentativas são gravadas em login_attempts em lote pelo audit_writer
+- Na inicialização o estado é reconstruído a partir de login_attempts
+- Uma thread de fundo sincroniza periodicamente as falhas gravadas por outros
+  workers, para que o limite valha entre processos (com atraso de alguns
+  segundos)
+"""
+import atexit
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import timedelta
+from config import Config
+from models import db, LoginAttempt, generate_uuid, get_sp_now
+from audit_writer import audit_writer
+
+# Atraso máximo esperado entre a tentativa e a gravação por outro worker
+SYNC_OVERLAP_SECONDS = 10
+
+
+class SlidingWindowCounter:
+    """Janelas deslizantes por chave, limitadas em chaves e em eventos por chave"""
+
+    def __init__(self, window_seconds, cap, max_keys):
+        self.window_seconds = window_seconds
+        # Basta guardar `cap` eventos: só interessa saber se o limite foi atingido
+        self.cap = cap
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+
+    def add(self, key, timestamp):
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = deque(maxlen=self.cap)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+        if window and timestamp < window[-1]:
+            # Evento antigo vindo da sincronização: mantém a janela ordenada
+            ordered = sorted([*window, timestamp])
+            window.clear()
+            window.extend(ordered[-self.cap:])
+        else:
+            window.append(timestamp)
+
+    def count(self, key, now):
+        window = self._windows.get(key)
+        if not window:
+            return 0
+        cutoff = now - self.window_seconds
+        while window and window[0] < cutoff:
+            window.popleft()
+        return len(window)
+
+    def prune(self, now):
+        """Remove chaves sem eventos dentro da janela"""
+        cutoff = now - self.window_seconds
+        expired = [key for key, window in self._windows.items() if not window or window[-1] < cutoff]
+        for key in expired:
+            del self._windows[key]
+
+    def __len__(self):
+        return len(self._windows)
+
+
+class BruteForceGuard:
+    """Contadores de tentativas falhas por e-mail/IP sincronizados com login_attempts"""
+
+    def __init__(self):
+        self.window_seconds = Config.BRUTE_FORCE_WINDOW_MINUTES * 60
+        cap = max(Config.MAX_LOGIN_ATTEMPTS_PER_EMAIL, Config.MAX_LOGIN_ATTEMPTS_PER_IP)
+        self._email_windows = SlidingWindowCounter(self.window_seconds, cap, Config.BRUTE_FORCE_MAX_KEYS)
+        self._ip_windows = SlidingWindowCounter(self.window_seconds, cap, Config.BRUTE_FORCE_MAX_KEYS)
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._seen_ids = {}
+        self._synced_until = None
+        self._app = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._counters = {'recorded': 0, 'synced': 0}
+
+    # Ciclo de vida
+
+    def init_app(self, app):
+        """Registra a aplicação; os contadores são reconstruídos do banco no primeiro uso"""
+        self._app = app
+
+    def start(self):
+        """Reconstrói os contadores (primeira vez) e inicia a thread de sincronização do processo"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._synced_until is None and self._app is not None:
+                with self._app.app_context():
+                    self._sync()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='brute-force-sync', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=10):
+        """Encerra a thread de sincronização"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._pid = None
+
+    # API usada por security.py
+
+    def record_attempt(self, email, ip_address, success):
+        """Atualiza os contadores e agenda a gravação da tentativa no audit_writer"""
+        self.start()
+        attempted_at = get_sp_now()
+        row = {
+            'id': generate_uuid(),
+            'email': email,
+            'ip_address': ip_address,
+            'success': success,
+            'attempted_at': attempted_at
+        }
+        if not success:
+            timestamp = attempted_at.timestamp()
+            with self._lock:
+                self._seen_ids[row['id']] = timestamp
+                self._email_windows.add(email, timestamp)
+                self._ip_windows.add(ip_address, timestamp)
+                self._counters['recorded'] += 1
+        else:
+            with self._lock:
+                self._counters['recorded'] += 1
+        audit_writer.log_attempt(row)
+
+    def failure_counts(self, email, ip_address):
+        """Retorna (falhas recentes do e-mail, falhas recentes do IP)"""
+        self.start()
+        now = get_sp_now().timestamp()
+        with self._lock:
+            return self._email_windows.count(email, now), self._ip_windows.count(ip_address, now)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'emails': len(self._email_windows),
+                'ips': len(self._ip_windows),
+                **self._counters
+            }
+
+    # Thread de fundo
+
+    def _run(self):
+        while not self._stop.wait(Config.BRUTE_FORCE_SYNC_SECONDS):
+            if self._app is None:
+                continue
+            with self._app.app_context():
+                try:
+                    self._sync()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f'Falha ao sincronizar contadores de força bruta: {e}')
+
+    def _sync(self):
+        """Carrega falhas gravadas por outros processos (ou antes da inicialização)"""
+        now = get_sp_now()
+        since = now - timedelta(seconds=self.window_seconds)
+        if self._synced_until is not None:
+            since = max(since, self._synced_until - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+
+        rows = db.session.query(
+            LoginAttempt.id, LoginAttempt.email, LoginAttempt.ip_address, LoginAttempt.attempted_at
+        ).filter(
+            LoginAttempt.attempted_at >= since,
+            LoginAttempt.success == False
+        ).order_by(LoginAttempt.attempted_at).all()
+        db.session.commit()
+
+        cutoff = now.timestamp() - self.window_seconds
+        with self._lock:
+            for row_id, email, ip_address, attempted_at in rows:
+                if row_id in self._seen_ids:
+                    continue
+                timestamp = attempted_at.timestamp()
+                self._seen_ids[row_id] = timestamp
+                self._email_windows.add(email, timestamp)
+                self._ip_windows.add(ip_address, timestamp)
+                self._counters['synced'] += 1
+            # Esquece ids e chaves que já saíram da janela
+            self._seen_ids = {k: v for k, v in self._seen_ids.items() if v >= cutoff}
+            self._email_windows.prune(now.timestamp())
+            self._ip_windows.prune(now.timestamp())
+        self._synced_until = now
+
+
+# Instância compartilhada pelo processo
+brute_force_guard = BruteForceGuard()
+atexit.register(brute_force_guard.stop)
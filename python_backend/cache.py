@@ -0,0 +1,125 @@
+"""
+Cache em memória limitado, com expiração e carregamento coordenado.
+
+- Número máximo de entradas com remoção LRU
+- TTL para acertos e TTL separado (mais curto) para resultados vazios (None),
+  evitando repetir consultas lentas que falham
+- Single-flight: chamadas simultâneas para a mesma chave esperam um único
+  carregamento em vez de consultarem a origem N vezes
+- Contadores de acertos, falhas, remoções e carregamentos
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """Carregamento em andamento para uma chave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Cache LRU com TTL, cache negativo e single-flight (thread-safe)"""
+
+    def __init__(self, max_entries, ttl, negative_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0,
+            'expirations': 0, 'loads': 0, 'load_errors': 0, 'coalesced': 0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key, now):
+        """Retorna (encontrado, valor); chamar com o lock adquirido"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self._counters['expirations'] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self._counters['negative_hits' if value is None else 'hits'] += 1
+        return True, value
+
+    def _store(self, key, value, ttl, now):
+        """Grava a entrada e remove as menos usadas; chamar com o lock adquirido"""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if not found:
+                self._counters['misses'] += 1
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl, time.monotonic())
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key, loader):
+        """Retorna o valor em cache ou chama loader(key) uma única vez por chave"""
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                return value
+            self._counters['misses'] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader(key)
+            with self._lock:
+                self._counters['loads'] += 1
+                self._store(key, flight.value, None, time.monotonic())
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._counters['load_errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_entries': self.max_entries, **self._counters}
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Verifica se as consultas quentes de security.py e routes.py usam índices.
+
+As consultas são capturadas executando as próprias funções (com
+BRUTE_FORCE_BACKEND = 'db', para incluir as contagens de força bruta) e
+cada SELECT capturado passa por EXPLAIN. Se algum plano fizer varredura
+sequencial em uma tabela de autenticação, o script termina com código 1.
+
+No Postgres o planejador roda com enable_seqscan = off: assim a varredura
+sequencial só aparece quando nenhum índice atende a consulta,
+independentemente do tamanho atual das tabelas. No SQLite é usado
+EXPLAIN QUERY PLAN (SCAN = varredura, SEARCH = índice).
+
+Uso:
+    python check_query_plans.py
+"""
+import json
+import sys
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import event
+from config import Config
+from models import db, User
+import security
+import access_log_query
+from location_state import location_state_cache
+
+# Tabelas que não podem ser varridas sequencialmente
+CHECKED_TABLES = {'users', 'access_logs', 'login_attempts', 'security_blocks', 'user_locations'}
+
+SAMPLE_EMAIL = 'plan-check@example.com'
+SAMPLE_IP = '203.0.113.10'
+SAMPLE_USER_ID = '00000000-0000-0000-0000-000000000000'
+SAMPLE_LOGIN_TIME = datetime(2025, 1, 1, 12, 0, 0)
+SAMPLE_LOCATION = {'city': 'São Paulo', 'region': 'São Paulo', 'country': 'Brazil', 'lat': -23.55, 'lng': -46.63}
+
+
+def capture_hot_queries():
+    """Executa as consultas quentes e retorna [(origem, sql, parâmetros)]"""
+    captured = []
+    current = {'source': None}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and current['source']:
+            captured.append((current['source'], statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    backend = Config.BRUTE_FORCE_BACKEND
+    Config.BRUTE_FORCE_BACKEND = 'db'
+    try:
+        hot_queries = [
+            ('security.check_brute_force', lambda: security.check_brute_force(SAMPLE_EMAIL, SAMPLE_IP, db)),
+            ('security.check_impossible_travel',
+             lambda: security.check_impossible_travel(SAMPLE_USER_ID, SAMPLE_LOCATION, db)),
+            ('security.check_location_proximity',
+             lambda: security.check_location_proximity(SAMPLE_USER_ID, SAMPLE_LOCATION, db)),
+            ('security.assess_login_risk (IP conhecido)',
+             lambda: security.assess_login_risk(SAMPLE_USER_ID, SAMPLE_IP, None, db)),
+            ('routes.login (usuário por e-mail)', lambda: User.query.filter_by(email=SAMPLE_EMAIL).first()),
+            ('routes.get_access_logs (ETag)', lambda: access_log_query.latest_marker(SAMPLE_USER_ID)),
+            ('routes.get_access_logs (página)',
+             lambda: access_log_query.fetch_page(SAMPLE_USER_ID, list(access_log_query.FIELDS), 50,
+                                                 cursor=(SAMPLE_LOGIN_TIME, SAMPLE_USER_ID))),
+        ]
+        for source, run in hot_queries:
+            current['source'] = source
+            location_state_cache.clear()
+            run()
+            current['source'] = None
+            db.session.rollback()
+    finally:
+        Config.BRUTE_FORCE_BACKEND = backend
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    return captured
+
+
+def _postgres_seq_scans(plan):
+    """Percorre o plano JSON e retorna as tabelas varridas sequencialmente"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in CHECKED_TABLES:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(_postgres_seq_scans(child))
+    return found
+
+
+def explain(conn, statement, parameters):
+    """Retorna (linhas do plano, tabelas varridas sequencialmente)"""
+    if conn.dialect.name == 'postgresql':
+        rows = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+        plan = rows if isinstance(rows, list) else json.loads(rows)
+        root = plan[0]['Plan']
+        return json.dumps(root, indent=2).splitlines(), _postgres_seq_scans(root)
+
+    details = [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+    scans = []
+    for detail in details:
+        words = detail.split()
+        # "SCAN tabela" sem índice; "SCAN tabela USING [COVERING] INDEX" é aceitável
+        if len(words) >= 2 and words[0] == 'SCAN' and words[1] in CHECKED_TABLES and 'INDEX' not in words:
+            scans.append(words[1])
+    return details, scans
+
+
+def main():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = Config.DATABASE_URL
+    db.init_app(app)
+
+    failures = 0
+    with app.app_context():
+        queries = capture_hot_queries()
+        with db.engine.connect() as conn:
+            if conn.dialect.name == 'postgresql':
+                conn.exec_driver_sql('SET enable_seqscan = off')
+            for source, statement, parameters in queries:
+                plan, scans = explain(conn, statement, parameters)
+                status = 'FALHA' if scans else 'ok'
+                print(f'[{status}] {source}')
+                if scans:
+                    failures += 1
+                    print(f"    varredura sequencial em: {', '.join(sorted(set(scans)))}")
+                    print('    ' + ' '.join(statement.split()))
+                    for line in plan:
+                        print(f'    {line}')
+
+    print(f'\n{len(queries)} consultas verificadas, {failures} com varredura sequencial')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Carrega variáveis do arquivo .env (sem sobrescrever as já existentes)
@@ -8,22 +9,24 @@ class Config:
  
     # BANCO DE DADOS
  
+    # Obrigatória; verificada por create_app (app.py), não na importação
     DATABASE_URL = os.getenv('DATABASE_URL')
     
-    # Se não encontrar, tenta recarregar o .env sobrescrevendo variáveis
-    if not DATABASE_URL:
-        load_dotenv(override=True)
-        DATABASE_URL = os.getenv('DATABASE_URL')
-    
-    # Interrompe se o banco não estiver configurado
-    if not DATABASE_URL:
-        raise ValueError("A variável DATABASE_URL é obrigatória")
-    
  
     # SESSÃO
    
     SECRET_KEY = os.getenv('SESSION_SECRET', 'your-super-secret-session-key-change-in-production')
-    SESSION_TYPE = 'sqlalchemy'              # Armazena sessões no banco
+    # 'sqlalchemy': tabela de sessões no banco; 'sqlite': arquivo local compartilhado pelos workers do host
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlalchemy')
+    SESSION_SQLALCHEMY_TABLE = 'sessions'    # Mesma tabela usada antes pelo Flask-Session
+    SESSION_SQLITE_PATH = os.getenv('SESSION_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'amfa-sessions.db'))
+    # Validade (s) de uma sessão no cache do processo (0 desativa: workers em mais de um host)
+    SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', '5'))
+    # Versões das sessões compartilhadas pelos workers do host: logout/alteração invalida o cache dos demais (vazio desativa o cache)
+    SESSION_VERSIONS_PATH = os.getenv('SESSION_VERSIONS_PATH', os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'amfa-session-versions.bin'))
+    SESSION_VERSIONS_SLOTS = 65536           # 8 bytes por slot
+    SESSION_CACHE_MAX_ENTRIES = 10000        # Máximo de sessões em cache por processo
     SESSION_PERMANENT = False                # Sessão expira ao fechar o navegador
     SESSION_USE_SIGNER = True                # Assina cookies para evitar alterações
     SESSION_COOKIE_NAME = 'amfa.sid'         # Nome do cookie da sessão
@@ -33,6 +36,16 @@ class Config:
     PERMANENT_SESSION_LIFETIME = 24 * 60 * 60  # Duração máxima: 24 horas
     
   
+    # LIMITE DE REQUISIÇÕES
+    
+    # Armazenamento compartilhado pelos workers (ver limiter_storage.py):
+    # 'sqlite:///<arquivo>' (WAL local do host), 'redis://host:porta' (entre hosts) ou 'memory://' (por processo)
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'amfa-ratelimit.db'))
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'moving-window')  # 'moving-window' ou 'fixed-window'
+    RATELIMIT_DEFAULT = os.getenv('RATELIMIT_DEFAULT', '200 per hour')  # Limite padrão por IP
+    RATELIMIT_CLEANUP_SECONDS = 60             # Intervalo da limpeza de entradas expiradas (sqlite)
+    
+  
     # E-MAIL
    
     SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
@@ -41,16 +54,112 @@ class Config:
     SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
     SMTP_FROM = os.getenv('SMTP_FROM', 'noreply@localhost')
     SMTP_SECURE = os.getenv('SMTP_PORT') == '465'  # Usa SSL se a porta for 465
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'  # Desative para servidores SMTP locais de teste
+    
+
+    # FILA DE EMAIL
+
+    MAIL_SPOOL_DIR = os.getenv('MAIL_SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mail_spool'))
+    MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', '2'))   # Workers (e conexões SMTP) por processo
+    MAIL_MAX_RETRIES = int(os.getenv('MAIL_MAX_RETRIES', '5'))  # Tentativas extras antes de desistir
+    MAIL_RETRY_BACKOFF_SECONDS = 2             # Espera inicial entre tentativas (dobra a cada falha)
+    MAIL_RETRY_MAX_BACKOFF_SECONDS = 5 * 60    # Espera máxima entre tentativas
+    MAIL_CONNECTION_IDLE_SECONDS = 60          # Conexão ociosa é verificada/fechada após este tempo
+    MAIL_LOCALE = os.getenv('MAIL_LOCALE', 'pt_BR')  # Idioma padrão dos templates (templates/email/<idioma>/)
+    
+
+    # GEOLOCALIZAÇÃO
+
+    # Provedores consultados em ordem: 'local' (base offline via mmap) e 'http' (ipapi.co)
+    GEOIP_PROVIDERS = [p.strip() for p in os.getenv('GEOIP_PROVIDERS', 'local,http').split(',') if p.strip()]
+    GEOIP_DATABASE_PATH = os.getenv('GEOIP_DATABASE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geoip.bin'))
+    GEO_CACHE_MAX_ENTRIES = int(os.getenv('GEO_CACHE_MAX_ENTRIES', '10000'))  # Máximo de IPs em cache
+    GEO_CACHE_TTL = 24 * 60 * 60               # Validade de uma localização encontrada
+    GEO_CACHE_NEGATIVE_TTL = 5 * 60            # Validade de uma busca sem resultado/com erro
+    # Cache compartilhado entre os workers do host (vazio desativa)
+    GEO_SHARED_CACHE_PATH = os.getenv('GEO_SHARED_CACHE_PATH', os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'amfa-geo-cache.bin'))
+    GEO_SHARED_CACHE_SLOTS = int(os.getenv('GEO_SHARED_CACHE_SLOTS', '65536'))  # 256 bytes por slot
+    LOCATION_STATE_SIZE = 20                   # Logins com coordenadas guardados por usuário (bem-sucedidos e falhos, cada)
+    LOCATION_STATE_CACHE_TTL = 10              # Validade (s) do estado em cache (escritas locais invalidam na hora)
+    LOCATION_STATE_CACHE_MAX_ENTRIES = 10000   # Máximo de usuários com estado em cache
     
 
     # APLICAÇÃO
     
     APP_URL = os.getenv('APP_URL', 'http://localhost:5000')  # URL base da aplicação
+    STATIC_MAX_AGE = 365 * 24 * 60 * 60        # Cache dos arquivos com fingerprint (imutáveis)
+    STATIC_COMPRESS_MIN_SIZE = 512             # Arquivos menores não são comprimidos
+    
+  
+    # SERVIDOR (produção, ver serve.py)
+    
+    SERVER_BIND = os.getenv('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', str(os.cpu_count() or 1)))  # Processos (um por núcleo)
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '4'))  # Threads por processo (E/S: geolocalização, banco, SMTP)
+    SERVER_KEEPALIVE = 5                       # Segundos que uma conexão ociosa fica aberta
+    SERVER_TIMEOUT = 30                        # Worker sem responder por mais tempo é reiniciado
+    SERVER_GRACEFUL_TIMEOUT = 30               # Prazo para terminar as requisições em andamento ao parar/recarregar
+    SERVER_MAX_REQUESTS = 10000                # Reinicia o worker após N requisições (0 desativa)
+    SERVER_MAX_REQUESTS_JITTER = 1000          # Variação aleatória para os workers não reiniciarem juntos
+    
+
+    # MÉTRICAS
+
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'  # Expõe GET /metrics (Prometheus)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # Se definido, /metrics exige "Authorization: Bearer <token>"
+    # Diretório compartilhado pelos workers do host para somar as métricas (vazio: cada processo responde com as suas)
+    METRICS_DIR = os.getenv('METRICS_DIR', '')
+    METRICS_SYNC_SECONDS = 5                   # Intervalo de gravação dos números de cada processo em METRICS_DIR
+    # Limites dos buckets dos histogramas de latência (segundos)
+    METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+    # PERFIL DE EXECUÇÃO SOB DEMANDA (ver profiler.py)
+
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # Fração das requisições perfiladas (0 desativa)
+    PROFILE_ROUTES = [r.strip() for r in os.getenv('PROFILE_ROUTES', '').split(',') if r.strip()]  # Rotas amostradas (vazio: todas)
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')  # Se definido, "X-Profile: <token>" perfila a requisição
+    # 'sample': pilhas amostradas (.collapsed); 'cprofile': determinístico, só a thread da requisição (.pstats)
+    PROFILE_MODE = os.getenv('PROFILE_MODE', 'sample')
+    PROFILE_OUTPUT = os.getenv('PROFILE_OUTPUT', 'request')  # 'request': arquivo por requisição; 'aggregate': por rota
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'amfa-profiles'))
+    PROFILE_INTERVAL = 0.005                   # Intervalo mínimo entre amostras (s)
+    PROFILE_MAX_OVERHEAD = 0.02                # Fração máxima do tempo gasta amostrando (o intervalo cresce para respeitá-la)
+    PROFILE_MAX_CONCURRENT = 4                 # Requisições perfiladas ao mesmo tempo por processo
+    PROFILE_MAX_FILES = 1000                   # Arquivos gravados por processo (PROFILE_OUTPUT 'request')
+    PROFILE_FLUSH_SECONDS = 10                 # Intervalo de regravação dos perfis agregados
+
+    # CONSULTAS POR REQUISIÇÃO (ver query_budget.py)
+
+    # 'off': sem contagem; 'warn': aviso no log; 'raise': QueryBudgetExceeded no fim da requisição (testes)
+    QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'off' if os.getenv('NODE_ENV') == 'production' else 'warn')
+    QUERY_DEBUG_HEADERS = os.getenv('QUERY_DEBUG_HEADERS', 'false').lower() == 'true'  # X-Query-* também fora do modo debug
+    QUERY_REPEAT_THRESHOLD = 3                 # Execuções da mesma instrução numa requisição que indicam N+1
+    # Máximo de consultas por rota (endpoint do Flask); rotas fora da lista não têm limite.
+    # Medido no caso mais caro (BRUTE_FORCE_BACKEND='db', AUDIT_WRITE_BEHIND desligado), com folga
+    QUERY_BUDGETS = {
+        'auth.login': 14,                      # medido: 12
+        'auth.register': 10,                   # medido: 8
+        'auth.verify_code': 5,
+        'auth.resend_verification_code': 6,
+        'auth.verify_security': 10,            # medido: 8
+        'auth.resend_security_code': 6,
+        'auth.get_current_user': 2,
+        'auth.get_access_logs': 3,
+        'auth.refresh_token': 2,
+        'auth.logout': 4,
+    }
     
   
     # SEGURANÇA
 
     BCRYPT_LOG_ROUNDS = 12                     # Nível de força do hash de senha
+    HASHING_WORKERS = int(os.getenv('HASHING_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))  # Processos do bcrypt (deixa um núcleo livre)
+    HASHING_MAX_PENDING = int(os.getenv('HASHING_MAX_PENDING', '64'))  # Hashes na fila + em execução
+    HASHING_QUEUE_TIMEOUT = 2                  # Espera máxima (s) por uma vaga na fila de hash
+    HASHING_TIMEOUT = 10                       # Espera máxima (s) pelo resultado do hash
+    HASHING_START_METHOD = os.getenv('HASHING_START_METHOD', 'forkserver')  # Criação dos processos do pool ('forkserver' ou 'spawn')
     VERIFICATION_CODE_EXPIRY_MINUTES = 15      # Expiração do código de verificação
     SECURITY_CODE_EXPIRY_MINUTES = 30          # Expiração do código MFA
     MAX_LOGIN_ATTEMPTS_PER_EMAIL = 5           # Tentativas máximas por e-mail
@@ -58,3 +167,44 @@ class Config:
     BRUTE_FORCE_WINDOW_MINUTES = 2             # Janela de contagem de tentativas
     EMAIL_BLOCK_MINUTES = 15                   # Tempo de bloqueio por e-mail
     IP_BLOCK_MINUTES = 30                      # Tempo de bloqueio por IP
+    # 'memory': janelas deslizantes em memória (sincronizadas entre workers a cada
+    # BRUTE_FORCE_SYNC_SECONDS); 'db': COUNT(*) em login_attempts a cada login
+    BRUTE_FORCE_BACKEND = os.getenv('BRUTE_FORCE_BACKEND', 'memory')
+    BRUTE_FORCE_SYNC_SECONDS = 1               # Intervalo de sincronização das tentativas
+    BRUTE_FORCE_MAX_KEYS = 100000              # Máximo de e-mails/IPs acompanhados em memória
+    # 'session': cookie de sessão; 'token': tokens assinados (Authorization: Bearer); 'both': os dois
+    AUTH_MODE = os.getenv('AUTH_MODE', 'session')
+    # Chave do HMAC dos tokens; obrigatória com AUTH_MODE 'token'/'both' (verificada por create_app)
+    TOKEN_SECRET = os.getenv('TOKEN_SECRET', '')
+    ACCESS_TOKEN_TTL = 15 * 60                 # Validade do token de acesso
+    REFRESH_TOKEN_TTL = 7 * 24 * 60 * 60       # Validade do token de renovação
+    TOKEN_DENYLIST_REFRESH_SECONDS = 5         # Intervalo de recarga dos tokens revogados
+    TOKEN_DENYLIST_MAX_STALENESS = 60          # Sem recarga bem-sucedida por mais tempo, tokens são recusados (503)
+    TOKEN_DENYLIST_WAIT = 2                    # Espera máxima (s) da requisição pela primeira carga
+    LOGIN_PIPELINE_WORKERS = int(os.getenv('LOGIN_PIPELINE_WORKERS', '16'))  # Threads do pipeline de login (0 = sequencial)
+
+
+    # AUDITORIA
+
+    # AccessLog/LoginAttempt gravados em lote por uma thread de fundo (ver audit_writer.py)
+    AUDIT_WRITE_BEHIND = os.getenv('AUDIT_WRITE_BEHIND', 'true').lower() == 'true'
+    AUDIT_FLUSH_SECONDS = 1                    # Intervalo máximo entre gravações
+    AUDIT_FLUSH_BATCH = 500                    # Registros por lote (fila cheia até aqui antecipa a gravação)
+    AUDIT_MAX_PENDING = 50000                  # Registros na fila; acima disso são descartados (métrica 'lost')
+    AUDIT_SHUTDOWN_TIMEOUT = 5                 # Tempo (s) para esvaziar a fila no encerramento
+    AUDIT_MAX_RETRIES = 5                      # Falhas de conexão seguidas antes de gravar o lote em partes
+    # Registros que não gravam nem sozinhos (uma linha JSON por registro)
+    AUDIT_DEAD_LETTER_DIR = os.getenv('AUDIT_DEAD_LETTER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audit_dead_letter'))
+
+
+    # RETENÇÃO
+
+    # No Postgres access_logs e login_attempts são particionadas por tempo e as partições
+    # expiradas são removidas inteiras (ver retention.py); nos demais bancos, DELETE em lotes
+    ACCESS_LOG_RETENTION_DAYS = int(os.getenv('ACCESS_LOG_RETENTION_DAYS', '180'))      # Histórico de acessos
+    LOGIN_ATTEMPT_RETENTION_DAYS = int(os.getenv('LOGIN_ATTEMPT_RETENTION_DAYS', '30'))  # Tentativas de login
+    ACCESS_LOG_PARTITION_INTERVAL = 'month'    # Uma partição por mês ('month' ou 'day')
+    LOGIN_ATTEMPT_PARTITION_INTERVAL = 'day'   # Uma partição por dia ('month' ou 'day')
+    PARTITION_PREMAKE_PERIODS = 3              # Partições futuras criadas com antecedência
+    RETENTION_DETACH_ONLY = os.getenv('RETENTION_DETACH_ONLY', 'false').lower() == 'true'  # Desanexa em vez de apagar
+    RETENTION_DELETE_BATCH = 5000              # Linhas por DELETE (bancos sem particionamento)
@@ -0,0 +1,124 @@
+"""
+Templates de email compilados uma vez por processo.
+
+Os templates ficam em templates/email/<idioma>/, um par por mensagem
+(<nome>.html e <nome>.txt, alternativa em texto puro), e um messages.json com
+os assuntos e os textos curtos usados pelo código (localização desconhecida,
+motivo do bloqueio, formato de data).
+
+Na primeira mensagem de um idioma todos os templates dele são lidos e
+divididos em segmentos estáticos e campos `{{ nome }}`; cada envio só
+preenche os campos e junta os segmentos (sem reler arquivos nem interpretar
+o template). No HTML os valores são escapados; no texto, não.
+
+O idioma padrão é MAIL_LOCALE; um idioma sem templates (ou só com a região
+diferente, ex.: en_US -> en) cai no mais próximo disponível.
+"""
+import html
+import json
+import os
+import re
+import threading
+from config import Config
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+# Campo do template: {{ nome }}
+_FIELD = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class CompiledTemplate:
+    """Template dividido em segmentos estáticos e posições dos campos"""
+
+    def __init__(self, source, name):
+        self.name = name
+        self._parts = []   # Segmentos estáticos, com um espaço reservado para cada campo
+        self._fields = []  # (posição em _parts, nome do campo)
+        position = 0
+        for match in _FIELD.finditer(source):
+            self._parts.append(source[position:match.start()])
+            self._fields.append((len(self._parts), match.group(1)))
+            self._parts.append('')
+            position = match.end()
+        self._parts.append(source[position:])
+        self.fields = frozenset(field for _, field in self._fields)
+
+    def render(self, values):
+        parts = self._parts.copy()
+        for index, field in self._fields:
+            parts[index] = values[field]
+        return ''.join(parts)
+
+
+class LocaleCatalog:
+    """Templates e mensagens de um idioma"""
+
+    def __init__(self, locale):
+        self.locale = locale
+        directory = os.path.join(TEMPLATE_DIR, locale)
+        with open(os.path.join(directory, 'messages.json'), encoding='utf-8') as f:
+            self.messages = json.load(f)
+        self._templates = {}
+        for filename in sorted(os.listdir(directory)):
+            name, ext = os.path.splitext(filename)
+            if ext not in ('.html', '.txt'):
+                continue
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                self._templates[(name, ext)] = CompiledTemplate(f.read(), f'{locale}/{filename}')
+
+    def message(self, key):
+        return self.messages[key]
+
+    def format_datetime(self, value):
+        return value.strftime(self.messages['datetime_format'])
+
+    def render(self, template, /, **values):
+        """(assunto, html, texto) da mensagem `template` com os valores informados"""
+        html_template = self._templates[(template, '.html')]
+        text_template = self._templates.get((template, '.txt'))
+
+        values = {key: str(value) for key, value in values.items()}
+        missing = (html_template.fields | (text_template.fields if text_template else frozenset())) - values.keys()
+        if missing:
+            raise KeyError(f"Campos sem valor no template {template}: {', '.join(sorted(missing))}")
+
+        escaped = {key: html.escape(value) for key, value in values.items()}
+        return (
+            self.messages[f'{template}.subject'],
+            html_template.render(escaped),
+            text_template.render(values) if text_template else None
+        )
+
+
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def _resolve(locale):
+    """Nome do diretório de templates mais próximo do idioma pedido"""
+    locale = (locale or Config.MAIL_LOCALE).replace('-', '_')
+    for candidate in (locale, locale.split('_')[0], Config.MAIL_LOCALE):
+        if os.path.isfile(os.path.join(TEMPLATE_DIR, candidate, 'messages.json')):
+            return candidate
+    raise LookupError(f'Nenhum template de email para o idioma {locale}')
+
+
+def get_catalog(locale=None):
+    """Catálogo do idioma (compilado no primeiro uso e mantido em memória)"""
+    catalog = _catalogs.get(locale)
+    if catalog is not None:
+        return catalog
+    with _lock:
+        resolved = _resolve(locale)
+        if resolved not in _catalogs:
+            _catalogs[resolved] = LocaleCatalog(resolved)
+        # O idioma pedido passa a apontar direto para o catálogo resolvido
+        catalog = _catalogs[locale] = _catalogs[resolved]
+    return catalog
+
+
+def available_locales():
+    return sorted(
+        name for name in os.listdir(TEMPLATE_DIR)
+        if os.path.isfile(os.path.join(TEMPLATE_DIR, name, 'messages.json'))
+    )
@@ -0,0 +1,102 @@
+"""
+Pontuação de localização contra o estado recente do usuário.
+
+O histórico é o estado de localização (location_state.py: até
+LOCATION_STATE_SIZE logins bem-sucedidos e outros tantos falhos, mais os
+ainda na fila do audit_writer), em uma lista (horário, latitude, longitude,
+sucesso) do mais recente para o mais antigo. Em uma única passada, calcula
+as distâncias de grande círculo até a localização atual e as velocidades
+implícitas, e retorna juntos:
+
+- a viagem impossível (mesma regra de antes: > 500 km em menos de 2 h,
+  olhando as últimas 48 h), com a velocidade máxima implícita
+- a localização conhecida mais próxima entre os logins bem-sucedidos dos
+  últimos 30 dias (antes só o login mais recente era comparado)
+
+Com dezenas de linhas o laço em Python puro, com os termos da localização
+atual calculados uma vez, é mais rápido que montar arrays NumPy a cada
+login (ver benchmarks/bench_geo_scoring.py).
+"""
+from datetime import timedelta
+from math import atan2, cos, radians, sin, sqrt
+from location_state import recent_locations
+from audit_writer import audit_writer
+
+EARTH_RADIUS_KM = 6371
+
+IMPOSSIBLE_DISTANCE_KM = 500
+MIN_TIME_HOURS = 2
+TRAVEL_WINDOW = timedelta(hours=48)
+PROXIMITY_DISTANCE_KM = 100
+PROXIMITY_WINDOW = timedelta(days=30)
+
+# Intervalo mínimo usado no cálculo de velocidade (evita divisão por zero)
+MIN_VELOCITY_HOURS = 1 / 3600
+
+
+def load_history(user_id):
+    """Estado recente do usuário: [(login_time, lat, lng, success)], do mais recente para o mais antigo"""
+    rows = recent_locations(user_id)
+    # Logins ainda na fila do audit_writer entram no histórico
+    pending = audit_writer.pending_locations(user_id)
+    if pending:
+        rows = sorted(pending + rows, key=lambda row: row[0], reverse=True)
+    return rows
+
+
+def score_location(history, current_location, now):
+    """Calcula viagem impossível e proximidade da localização atual em uma passada"""
+    result = {
+        'impossibleTravel': {'isImpossible': False},
+        'proximity': {'isNearby': False},
+        'maxVelocity': None
+    }
+    if not current_location or not current_location.get('lat') or not current_location.get('lng'):
+        return result
+    if not history:
+        return result
+
+    # Haversine com os termos da localização atual fora do laço
+    lat = radians(current_location['lat'])
+    lng = radians(current_location['lng'])
+    cos_lat = cos(lat)
+    travel_since = now - TRAVEL_WINDOW
+    proximity_since = now - PROXIMITY_WINDOW
+    max_velocity = None
+    nearest = None
+
+    for login_time, row_lat, row_lng, success in history:
+        in_travel_window = login_time >= travel_since
+        known = success and login_time >= proximity_since
+        if not in_travel_window and not known:
+            continue
+        row_lat = radians(row_lat)
+        a = sin((row_lat - lat) / 2) ** 2 + cos_lat * cos(row_lat) * sin((radians(row_lng) - lng) / 2) ** 2
+        distance = EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+        if in_travel_window:
+            hours = (now - login_time).total_seconds() / 3600
+            velocity = distance / max(hours, MIN_VELOCITY_HOURS)
+            if max_velocity is None or velocity > max_velocity:
+                max_velocity = velocity
+            # O histórico está em ordem decrescente: vale o login mais recente
+            if (not result['impossibleTravel']['isImpossible']
+                    and distance > IMPOSSIBLE_DISTANCE_KM and hours < MIN_TIME_HOURS):
+                result['impossibleTravel'] = {
+                    'isImpossible': True,
+                    'distance': round(distance),
+                    'timeDiff': round(hours, 2)
+                }
+        if known and (nearest is None or distance < nearest):
+            nearest = distance
+
+    if max_velocity is not None:
+        result['maxVelocity'] = round(max_velocity, 1)
+    # Proximidade: localização bem-sucedida mais próxima dos últimos 30 dias
+    if nearest is not None:
+        result['proximity'] = {
+            'isNearby': nearest <= PROXIMITY_DISTANCE_KM,
+            'distance': round(nearest)
+        }
+
+    return result
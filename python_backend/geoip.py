@@ -0,0 +1,277 @@
+"""
+Base de geolocalização offline.
+
+Compila um CSV no estilo GeoLite2/IP2Location em um arquivo binário compacto
+com as faixas de IP ordenadas e o consulta via mmap com busca binária, sem
+nenhuma chamada de rede.
+
+Formato do arquivo (little-endian):
+    cabeçalho   magic(8) | qtd_v4 | qtd_v6 | qtd_locais | tamanho_strings
+    faixas v4   início(u32) | fim(u32) | índice_local(u32)
+    faixas v6   início(16 bytes big-endian) | fim(16 bytes) | índice_local(u32)
+    locais      off_cidade | off_região | off_país (u32) | lat | lng (f32)
+    strings     tamanho(u16) + utf-8, sem repetição
+
+Uso:
+    python geoip.py compile --format simple faixas.csv geoip.bin
+    python geoip.py compile --format geolite2 --locations GeoLite2-City-Locations-en.csv \\
+        GeoLite2-City-Blocks-IPv4.csv GeoLite2-City-Blocks-IPv6.csv geoip.bin
+    python geoip.py compile --format ip2location IP2LOCATION-LITE-DB5.CSV geoip.bin
+    python geoip.py lookup geoip.bin 8.8.8.8
+"""
+import argparse
+import csv
+import ipaddress
+import math
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b'AMFAGEO1'
+HEADER = struct.Struct('<8sIIII')
+V4_RECORD = struct.Struct('<III')
+V6_RECORD = struct.Struct('<16s16sI')
+LOCATION_RECORD = struct.Struct('<IIIff')
+STRING_LENGTH = struct.Struct('<H')
+
+
+# Compilação
+
+def _parse_ip(value):
+    """Aceita IP em texto ou inteiro (formato IP2Location)"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return ipaddress.IPv4Address(number) if number <= 0xFFFFFFFF else ipaddress.IPv6Address(number)
+    return ipaddress.ip_address(value)
+
+
+def _parse_coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _read_simple(paths):
+    """CSV com cabeçalho: network OU start,end + city,region,country,lat,lng"""
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('network'):
+                    network = ipaddress.ip_network(row['network'], strict=False)
+                    start, end = network.network_address, network.broadcast_address
+                else:
+                    start, end = _parse_ip(row['start']), _parse_ip(row['end'])
+                yield start, end, (row.get('city', ''), row.get('region', ''), row.get('country', ''),
+                                   _parse_coordinate(row.get('lat')), _parse_coordinate(row.get('lng')))
+
+
+def _read_ip2location(paths):
+    """CSV sem cabeçalho: ip_from,ip_to,country_code,country,region,city,lat,lng"""
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 8 or row[2] == '-':
+                    continue
+                yield _parse_ip(row[0]), _parse_ip(row[1]), (row[5], row[4], row[3],
+                                                             _parse_coordinate(row[6]), _parse_coordinate(row[7]))
+
+
+def _read_geolite2(paths, locations_path):
+    """Arquivos Blocks do GeoLite2-City unidos ao arquivo Locations pelo geoname_id"""
+    names = {}
+    with open(locations_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            names[row['geoname_id']] = (row.get('city_name', ''), row.get('subdivision_1_name', ''),
+                                        row.get('country_name', ''))
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                city, region, country = names.get(row.get('geoname_id') or row.get('registered_country_geoname_id'),
+                                                  ('', '', ''))
+                network = ipaddress.ip_network(row['network'], strict=False)
+                yield network.network_address, network.broadcast_address, (
+                    city, region, country,
+                    _parse_coordinate(row.get('latitude')), _parse_coordinate(row.get('longitude')))
+
+
+def compile_database(rows, output_path):
+    """Grava as faixas (start, end, local) no formato binário; retorna (v4, v6, ignoradas)"""
+    strings = bytearray()
+    string_offsets = {}
+    locations = []
+    location_index = {}
+    v4, v6 = [], []
+
+    def intern(text):
+        if text not in string_offsets:
+            encoded = (text or '').encode('utf-8')[:0xFFFF]
+            string_offsets[text] = len(strings)
+            strings.extend(STRING_LENGTH.pack(len(encoded)))
+            strings.extend(encoded)
+        return string_offsets[text]
+
+    for start, end, location in rows:
+        if location not in location_index:
+            city, region, country, lat, lng = location
+            location_index[location] = len(locations)
+            locations.append((intern(city), intern(region), intern(country), lat, lng))
+        index = location_index[location]
+        if start.version == 4:
+            v4.append((int(start), int(end), index))
+        else:
+            v6.append((start.packed, end.packed, index))
+
+    # Faixas sobrepostas quebrariam a busca binária: mantém a primeira
+    skipped = 0
+    tables = []
+    for ranges in (v4, v6):
+        ranges.sort()
+        clean = []
+        for record in ranges:
+            if clean and record[0] <= clean[-1][1]:
+                skipped += 1
+                continue
+            clean.append(record)
+        tables.append(clean)
+    v4, v6 = tables
+
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(v4), len(v6), len(locations), len(strings)))
+        for record in v4:
+            f.write(V4_RECORD.pack(*record))
+        for record in v6:
+            f.write(V6_RECORD.pack(*record))
+        for record in locations:
+            f.write(LOCATION_RECORD.pack(*record))
+        f.write(strings)
+    os.replace(tmp_path, output_path)
+    return len(v4), len(v6), skipped
+
+
+# Consulta
+
+class GeoIPDatabase:
+    """Arquivo de faixas compilado, mapeado em memória (somente leitura)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.v4_count, self.v6_count, self.location_count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'Arquivo GeoIP inválido: {path}')
+        self._v4_offset = HEADER.size
+        self._v6_offset = self._v4_offset + self.v4_count * V4_RECORD.size
+        self._locations_offset = self._v6_offset + self.v6_count * V6_RECORD.size
+        self._strings_offset = self._locations_offset + self.location_count * LOCATION_RECORD.size
+
+    def close(self):
+        self._mm.close()
+
+    def _search(self, record, offset, count, key):
+        """Busca binária pela última faixa com início <= key"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if record.unpack_from(self._mm, offset + mid * record.size)[0] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        start, end, index = record.unpack_from(self._mm, offset + (lo - 1) * record.size)
+        return index if key <= end else None
+
+    def _string(self, offset):
+        position = self._strings_offset + offset
+        (length,) = STRING_LENGTH.unpack_from(self._mm, position)
+        return self._mm[position + STRING_LENGTH.size:position + STRING_LENGTH.size + length].decode('utf-8')
+
+    def lookup(self, ip):
+        """Retorna {'city','region','country','lat','lng'} ou None se o IP não estiver na base"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        if address.version == 4:
+            index = self._search(V4_RECORD, self._v4_offset, self.v4_count, int(address))
+        else:
+            index = self._search(V6_RECORD, self._v6_offset, self.v6_count, address.packed)
+        if index is None:
+            return None
+
+        city, region, country, lat, lng = LOCATION_RECORD.unpack_from(
+            self._mm, self._locations_offset + index * LOCATION_RECORD.size)
+        return {
+            'city': self._string(city),
+            'region': self._string(region),
+            'country': self._string(country),
+            'lat': None if math.isnan(lat) else round(lat, 4),
+            'lng': None if math.isnan(lng) else round(lng, 4)
+        }
+
+
+# Instância do processo, aberta no primeiro uso
+_database = None
+_database_lock = threading.Lock()
+_database_missing = False
+
+
+def get_database(path):
+    """Abre (uma vez) a base configurada; None se o arquivo não existir"""
+    global _database, _database_missing
+    if _database is None and not _database_missing:
+        with _database_lock:
+            if _database is None and not _database_missing:
+                if path and os.path.isfile(path):
+                    _database = GeoIPDatabase(path)
+                else:
+                    _database_missing = True
+                    print(f'Base GeoIP local não encontrada em {path}, usando apenas os demais provedores')
+    return _database
+
+
+def lookup(ip, path):
+    """Consulta a base local; None se o IP não for encontrado ou a base não existir"""
+    database = get_database(path)
+    if database is None:
+        return None
+    return database.lookup(ip)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Base GeoIP offline do AMFA')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compile_parser = subparsers.add_parser('compile', help='Compila CSV(s) em um arquivo binário')
+    compile_parser.add_argument('--format', choices=['simple', 'geolite2', 'ip2location'], default='simple')
+    compile_parser.add_argument('--locations', help='Arquivo Locations do GeoLite2 (formato geolite2)')
+    compile_parser.add_argument('inputs', nargs='+')
+    compile_parser.add_argument('output')
+
+    lookup_parser = subparsers.add_parser('lookup', help='Consulta um IP em um arquivo compilado')
+    lookup_parser.add_argument('database')
+    lookup_parser.add_argument('ip')
+
+    args = parser.parse_args()
+    if args.command == 'compile':
+        if args.format == 'geolite2':
+            if not args.locations:
+                parser.error('--locations é obrigatório no formato geolite2')
+            rows = _read_geolite2(args.inputs, args.locations)
+        elif args.format == 'ip2location':
+            rows = _read_ip2location(args.inputs)
+        else:
+            rows = _read_simple(args.inputs)
+        v4_count, v6_count, skipped = compile_database(rows, args.output)
+        print(f'{v4_count} faixas IPv4 e {v6_count} faixas IPv6 gravadas em {args.output} '
+              f'({skipped} sobrepostas ignoradas)')
+    else:
+        print(GeoIPDatabase(args.database).lookup(args.ip))
@@ -0,0 +1,184 @@
+"""
+Serviço de hash de senhas em um pool de processos dedicado.
+
+O bcrypt (custo BCRYPT_LOG_ROUNDS) consome ~250 ms de CPU por chamada. Rodar
+em um pool de processos com tamanho fixo limita quantos núcleos o hash pode
+ocupar, e as threads das requisições apenas aguardam o resultado, deixando
+rotas baratas (/me, arquivos estáticos) livres para responder.
+
+A fila é limitada: se não houver vaga em HASHING_QUEUE_TIMEOUT segundos, ou o
+hash não terminar em HASHING_TIMEOUT segundos, HashingUnavailable é lançada
+e a rota responde 503. Se um processo do pool morrer (OOM, falha na
+importação), o pool fica quebrado: a requisição atual recebe 503 e o pool é
+recriado na chamada seguinte.
+
+Os processos do pool são criados pelo método HASHING_START_METHOD
+('forkserver' por padrão, 'spawn' onde não existe): um fork direto do worker
+copiaria threads em andamento (auditoria, fila de e-mail) e locks que podem
+estar presos no momento do fork.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from config import Config
+from metrics import span
+
+# Quantidade de amostras mantidas para as estatísticas de tempo
+TIMING_SAMPLES = 1000
+
+
+class HashingUnavailable(Exception):
+    """O pool de hash está saturado ou não respondeu a tempo"""
+
+
+# Funções executadas nos processos do pool (precisam ser de nível de módulo)
+
+def _hash_password(password, rounds):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, started, time.time()
+
+
+def _check_password(password, hashed):
+    started = time.time()
+    valid = bcrypt.checkpw(password, hashed)
+    return valid, started, time.time()
+
+
+def _mp_context():
+    method = Config.HASHING_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = 'spawn'
+    return multiprocessing.get_context(method)
+
+
+class HashingService:
+    """Pool de processos limitado para bcrypt, com fila, timeouts e métricas"""
+
+    def __init__(self, workers=None, max_pending=None, timeout=None, queue_timeout=None):
+        self.workers = workers or Config.HASHING_WORKERS
+        self.max_pending = max_pending or Config.HASHING_MAX_PENDING
+        self.timeout = timeout or Config.HASHING_TIMEOUT
+        self.queue_timeout = Config.HASHING_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._queue_waits = deque(maxlen=TIMING_SAMPLES)
+        self._hash_times = deque(maxlen=TIMING_SAMPLES)
+        self._pending = 0
+        self._counters = {'submitted': 0, 'completed': 0, 'rejected': 0, 'timeouts': 0, 'broken': 0}
+
+    def _get_executor(self):
+        # O pool não sobrevive ao fork (ex.: gunicorn com preload): recria por processo
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                    self._slots = threading.BoundedSemaphore(self.max_pending)
+                    self._pending = 0
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        """Descarta o pool quebrado; a próxima chamada cria outro"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._pid = None
+            self._counters['broken'] += 1
+        print('Pool de hash quebrado (processo encerrado); será recriado')
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(timeout=self.queue_timeout):
+            self._count('rejected')
+            raise HashingUnavailable('Fila de hash cheia')
+
+        submitted = time.time()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._discard(executor)
+            raise HashingUnavailable('Pool de hash indisponível')
+        except Exception:
+            slots.release()
+            raise
+        with self._lock:
+            self._pending += 1
+            self._counters['submitted'] += 1
+
+        def release(_):
+            with self._lock:
+                # Um pool recriado começa com a contagem zerada
+                if self._slots is slots:
+                    self._pending -= 1
+            slots.release()
+
+        # A vaga só é liberada quando o processo termina, mesmo após timeout
+        future.add_done_callback(release)
+
+        try:
+            result, started, finished = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            raise HashingUnavailable('Tempo esgotado aguardando o hash')
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingUnavailable('Pool de hash indisponível')
+
+        self._count('completed')
+        self._queue_waits.append(max(0.0, started - submitted))
+        self._hash_times.append(finished - started)
+        return result
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def hash_password(self, password):
+        """Gera o hash bcrypt da senha (str) e retorna como str"""
+        with span('bcrypt_hash'):
+            hashed = self._run(_hash_password, password.encode('utf-8'), Config.BCRYPT_LOG_ROUNDS)
+        return hashed.decode('utf-8')
+
+    def check_password(self, password, hashed):
+        """Verifica a senha (str) contra o hash (str ou bytes)"""
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        with span('bcrypt_check'):
+            return self._run(_check_password, password.encode('utf-8'), hashed)
+
+    def stats(self):
+        def summary(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {'avg': None, 'p95': None, 'max': None}
+            return {
+                'avg': sum(ordered) / len(ordered),
+                'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                'max': ordered[-1]
+            }
+
+        with self._lock:
+            pending, counters = self._pending, dict(self._counters)
+        return {
+            'workers': self.workers,
+            'pending': pending,
+            **counters,
+            'queue_wait': summary(self._queue_waits),
+            'hash_time': summary(self._hash_times)
+        }
+
+
+# Instância compartilhada pelo processo (o pool é criado no primeiro uso)
+hashing_service = HashingService()
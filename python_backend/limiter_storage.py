@@ -0,0 +1,217 @@
+"""
+Armazenamento do flask-limiter compartilhado pelos workers.
+
+Com `memory://` cada worker do gunicorn aplica o próprio limite (o
+"200 per hour" vira 200 x número de workers). RATELIMIT_STORAGE_URI escolhe:
+
+- 'sqlite:///<arquivo>': SqliteStorage, um arquivo SQLite local (WAL)
+  compartilhado pelos workers do host. Contadores de janela fixa com um
+  único UPSERT atômico; janela móvel com uma linha por requisição, contada e
+  inserida dentro de uma transação BEGIN IMMEDIATE (um escritor por vez)
+- 'redis://host:porta': RedisStorage do próprio `limits` (pacote `redis`),
+  para limites compartilhados entre hosts; funciona com qualquer servidor do
+  protocolo Redis (ex.: um redis-server/valkey local nos testes)
+- 'memory://': contadores por processo, como antes
+
+As duas estratégias (RATELIMIT_STRATEGY 'moving-window' e 'fixed-window')
+funcionam com os três. StorageTimer mede o tempo de cada operação no
+armazenamento, isto é, o custo que o limitador soma a cada requisição.
+"""
+import os
+import sqlite3
+import threading
+import time
+from limits.storage import MovingWindowSupport, Storage
+from config import Config
+
+
+class SqliteStorage(Storage, MovingWindowSupport):
+    """Contadores e janelas do limitador em um arquivo SQLite local"""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        # sqlite:////caminho/absoluto.db ou sqlite:///relativo.db
+        self.path = uri.split('://', 1)[1][1:]
+        if not self.path:
+            raise ValueError(f'Caminho do SQLite ausente em {uri}')
+        self._local = threading.local()
+        self._cleaned_at = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS counters ('
+            'key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT NOT NULL, ts REAL NOT NULL, expires_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_key_ts ON entries (key, ts)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_expires_at ON entries (expires_at)')
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # Uma conexão por thread e por processo (conexões não sobrevivem a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _cleanup_if_due(self, conn, now):
+        """Apaga contadores e entradas expirados (no máximo uma vez por intervalo no processo)"""
+        if now - self._cleaned_at < Config.RATELIMIT_CLEANUP_SECONDS:
+            return
+        self._cleaned_at = now
+        conn.execute('DELETE FROM counters WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+
+    # Janela fixa
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        conn = self._connection()
+        self._cleanup_if_due(conn, now)
+        # Um só comando: atômico entre os workers sem transação explícita
+        (value,) = conn.execute(
+            'INSERT INTO counters (key, value, expires_at) VALUES (:key, :amount, :expires_at) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = CASE WHEN counters.expires_at <= :now THEN :amount ELSE counters.value + :amount END, '
+            'expires_at = CASE WHEN counters.expires_at <= :now THEN :expires_at ELSE counters.expires_at END '
+            'RETURNING value',
+            {'key': key, 'amount': amount, 'expires_at': now + expiry, 'now': now}
+        ).fetchone()
+        return value
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM counters WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            'SELECT expires_at FROM counters WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    # Janela móvel
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        conn = self._connection()
+        self._cleanup_if_due(conn, now)
+        # BEGIN IMMEDIATE pega o lock de escrita antes da contagem: contar e inserir é atômico
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            (count,) = conn.execute(
+                'SELECT COUNT(*) FROM entries WHERE key = ? AND ts > ?', (key, now - expiry)
+            ).fetchone()
+            if count + amount > limit:
+                conn.execute('ROLLBACK')
+                return False
+            conn.executemany(
+                'INSERT INTO entries (key, ts, expires_at) VALUES (?, ?, ?)',
+                [(key, now, now + expiry)] * amount
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def get_moving_window(self, key, limit, expiry):
+        """(início da janela, entradas na janela)"""
+        now = time.time()
+        oldest, count = self._connection().execute(
+            'SELECT MIN(ts), COUNT(*) FROM entries WHERE key = ? AND ts > ?', (key, now - expiry)
+        ).fetchone()
+        return (oldest, count) if count else (now, 0)
+
+    # Manutenção
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        conn = self._connection()
+        deleted = conn.execute('DELETE FROM counters').rowcount
+        deleted += conn.execute('DELETE FROM entries').rowcount
+        return deleted
+
+    def clear(self, key):
+        conn = self._connection()
+        conn.execute('DELETE FROM counters WHERE key = ?', (key,))
+        conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+
+class StorageTimer:
+    """Tempo gasto pelo limitador em cada operação do armazenamento"""
+
+    OPERATIONS = ('incr', 'get', 'get_expiry', 'acquire_entry', 'get_moving_window', 'clear')
+
+    def __init__(self):
+        self.storage_name = None
+        self._operations = {}
+        # As threads das requisições medem ao mesmo tempo; a seção é curta perto da operação medida
+        self._lock = threading.Lock()
+
+    def instrument(self, storage):
+        """Envolve os métodos da instância do armazenamento com a medição"""
+        self.storage_name = type(storage).__name__
+        for name in self.OPERATIONS:
+            method = getattr(storage, name, None)
+            if method is not None:
+                setattr(storage, name, self._timed(name, method))
+        return storage
+
+    def _timed(self, name, method):
+        counters = self._operations.setdefault(name, {'calls': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    counters['calls'] += 1
+                    counters['errors'] += failed
+                    counters['total'] += elapsed
+                    if elapsed > counters['max']:
+                        counters['max'] = elapsed
+        return timed
+
+    def stats(self):
+        with self._lock:
+            snapshot = {name: dict(counters) for name, counters in self._operations.items()}
+        operations = {}
+        for name, counters in snapshot.items():
+            if counters['calls']:
+                operations[name] = {
+                    'calls': counters['calls'],
+                    'errors': counters['errors'],
+                    'avg_us': round(counters['total'] / counters['calls'] * 1e6, 1),
+                    'max_us': round(counters['max'] * 1e6, 1)
+                }
+        return {'storage': self.storage_name, 'operations': operations}
+
+
+# Medição do armazenamento do limitador da aplicação (ver app.py)
+storage_timer = StorageTimer()
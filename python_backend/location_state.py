@@ -0,0 +1,97 @@
+"""
+Estado de localização por usuário para as verificações de viagem impossível
+e proximidade.
+
+Em vez de varrer access_logs das últimas 48 h / 30 dias e desserializar o
+JSON de cada linha, as verificações leem no máximo LOCATION_STATE_SIZE
+linhas de user_locations, que guarda as coordenadas dos logins mais
+recentes de cada usuário.
+
+A tabela é atualizada sempre que um AccessLog com coordenadas é inserido
+(evento after_insert do SQLAlchemy, ou record_locations() para inserções em
+lote) e é cortada para os LOCATION_STATE_SIZE logins bem-sucedidos e os
+LOCATION_STATE_SIZE falhos mais recentes: as falhas (que qualquer um pode
+gerar, de qualquer IP) não apagam as localizações confiáveis usadas pela
+verificação de proximidade. As
+leituras passam por um cache do processo, invalidado a cada escrita local;
+escritas de outros workers aparecem após LOCATION_STATE_CACHE_TTL segundos.
+"""
+from sqlalchemy import event, select, delete
+from cache import TTLCache
+from config import Config
+from models import db, AccessLog, UserLocation, generate_uuid
+
+location_state_cache = TTLCache(
+    max_entries=Config.LOCATION_STATE_CACHE_MAX_ENTRIES,
+    ttl=Config.LOCATION_STATE_CACHE_TTL,
+    negative_ttl=Config.LOCATION_STATE_CACHE_TTL
+)
+
+
+def _has_coordinates(location):
+    # Mesmo critério das verificações originais (lat/lng ausentes ou zero são ignorados)
+    return bool(location and location.get('lat') and location.get('lng'))
+
+
+def record_locations(connection, logs):
+    """Grava no estado as coordenadas de logs recém-inseridos.
+
+    `logs` é uma lista de dicts com id, user_id, ip_address, location,
+    success e login_time (mesmos campos de AccessLog).
+    """
+    rows = [
+        {
+            'id': generate_uuid(),
+            'user_id': log['user_id'],
+            'access_log_id': log['id'],
+            'ip_address': log.get('ip_address'),
+            'lat': float(log['location']['lat']),
+            'lng': float(log['location']['lng']),
+            'success': log['success'],
+            'login_time': log['login_time']
+        }
+        for log in logs
+        if log.get('user_id') and _has_coordinates(log.get('location'))
+    ]
+    if not rows:
+        return
+
+    table = UserLocation.__table__
+    connection.execute(table.insert(), rows)
+
+    # Mantém apenas os registros mais recentes de cada usuário afetado, separando
+    # sucessos e falhas
+    for user_id, success in {(row['user_id'], bool(row['success'])) for row in rows}:
+        group = (table.c.user_id == user_id, table.c.success == success)
+        keep = select(table.c.id).where(*group) \
+            .order_by(table.c.login_time.desc()).limit(Config.LOCATION_STATE_SIZE)
+        connection.execute(delete(table).where(*group, table.c.id.not_in(keep)))
+        location_state_cache.delete(user_id)
+
+
+@event.listens_for(AccessLog, 'after_insert')
+def _access_log_inserted(mapper, connection, target):
+    record_locations(connection, [{
+        'id': target.id,
+        'user_id': target.user_id,
+        'ip_address': target.ip_address,
+        'location': target.location,
+        'success': target.success,
+        'login_time': target.login_time
+    }])
+
+
+def _load_recent_locations(user_id):
+    table = UserLocation.__table__
+    rows = db.session.execute(
+        select(table.c.login_time, table.c.lat, table.c.lng, table.c.success)
+        .where(table.c.user_id == user_id)
+        .order_by(table.c.login_time.desc())
+        .limit(2 * Config.LOCATION_STATE_SIZE)
+    ).all()
+    return [tuple(row) for row in rows]
+
+
+def recent_locations(user_id):
+    """Retorna [(login_time, lat, lng, success)] do mais recente para o mais antigo"""
+    return location_state_cache.get_or_load(user_id, _load_recent_locations)
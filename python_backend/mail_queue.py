@@ -0,0 +1,453 @@
+"""
+Fila de entrega de emails em segundo plano.
+
+As mensagens são gravadas em um diretório de spool (uma mensagem por arquivo
+JSON) e entregues por um conjunto de workers que mantêm conexões SMTP
+autenticadas abertas e as reutilizam entre envios. Falhas temporárias são
+reagendadas com backoff exponencial; falhas permanentes vão para `failed/`.
+
+Layout do spool:
+    tmp/       arquivos em escrita (renomeados atomicamente para pending/)
+    pending/   mensagens aguardando entrega
+    inflight/  mensagens reservadas por um worker (claim via os.rename)
+    failed/    mensagens que esgotaram as tentativas
+"""
+import atexit
+import heapq
+import json
+import os
+import queue
+import random
+import smtplib
+import sys
+import threading
+import time
+import uuid
+from binascii import b2a_base64
+from collections import deque
+from email.header import Header
+from email.utils import formatdate
+from functools import lru_cache
+from config import Config
+import metrics
+
+SPOOL_SUBDIRS = ('tmp', 'pending', 'inflight', 'failed')
+
+# Tempo após o qual uma mensagem em inflight/ é considerada abandonada
+# (processo que a reservou morreu) e volta para pending/
+INFLIGHT_STALE_SECONDS = 10 * 60
+
+# Intervalo entre varreduras do spool em busca de mensagens órfãs
+SPOOL_RESCAN_SECONDS = 60
+
+# Quantidade de amostras de latência mantidas para as estatísticas
+LATENCY_SAMPLES = 1000
+
+
+class PermanentDeliveryError(Exception):
+    """Erro de entrega que não deve ser repetido (ex.: destinatário recusado)"""
+
+
+# Cabeçalhos fixos das partes (montados uma vez); o corpo vai em base64 (UTF-8)
+_TEXT_PART_HEADERS = (
+    b'Content-Type: text/plain; charset="utf-8"\r\n'
+    b'Content-Transfer-Encoding: base64\r\n\r\n'
+)
+_HTML_PART_HEADERS = (
+    b'Content-Type: text/html; charset="utf-8"\r\n'
+    b'Content-Transfer-Encoding: base64\r\n\r\n'
+)
+
+# Bytes de entrada por linha de base64 (76 caracteres, limite da RFC 2045)
+_BASE64_LINE = 57
+
+
+@lru_cache(maxsize=256)
+def _encode_header(value):
+    """Cabeçalho codificado (RFC 2047 quando não é ASCII); os assuntos se repetem"""
+    # Uma quebra de linha no valor criaria cabeçalhos novos (ex.: "Bcc:") na mensagem
+    if '\r' in value or '\n' in value:
+        raise PermanentDeliveryError(f'Quebra de linha no cabeçalho: {value!r}')
+    if value.isascii():
+        return value.encode('ascii')
+    # Cabeçalhos longos são dobrados: a quebra precisa ser CRLF (o smtplib não normaliza bytes)
+    return Header(value, 'utf-8').encode(linesep='\r\n').encode('ascii')
+
+
+def _base64_body(text):
+    data = text.encode('utf-8')
+    return b'\r\n'.join(
+        b2a_base64(data[i:i + _BASE64_LINE], newline=False)
+        for i in range(0, len(data), _BASE64_LINE)
+    )
+
+
+def _message_domain():
+    return Config.SMTP_FROM.rpartition('@')[2] or 'localhost'
+
+
+def build_message(record):
+    """
+    Monta a mensagem pronta para o SMTP (bytes, linhas CRLF) a partir de um
+    registro do spool: multipart/alternative com texto puro (se houver) e HTML.
+
+    Os cabeçalhos das partes são constantes e o assunto codificado fica em
+    cache; a mensagem é montada com um único join, sem a árvore de objetos do
+    pacote email. O Message-ID vem do id do registro (o mesmo em cada nova
+    tentativa) e a data é a do enfileiramento.
+    """
+    boundary = f"==amfa-{record['id']}==".encode('ascii')
+    chunks = [
+        b'Subject: ', _encode_header(record['subject']), b'\r\n',
+        b'From: ', _encode_header(f"Cyber Security Platform <{Config.SMTP_FROM}>"), b'\r\n',
+        b'To: ', _encode_header(record['to']), b'\r\n',
+        b'Date: ', formatdate(record['enqueued_at'], localtime=True).encode('ascii'), b'\r\n',
+        f"Message-ID: <{record['id']}@{_message_domain()}>\r\n".encode('ascii'),
+        b'MIME-Version: 1.0\r\n',
+        b'Content-Type: multipart/alternative; boundary="', boundary, b'"\r\n\r\n',
+    ]
+    # Registros antigos do spool não têm a versão em texto
+    if record.get('text'):
+        chunks += [b'--', boundary, b'\r\n', _TEXT_PART_HEADERS, _base64_body(record['text']), b'\r\n']
+    chunks += [
+        b'--', boundary, b'\r\n', _HTML_PART_HEADERS, _base64_body(record['html']), b'\r\n',
+        b'--', boundary, b'--\r\n',
+    ]
+    return b''.join(chunks)
+
+
+class SMTPConnection:
+    """Conexão SMTP autenticada, aberta sob demanda e reutilizada entre envios"""
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        if Config.SMTP_SECURE:
+            server = smtplib.SMTP_SSL(Config.SMTP_HOST, Config.SMTP_PORT, timeout=30)
+        else:
+            server = smtplib.SMTP(Config.SMTP_HOST, Config.SMTP_PORT, timeout=30)
+            if Config.SMTP_STARTTLS:
+                server.starttls()
+        if Config.SMTP_USER:
+            server.login(Config.SMTP_USER, Config.SMTP_PASSWORD)
+        return server
+
+    def _ensure(self):
+        # Conexões ociosas por muito tempo costumam ser derrubadas pelo relay;
+        # confirma com NOOP antes de reutilizar
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            try:
+                alive = self._server.noop()[0] == 250
+            except smtplib.SMTPException:
+                alive = False
+            except OSError:
+                alive = False
+            if not alive:
+                self.close()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def send(self, to_email, payload):
+        """Envia a mensagem já montada, reconectando uma vez se o servidor fechou a conexão"""
+        try:
+            self._ensure().sendmail(Config.SMTP_FROM, [to_email], payload)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._ensure().sendmail(Config.SMTP_FROM, [to_email], payload)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._server = None
+
+
+class MailQueue:
+    """Fila durável de emails com pool de workers e conexões SMTP persistentes"""
+
+    def __init__(self, spool_dir=None, workers=None, max_retries=None):
+        self.spool_dir = spool_dir or Config.MAIL_SPOOL_DIR
+        self.workers = workers or Config.MAIL_WORKERS
+        self.max_retries = Config.MAIL_MAX_RETRIES if max_retries is None else max_retries
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self._ready = queue.Queue()
+        self._delayed = []
+        self._delayed_cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        # Ids na fila ou reagendados neste processo (a varredura do spool não os repete)
+        self._queued = set()
+        self._inflight = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        # Protege _queued, _inflight e _counters (workers, agendador e rotas)
+        self._state_lock = threading.Lock()
+
+    def _path(self, subdir, msg_id):
+        return os.path.join(self.spool_dir, subdir, f'{msg_id}.json')
+
+    # Ciclo de vida
+
+    def start(self):
+        """Inicia os workers (uma vez por processo; seguro após fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads não sobrevivem ao fork: recria o estado no processo filho
+            self._reset_state()
+            for subdir in SPOOL_SUBDIRS:
+                os.makedirs(os.path.join(self.spool_dir, subdir), exist_ok=True)
+            self._recover_spool()
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'mail-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            scheduler = threading.Thread(target=self._scheduler_loop, name='mail-scheduler', daemon=True)
+            scheduler.start()
+            self._threads.append(scheduler)
+            self._pid = os.getpid()
+
+    def stop(self, timeout=10):
+        """Sinaliza parada e aguarda os workers terminarem a mensagem atual"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        with self._delayed_cond:
+            self._delayed_cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._pid = None
+
+    # API pública
+
+    def enqueue(self, to_email, subject, html_body, text_body=None):
+        """Grava a mensagem no spool e a coloca na fila; retorna o id da mensagem"""
+        self.start()
+        msg_id = f'{time.time_ns()}-{uuid.uuid4().hex}'
+        record = {
+            'id': msg_id,
+            'to': to_email,
+            'subject': subject,
+            'html': html_body,
+            'text': text_body,
+            'attempts': 0,
+            'enqueued_at': time.time(),
+            'next_attempt_at': 0,
+        }
+        self._write_record('pending', record)
+        self._count('enqueued')
+        self._put_ready(msg_id)
+        return msg_id
+
+    def stats(self):
+        """Profundidade da fila, contadores e latência de entrega (neste processo)"""
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        with self._state_lock:
+            inflight, counters = self._inflight, dict(self._counters)
+        return {
+            'depth': self._ready.qsize() + len(self._delayed) + inflight,
+            'ready': self._ready.qsize(),
+            'delayed': len(self._delayed),
+            'inflight': inflight,
+            **counters,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+    def spool_depth(self):
+        """Conta os arquivos em cada diretório do spool (visão de todos os processos)"""
+        depth = {}
+        for subdir in ('pending', 'inflight', 'failed'):
+            try:
+                with os.scandir(os.path.join(self.spool_dir, subdir)) as entries:
+                    depth[subdir] = sum(1 for e in entries if e.name.endswith('.json'))
+            except FileNotFoundError:
+                depth[subdir] = 0
+        return depth
+
+    # Spool
+
+    def _write_record(self, subdir, record):
+        tmp_path = self._path('tmp', f"{record['id']}.{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(subdir, record['id']))
+
+    def _recover_spool(self):
+        """Devolve mensagens abandonadas a pending/ e enfileira as pendentes que este processo ainda não tem"""
+        now = time.time()
+        inflight_dir = os.path.join(self.spool_dir, 'inflight')
+        for entry in os.scandir(inflight_dir):
+            try:
+                if entry.name.endswith('.json') and now - entry.stat().st_mtime > INFLIGHT_STALE_SECONDS:
+                    os.rename(entry.path, os.path.join(self.spool_dir, 'pending', entry.name))
+            except FileNotFoundError:
+                pass
+        for entry in os.scandir(os.path.join(self.spool_dir, 'pending')):
+            if entry.name.endswith('.json'):
+                self._put_ready(entry.name[:-len('.json')])
+
+    def _claim(self, msg_id):
+        """Reserva a mensagem para este worker; None se outro processo já a pegou"""
+        inflight_path = self._path('inflight', msg_id)
+        try:
+            os.rename(self._path('pending', msg_id), inflight_path)
+        except FileNotFoundError:
+            return None
+        # Atualiza o mtime para que a mensagem não pareça abandonada
+        os.utime(inflight_path)
+        with open(inflight_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _put_ready(self, msg_id):
+        with self._state_lock:
+            if msg_id in self._queued:
+                return
+            self._queued.add(msg_id)
+        self._ready.put(msg_id)
+
+    def _count(self, name):
+        with self._state_lock:
+            self._counters[name] += 1
+
+    def _schedule(self, msg_id, when):
+        with self._state_lock:
+            self._queued.add(msg_id)
+        with self._delayed_cond:
+            heapq.heappush(self._delayed, (when, msg_id))
+            self._delayed_cond.notify()
+
+    def _backoff(self, attempts):
+        delay = min(Config.MAIL_RETRY_MAX_BACKOFF_SECONDS,
+                    Config.MAIL_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    # Threads
+
+    def _scheduler_loop(self):
+        """Move mensagens reagendadas para a fila quando chega a hora e varre o spool"""
+        next_rescan = time.monotonic() + SPOOL_RESCAN_SECONDS
+        while not self._stop.is_set():
+            with self._delayed_cond:
+                now = time.time()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.put(heapq.heappop(self._delayed)[1])
+                wait = self._delayed[0][0] - now if self._delayed else SPOOL_RESCAN_SECONDS
+                self._delayed_cond.wait(min(wait, SPOOL_RESCAN_SECONDS))
+            if time.monotonic() >= next_rescan:
+                next_rescan = time.monotonic() + SPOOL_RESCAN_SECONDS
+                try:
+                    self._recover_spool()
+                except OSError as e:
+                    print(f'Falha ao varrer o spool de emails: {e}')
+
+    def _worker_loop(self):
+        connection = SMTPConnection(Config.MAIL_CONNECTION_IDLE_SECONDS)
+        try:
+            while not self._stop.is_set():
+                try:
+                    msg_id = self._ready.get(timeout=1)
+                except queue.Empty:
+                    # Fecha conexões ociosas para não segurar sockets no relay
+                    if connection._server is not None and \
+                            time.monotonic() - connection._last_used > connection.idle_timeout:
+                        connection.close()
+                    continue
+                with self._state_lock:
+                    self._queued.discard(msg_id)
+                    self._inflight += 1
+                try:
+                    self._process(msg_id, connection)
+                except Exception as e:
+                    print(f'Erro inesperado na fila de emails ({msg_id}): {e}')
+                finally:
+                    with self._state_lock:
+                        self._inflight -= 1
+        finally:
+            connection.close()
+
+    def _process(self, msg_id, connection):
+        record = self._claim(msg_id)
+        if record is None:
+            return
+
+        # Mensagem reagendada por outro processo ainda fora da janela de retry
+        if record.get('next_attempt_at', 0) > time.time():
+            os.rename(self._path('inflight', msg_id), self._path('pending', msg_id))
+            self._schedule(msg_id, record['next_attempt_at'])
+            return
+
+        try:
+            with metrics.span('smtp_send'):
+                connection.send(record['to'], build_message(record))
+        except Exception as e:
+            connection.close()
+            metrics.inc('amfa_emails_delivered_total', (('result', 'error'),))
+            self._handle_failure(record, e)
+            return
+        metrics.inc('amfa_emails_delivered_total', (('result', 'sent'),))
+
+        os.unlink(self._path('inflight', msg_id))
+        self._count('sent')
+        self._latencies.append(time.time() - record['enqueued_at'])
+        print(f"Email sent to {record['to']}: {record['subject']}")
+
+    def _handle_failure(self, record, error):
+        msg_id = record['id']
+        record['attempts'] += 1
+        record['last_error'] = str(error)
+
+        permanent = isinstance(error, (smtplib.SMTPRecipientsRefused, PermanentDeliveryError)) or (
+            isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+        )
+        if permanent or record['attempts'] > self.max_retries:
+            self._write_record('failed', record)
+            os.unlink(self._path('inflight', msg_id))
+            self._count('failed')
+            print(f"Failed to send email to {record['to']} após {record['attempts']} tentativa(s): {error}")
+            return
+
+        record['next_attempt_at'] = time.time() + self._backoff(record['attempts'])
+        self._write_record('pending', record)
+        os.unlink(self._path('inflight', msg_id))
+        self._count('retried')
+        self._schedule(msg_id, record['next_attempt_at'])
+        print(f"Falha temporária ao enviar email para {record['to']} (tentativa {record['attempts']}): {error}")
+
+
+# Instância compartilhada pelo processo (os workers iniciam no primeiro envio)
+mail_queue = MailQueue()
+atexit.register(mail_queue.stop)
+
+
+if __name__ == '__main__':
+    # Uso: python mail_queue.py status
+    if len(sys.argv) > 1 and sys.argv[1] == 'status':
+        for name, count in mail_queue.spool_depth().items():
+            print(f'{name}: {count}')
+    else:
+        print('Uso: python mail_queue.py status')
@@ -0,0 +1,547 @@
+"""
+Métricas da aplicação no formato de texto do Prometheus (GET /metrics).
+
+Três fontes:
+
+- requisições: histograma de latência por rota (endpoint do Flask), método e
+  status, medido entre o before_request e o after_request
+- estágios: `span('nome')` / `@timed('nome')` em volta das etapas caras
+  (bcrypt, geolocalização, verificação de força bruta, sessão, SMTP...) e um
+  histograma por consulta SQL (eventos do engine), todos com a rota da
+  requisição que os originou; as tarefas do pipeline do login herdam a rota
+- contadores de eventos (`inc`: logins por resultado, bloqueios, emails) e,
+  na hora da coleta, os stats() dos serviços (cache de localização, fila de
+  email, pool de bcrypt, auditoria, sessões, limitador...) como gauges
+
+A coleta não usa lock no caminho da requisição: cada thread grava nos seus
+próprios dicionários (só ela escreve neles) e o /metrics soma os de todas as
+threads. Os dados de threads encerradas são incorporados a um acumulado na
+coleta seguinte (ou quando muitas threads já passaram pelo registro).
+
+Com vários workers (gunicorn), METRICS_DIR aponta para um diretório
+compartilhado pelos processos do host: cada processo grava os seus números
+em metrics-<pid>.json a cada METRICS_SYNC_SECONDS (e ao sair), e a coleta
+soma os arquivos de todos (os dos outros workers com até esse atraso). Os de processos encerrados são incorporados a
+metrics-retired.json (com flock), assim os contadores não voltam quando um
+worker é reciclado. Os gauges (stats() dos serviços) são do processo: saem
+com o rótulo pid e só dos processos vivos. Sem METRICS_DIR cada coleta
+responde com os números do processo que a atendeu.
+"""
+import atexit
+import functools
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock na agregação entre processos
+    fcntl = None
+
+# Limites superiores dos buckets dos histogramas (segundos)
+BUCKETS = Config.METRICS_BUCKETS
+
+# Rota da requisição em andamento ('-' fora de requisições: threads de fundo)
+_route = ContextVar('metrics_route', default='-')
+
+# Descrição das métricas: nome -> (tipo, ajuda)
+_DESCRIPTIONS = {}
+
+# Threads registradas além das quais os dados das encerradas são acumulados no registro
+_COMPACT_AFTER = 64
+
+
+def describe(name, kind, help_text):
+    _DESCRIPTIONS[name] = (kind, help_text)
+
+
+describe('amfa_http_request_duration_seconds', 'histogram', 'Duração das requisições por rota, método e status')
+describe('amfa_stage_duration_seconds', 'histogram', 'Duração dos estágios instrumentados por rota')
+describe('amfa_db_query_duration_seconds', 'histogram', 'Duração das consultas SQL por rota e operação')
+describe('amfa_logins_total', 'counter', 'Tentativas de login por resultado')
+describe('amfa_security_blocks_total', 'counter', 'Bloqueios por força bruta criados (por e-mail ou por IP)')
+describe('amfa_emails_total', 'counter', 'Emails enfileirados por template')
+describe('amfa_emails_delivered_total', 'counter', 'Tentativas de entrega SMTP por resultado')
+
+
+# Coleta por thread
+
+class _Shard:
+    """Dados gravados por uma thread"""
+
+    __slots__ = ('thread', 'histograms', 'counters')
+
+    def __init__(self, thread):
+        self.thread = thread
+        # (nome, rótulos) -> [contagem por bucket..., +Inf, soma]
+        self.histograms = {}
+        # (nome, rótulos) -> valor
+        self.counters = {}
+
+    def merge(self, other):
+        for key, values in list(other.histograms.items()):
+            target = self.histograms.get(key)
+            if target is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    target[i] += value
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+_local = threading.local()
+_shards = []
+_retired = _Shard(None)
+_shards_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """O processo filho começa do zero: os números herdados são do pai (que grava os próprios)"""
+    global _local, _shards, _retired, _shards_lock
+    _local = threading.local()
+    _shards = []
+    _retired = _Shard(None)
+    _shards_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _compact():
+    """Incorpora ao acumulado os dados de threads encerradas; chamar com o lock adquirido"""
+    alive = []
+    for shard in _shards:
+        if shard.thread.is_alive():
+            alive.append(shard)
+        else:
+            _retired.merge(shard)
+    _shards[:] = alive
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard(threading.current_thread())
+        with _shards_lock:
+            if len(_shards) >= _COMPACT_AFTER:
+                _compact()
+            _shards.append(shard)
+        _start_sync()
+        return shard
+
+
+def observe(name, labels, seconds):
+    """Registra uma duração no histograma `name` (labels: tupla de pares (rótulo, valor))"""
+    histograms = _shard().histograms
+    key = (name, labels)
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(BUCKETS) + 2)
+    values[bisect_left(BUCKETS, seconds)] += 1
+    values[-1] += seconds
+
+
+def inc(name, labels=(), amount=1):
+    """Incrementa o contador `name`"""
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+# Estágios
+
+def record_stage(stage, seconds):
+    """Registra a duração de um estágio medido fora de span/timed"""
+    observe('amfa_stage_duration_seconds', (('route', _route.get()), ('stage', stage)), seconds)
+
+
+class span:
+    """Mede o bloco como um estágio da requisição atual: `with span('bcrypt_check'):`"""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe('amfa_stage_duration_seconds', (('route', _route.get()), ('stage', self.stage)),
+                time.perf_counter() - self.start)
+
+
+def timed(stage):
+    """Decorador: mede cada chamada da função como o estágio `stage`"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe('amfa_stage_duration_seconds', (('route', _route.get()), ('stage', stage)),
+                        time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def current_route():
+    return _route.get()
+
+
+class route_scope:
+    """Atribui os estágios medidos no bloco à rota informada (tarefas em outras threads)"""
+
+    __slots__ = ('route', 'token')
+
+    def __init__(self, route):
+        self.route = route
+
+    def __enter__(self):
+        self.token = _route.set(self.route)
+        return self
+
+    def __exit__(self, *exc_info):
+        _route.reset(self.token)
+
+
+# Requisições e consultas
+
+def _before_request():
+    from flask import g, request
+
+    g._metrics_start = time.perf_counter()
+    g._metrics_route_token = _route.set(request.endpoint or 'none')
+
+
+def _after_request(response):
+    from flask import g, request
+
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        observe(
+            'amfa_http_request_duration_seconds',
+            (('route', _route.get()), ('method', request.method), ('status', str(response.status_code))),
+            time.perf_counter() - start
+        )
+    return response
+
+
+def _teardown_request(error=None):
+    from flask import g
+
+    token = g.pop('_metrics_route_token', None)
+    if token is not None:
+        _route.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('metrics_query_start', None)
+    if start is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else '-'
+    observe('amfa_db_query_duration_seconds', (('route', _route.get()), ('operation', operation)),
+            time.perf_counter() - start)
+
+
+_engine_events = False
+
+
+def _listen_engine_events():
+    global _engine_events
+    if _engine_events:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _engine_events = True
+
+
+# Gauges lidos na coleta
+
+_collectors = {}
+
+
+def register_collector(component, stats):
+    """Exporta os valores numéricos de stats() como amfa_<component>_<chave>"""
+    _collectors[component] = stats
+
+
+# Exposição
+
+_INVALID_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in labels) + '}'
+
+
+def _flatten(prefix, values, out):
+    for key, value in values.items():
+        name = f'{prefix}_{_INVALID_NAME.sub("_", str(key))}'
+        if isinstance(value, dict):
+            _flatten(name, value, out)
+        elif isinstance(value, bool):
+            out.append((name, int(value)))
+        elif isinstance(value, (int, float)):
+            out.append((name, value))
+
+
+def snapshot():
+    """Soma os dados de todas as threads: (histogramas, contadores)"""
+    total = _Shard(None)
+    with _shards_lock:
+        _compact()
+        shards = [_retired, *_shards]
+    for shard in shards:
+        total.merge(shard)
+    return total.histograms, total.counters
+
+
+def _gauges():
+    """Valores numéricos dos stats() registrados: ([(nome, valor)], [linhas de erro])"""
+    values, errors = [], []
+    for component in sorted(_collectors):
+        try:
+            collected = []
+            _flatten(f'amfa_{component}', _collectors[component](), collected)
+        except Exception as e:
+            errors.append(f'# Falha ao coletar {component}: {_label_value(e)}')
+            continue
+        values.extend(collected)
+    return values, errors
+
+
+# Agregação entre processos (METRICS_DIR)
+
+_FILE_PREFIX = 'metrics-'
+_RETIRED_FILE = 'metrics-retired.json'
+_LOCK_FILE = '.lock'
+_sync_pid = None
+_sync_lock = threading.Lock()
+
+
+def _start_sync():
+    """Inicia (uma vez por processo) a thread que grava o arquivo do processo"""
+    global _sync_pid
+    if not Config.METRICS_DIR or _sync_pid == os.getpid():
+        return
+    with _sync_lock:
+        if _sync_pid == os.getpid():
+            return
+        _sync_pid = os.getpid()
+    os.makedirs(Config.METRICS_DIR, exist_ok=True)
+    # Arquivo deixado por um processo encerrado com o mesmo pid: não pode ser sobrescrito
+    path = _process_path(_sync_pid)
+    if os.path.exists(path):
+        _retire([path])
+    threading.Thread(target=_sync_loop, name='metrics-sync', daemon=True).start()
+
+
+def _sync_loop():
+    while True:
+        time.sleep(Config.METRICS_SYNC_SECONDS)
+        try:
+            write_process_file()
+        except Exception as e:
+            print(f'Falha ao gravar as métricas do processo: {e}')
+
+
+def _process_path(pid):
+    return os.path.join(Config.METRICS_DIR, f'{_FILE_PREFIX}{pid}.json')
+
+
+def _dump(path, histograms, counters, gauges=()):
+    data = {
+        'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'gauges': list(gauges),
+    }
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _load(path, into):
+    """Soma o arquivo no _Shard `into`; retorna os gauges do arquivo (ou None se não existir)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    loaded = _Shard(None)
+    for name, labels, values in data['histograms']:
+        loaded.histograms[(name, tuple(map(tuple, labels)))] = values
+    for name, labels, value in data['counters']:
+        loaded.counters[(name, tuple(map(tuple, labels)))] = value
+    into.merge(loaded)
+    return data['gauges']
+
+
+def write_process_file():
+    """Grava os números do processo em METRICS_DIR (chamado pela thread, na coleta e ao sair)"""
+    if not Config.METRICS_DIR or _sync_pid != os.getpid():
+        return
+    histograms, counters = snapshot()
+    gauges, _ = _gauges()
+    _dump(_process_path(os.getpid()), histograms, counters, gauges)
+
+
+atexit.register(write_process_file)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _locked(shared):
+    """flock do diretório: compartilhado na leitura, exclusivo ao incorporar arquivos de processos encerrados"""
+    fd = os.open(os.path.join(Config.METRICS_DIR, _LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    return fd
+
+
+def _process_files():
+    """[(pid, caminho)] dos arquivos de processos"""
+    files = []
+    for entry in os.listdir(Config.METRICS_DIR):
+        pid = entry[len(_FILE_PREFIX):-len('.json')]
+        if entry.startswith(_FILE_PREFIX) and entry.endswith('.json') and pid.isdigit():
+            files.append((int(pid), os.path.join(Config.METRICS_DIR, entry)))
+    return files
+
+
+def _retire(paths):
+    """Incorpora os arquivos ao acumulado de processos encerrados e os remove"""
+    fd = _locked(shared=False)
+    try:
+        # Outro processo pode ter incorporado algum deles enquanto esperávamos o lock
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            return
+        retired_path = os.path.join(Config.METRICS_DIR, _RETIRED_FILE)
+        retired = _Shard(None)
+        _load(retired_path, retired)
+        for path in paths:
+            _load(path, retired)
+        _dump(retired_path, retired.histograms, retired.counters)
+        for path in paths:
+            os.unlink(path)
+    finally:
+        os.close(fd)
+
+
+def _aggregate():
+    """Soma os arquivos de METRICS_DIR: (histogramas, contadores, [(nome, rótulos, valor)] dos gauges)"""
+    _start_sync()
+    write_process_file()
+    dead = [path for pid, path in _process_files() if not _is_alive(pid)]
+    if dead:
+        _retire(dead)
+    total = _Shard(None)
+    gauges = []
+    fd = _locked(shared=True)
+    try:
+        _load(os.path.join(Config.METRICS_DIR, _RETIRED_FILE), total)
+        for pid, path in sorted(_process_files()):
+            values = _load(path, total)
+            if values and _is_alive(pid):
+                gauges.extend((name, (('pid', str(pid)),), value) for name, value in values)
+    finally:
+        os.close(fd)
+    return total.histograms, total.counters, gauges
+
+
+def render():
+    """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+    if Config.METRICS_DIR:
+        histograms, counters, gauges = _aggregate()
+        errors = []
+    else:
+        histograms, counters = snapshot()
+        values, errors = _gauges()
+        gauges = [(name, (), value) for name, value in values]
+    lines = []
+
+    by_name = {}
+    for (name, labels), values in histograms.items():
+        by_name.setdefault(name, []).append((labels, values))
+    for name in sorted(by_name):
+        kind, help_text = _DESCRIPTIONS.get(name, ('histogram', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, values in sorted(by_name[name]):
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, '+Inf'), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels((*labels, ("le", bound)))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        kind, help_text = _DESCRIPTIONS.get(name, ('counter', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    by_name = {}
+    for name, labels, value in gauges:
+        by_name.setdefault(name, []).append((labels, value))
+    for name in by_name:
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in by_name[name]:
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    lines.extend(errors)
+
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _metrics_view():
+    from flask import Response, abort, request
+
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {Config.METRICS_TOKEN}':
+        abort(401)
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """Mede as requisições e as consultas da aplicação e registra GET /metrics"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    _listen_engine_events()
+    app.add_url_rule('/metrics', 'metrics', _metrics_view, methods=['GET'])
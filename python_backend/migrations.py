@@ -0,0 +1,285 @@
+"""
+Migrações versionadas do esquema do banco.
+
+Cada migração tem uma versão, uma descrição e uma função que recebe a
+conexão. As versões aplicadas ficam registradas em `schema_migrations`, e
+`upgrade()` aplica as que faltam, em ordem.
+
+- Migrações transacionais rodam dentro de uma transação própria
+- Migrações não transacionais (ex.: CREATE INDEX CONCURRENTLY no Postgres,
+  que não trava a tabela durante a criação) rodam em autocommit e precisam
+  ser idempotentes
+- No Postgres um advisory lock impede que dois processos migrem ao mesmo tempo
+
+O SQL das migrações é fixo (não depende dos modelos atuais), com exceção da
+0001, que cria as tabelas iniciais a partir dos modelos se ainda não
+existirem. Por isso migrações futuras devem usar IF NOT EXISTS.
+
+Uso:
+    python migrations.py upgrade
+    python migrations.py status
+"""
+import sys
+from datetime import timedelta
+from sqlalchemy import Column, DateTime, MetaData, Table, Text, create_engine, select, text
+from models import db, get_sp_now
+
+# Chave do advisory lock usado durante as migrações (Postgres)
+MIGRATION_LOCK_ID = 7_214_003_001
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Text, primary_key=True),
+    Column('description', Text, nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Migration:
+    def __init__(self, version, description, upgrade, transactional=True):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+def _sql_bool(conn, value):
+    if conn.dialect.name == 'postgresql':
+        return 'true' if value else 'false'
+    return '1' if value else '0'
+
+
+def _create_index(conn, name, table, columns, where=None):
+    """CREATE INDEX idempotente; CONCURRENTLY no Postgres"""
+    if conn.dialect.name == 'postgresql':
+        # Uma criação CONCURRENTLY interrompida deixa um índice inválido para trás
+        invalid = conn.exec_driver_sql(
+            'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = %(name)s AND NOT i.indisvalid', {'name': name}
+        ).first()
+        if invalid:
+            conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        statement = f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})'
+    else:
+        statement = f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'
+    if where:
+        statement += f' WHERE {where}'
+    conn.exec_driver_sql(statement)
+
+
+# Migrações
+
+def _0001_initial_schema(conn):
+    from models import User, AccessLog, SecuritySession, LoginAttempt, SecurityBlock
+    db.metadata.create_all(conn, tables=[
+        User.__table__, AccessLog.__table__, SecuritySession.__table__,
+        LoginAttempt.__table__, SecurityBlock.__table__
+    ])
+
+
+def _0002_auth_indexes(conn):
+    true, false = _sql_bool(conn, True), _sql_bool(conn, False)
+
+    # Contagens de força bruta e sincronização dos contadores em memória
+    _create_index(conn, 'ix_login_attempts_email_failed', 'login_attempts', 'email, attempted_at', f'success = {false}')
+    _create_index(conn, 'ix_login_attempts_ip_failed', 'login_attempts', 'ip_address, attempted_at', f'success = {false}')
+    _create_index(conn, 'ix_login_attempts_failed_attempted_at', 'login_attempts', 'attempted_at', f'success = {false}')
+
+    # Viagem impossível, proximidade e histórico de acessos; IP conhecido
+    _create_index(conn, 'ix_access_logs_user_login_time', 'access_logs', 'user_id, login_time')
+    _create_index(conn, 'ix_access_logs_user_ip_success', 'access_logs', 'user_id, ip_address', f'success = {true}')
+
+    # Bloqueios ativos por e-mail ou por IP
+    _create_index(conn, 'ix_security_blocks_email_active', 'security_blocks', 'email, blocked_until', f'is_active = {true}')
+    _create_index(conn, 'ix_security_blocks_ip_active', 'security_blocks', 'ip_address, blocked_until', f'is_active = {true}')
+
+
+def _0003_user_locations(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS user_locations (
+            id VARCHAR PRIMARY KEY,
+            user_id VARCHAR NOT NULL REFERENCES users (id),
+            access_log_id VARCHAR NOT NULL,
+            ip_address TEXT,
+            lat FLOAT NOT NULL,
+            lng FLOAT NOT NULL,
+            success BOOLEAN NOT NULL,
+            login_time TIMESTAMP NOT NULL
+        )
+    """)
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_user_locations_user_login_time ON user_locations (user_id, login_time)'
+    )
+
+    # Preenche com os 20 logins com coordenadas mais recentes de cada usuário (últimos 30 dias)
+    if conn.dialect.name == 'postgresql':
+        lat, lng = "(location->>'lat')", "(location->>'lng')"
+    else:
+        lat, lng = "json_extract(location, '$.lat')", "json_extract(location, '$.lng')"
+    conn.execute(text(f"""
+        INSERT INTO user_locations (id, user_id, access_log_id, ip_address, lat, lng, success, login_time)
+        SELECT id, user_id, id, ip_address, lat, lng, success, login_time
+        FROM (
+            SELECT id, user_id, ip_address, success, login_time,
+                   CAST({lat} AS FLOAT) AS lat, CAST({lng} AS FLOAT) AS lng,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY login_time DESC) AS position
+            FROM access_logs
+            WHERE user_id IS NOT NULL AND location IS NOT NULL AND login_time >= :cutoff
+        ) recent
+        WHERE position <= 20 AND lat IS NOT NULL AND lat <> 0 AND lng IS NOT NULL AND lng <> 0
+    """), {'cutoff': get_sp_now() - timedelta(days=30)})
+
+
+def _partition_table(conn, table, column, indexes, foreign_keys=()):
+    """Troca a tabela por uma particionada por intervalo em `column`.
+
+    A tabela atual vira a partição `{table}_legacy`, com o intervalo de
+    MINVALUE até o fim do período atual; por isso os dados não são copiados.
+    """
+    from retention import PARTITIONED_TABLES, next_period, period_start
+
+    legacy = f'{table}_legacy'
+    interval = PARTITIONED_TABLES[table][1]
+    newest = conn.execute(text(f'SELECT MAX({column}) FROM {table}')).scalar()
+    bound = next_period(period_start(max(newest or get_sp_now(), get_sp_now()), interval), interval)
+    bound_sql = f"'{bound.isoformat(' ')}'"
+
+    conn.exec_driver_sql(f'ALTER TABLE {table} RENAME TO {legacy}')
+    # A chave da partição precisa fazer parte da chave primária (também na partição legada)
+    conn.exec_driver_sql(f'ALTER TABLE {legacy} DROP CONSTRAINT {table}_pkey')
+    conn.exec_driver_sql(f'ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_pkey PRIMARY KEY (id, {column})')
+    for name, _, _ in indexes:
+        conn.exec_driver_sql(f'ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy')
+    for name, _ in foreign_keys:
+        conn.exec_driver_sql(f'ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {name}_legacy')
+
+    conn.exec_driver_sql(
+        f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS, PRIMARY KEY (id, {column})) '
+        f'PARTITION BY RANGE ({column})'
+    )
+    for name, definition in foreign_keys:
+        conn.exec_driver_sql(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+    for name, columns, where in indexes:
+        conn.exec_driver_sql(f'CREATE INDEX {name} ON {table} ({columns})' + (f' WHERE {where}' if where else ''))
+
+    # Com o CHECK validado o ATTACH não precisa varrer a tabela legada de novo
+    conn.exec_driver_sql(
+        f'ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_bound CHECK ({column} < {bound_sql}) NOT VALID'
+    )
+    conn.exec_driver_sql(f'ALTER TABLE {legacy} VALIDATE CONSTRAINT {legacy}_bound')
+    conn.exec_driver_sql(f'ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ({bound_sql})')
+    conn.exec_driver_sql(f'ALTER TABLE {legacy} DROP CONSTRAINT {legacy}_bound')
+    conn.exec_driver_sql(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+def _0004_partition_audit_tables(conn):
+    # Só no Postgres; nos demais bancos a retenção apaga as linhas em lotes
+    if conn.dialect.name != 'postgresql':
+        return
+    from retention import ensure_partitions, is_partitioned
+
+    if not is_partitioned(conn, 'access_logs'):
+        _partition_table(conn, 'access_logs', 'login_time', [
+            ('ix_access_logs_user_login_time', 'user_id, login_time', None),
+            ('ix_access_logs_user_ip_success', 'user_id, ip_address', 'success = true'),
+        ], foreign_keys=[
+            ('access_logs_user_id_fkey', 'FOREIGN KEY (user_id) REFERENCES users (id)'),
+        ])
+    if not is_partitioned(conn, 'login_attempts'):
+        _partition_table(conn, 'login_attempts', 'attempted_at', [
+            ('ix_login_attempts_email_failed', 'email, attempted_at', 'success = false'),
+            ('ix_login_attempts_ip_failed', 'ip_address, attempted_at', 'success = false'),
+            ('ix_login_attempts_failed_attempted_at', 'attempted_at', 'success = false'),
+        ])
+    ensure_partitions(conn, 'access_logs')
+    ensure_partitions(conn, 'login_attempts')
+
+
+def _0005_revoked_tokens(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            sid VARCHAR PRIMARY KEY,
+            user_id VARCHAR NOT NULL REFERENCES users (id),
+            revoked_at TIMESTAMP NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at ON revoked_tokens (expires_at)'
+    )
+
+
+MIGRATIONS = [
+    Migration('0001', 'Tabelas iniciais', _0001_initial_schema),
+    Migration('0002', 'Índices das consultas de autenticação', _0002_auth_indexes, transactional=False),
+    Migration('0003', 'Estado de localização por usuário', _0003_user_locations),
+    Migration('0004', 'Particionamento por tempo de access_logs e login_attempts', _0004_partition_audit_tables),
+    Migration('0005', 'Tokens de acesso revogados', _0005_revoked_tokens),
+]
+
+
+# Execução
+
+def applied_versions(conn):
+    migration_metadata.create_all(conn)
+    return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade(engine, verbose=True):
+    """Aplica as migrações pendentes; retorna a lista de versões aplicadas"""
+    applied_now = []
+    with engine.connect() as lock_conn:
+        lock_conn = lock_conn.execution_options(isolation_level='AUTOCOMMIT')
+        is_postgres = lock_conn.dialect.name == 'postgresql'
+        if is_postgres:
+            lock_conn.exec_driver_sql('SELECT pg_advisory_lock(%(id)s)', {'id': MIGRATION_LOCK_ID})
+        try:
+            with engine.begin() as conn:
+                applied = applied_versions(conn)
+
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+                if verbose:
+                    print(f'Aplicando migração {migration.version}: {migration.description}')
+                record = {
+                    'version': migration.version,
+                    'description': migration.description,
+                    'applied_at': get_sp_now()
+                }
+                if migration.transactional:
+                    with engine.begin() as conn:
+                        migration.upgrade(conn)
+                        conn.execute(schema_migrations.insert().values(**record))
+                else:
+                    migration.upgrade(lock_conn)
+                    lock_conn.execute(schema_migrations.insert().values(**record))
+                applied_now.append(migration.version)
+        finally:
+            if is_postgres:
+                lock_conn.exec_driver_sql('SELECT pg_advisory_unlock(%(id)s)', {'id': MIGRATION_LOCK_ID})
+    return applied_now
+
+
+def status(engine):
+    """Retorna [(versão, descrição, aplicada)] para todas as migrações conhecidas"""
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [(m.version, m.description, m.version in applied) for m in MIGRATIONS]
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    engine = create_engine(Config.DATABASE_URL)
+    if command == 'upgrade':
+        versions = upgrade(engine)
+        print(f'{len(versions)} migração(ões) aplicada(s)' if versions else 'Banco já está atualizado')
+    elif command == 'status':
+        for version, description, applied in status(engine):
+            print(f"{version}  {'aplicada ' if applied else 'pendente '}  {description}")
+    else:
+        print('Uso: python migrations.py [upgrade|status]')
+        sys.exit(1)
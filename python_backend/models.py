@@ -1,23 +1,26 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, JSON
+from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, Float, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
-import pytz
 
 db = SQLAlchemy()
 
-# Fuso horário de São Paulo
+# Fuso horário de São Paulo (pytz importado no primeiro uso)
 
-SP_TZ = pytz.timezone('America/Sao_Paulo')
+_sp_tz = None
 
 def generate_uuid():
     return str(uuid.uuid4())
 
 def get_sp_now():
     """Retorna a data/hora atual no fuso horário de São Paulo (naive datetime)"""
+    global _sp_tz
+    if _sp_tz is None:
+        import pytz
+        _sp_tz = pytz.timezone('America/Sao_Paulo')
     # Retorna datetime sem timezone info, mas no horário de São Paulo
-    return datetime.now(SP_TZ).replace(tzinfo=None)
+    return datetime.now(_sp_tz).replace(tzinfo=None)
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -47,6 +50,30 @@ class User(db.Model):
             'updatedAt': self.updated_at.isoformat() if self.updated_at else None
         }
 
+def format_location(location):
+    """Formata a localização como string, se existir"""
+    if not location:
+        return None
+    parts = []
+    if location.get('city'):
+        parts.append(location['city'])
+    if location.get('region'):
+        parts.append(location['region'])
+    if location.get('country'):
+        parts.append(location['country'])
+    return ', '.join(parts) if parts else None
+
+def format_device_info(device_info):
+    """Formata as informações do dispositivo como string, se existir"""
+    if not device_info:
+        return None
+    parts = []
+    if device_info.get('browser'):
+        parts.append(device_info['browser'])
+    if device_info.get('os'):
+        parts.append(device_info['os'])
+    return ' on '.join(parts) if parts else None
+
 class AccessLog(db.Model):
     __tablename__ = 'access_logs'
     
@@ -62,28 +89,17 @@ class AccessLog(db.Model):
     blocked_reason = Column(Text, nullable=True)
     session_blocked = Column(Boolean, default=False, nullable=False)
 
+    # Índices das consultas de viagem impossível, proximidade, histórico e IP conhecido
+    # (criados em bancos existentes pela migração 0002)
+    __table_args__ = (
+        Index('ix_access_logs_user_login_time', 'user_id', 'login_time'),
+        Index('ix_access_logs_user_ip_success', 'user_id', 'ip_address',
+              postgresql_where=success == True, sqlite_where=success == True),
+    )
+
     def to_dict(self):
-        # Formata a localização como string, se existir
-        location_str = None
-        if self.location:
-            parts = []
-            if self.location.get('city'):
-                parts.append(self.location['city'])
-            if self.location.get('region'):
-                parts.append(self.location['region'])
-            if self.location.get('country'):
-                parts.append(self.location['country'])
-            location_str = ', '.join(parts) if parts else None
-        
-        # Formata as informações do dispositivo como string, se existir
-        device_str = None
-        if self.device_info:
-            parts = []
-            if self.device_info.get('browser'):
-                parts.append(self.device_info['browser'])
-            if self.device_info.get('os'):
-                parts.append(self.device_info['os'])
-            device_str = ' on '.join(parts) if parts else None
+        location_str = format_location(self.location)
+        device_str = format_device_info(self.device_info)
         
         return {
             'id': self.id,
@@ -140,6 +156,16 @@ class LoginAttempt(db.Model):
     attempted_at = Column(DateTime, default=get_sp_now, nullable=False)
     blocked_until = Column(DateTime, nullable=True)
 
+    # Índices parciais das contagens de força bruta (apenas tentativas falhas)
+    __table_args__ = (
+        Index('ix_login_attempts_email_failed', 'email', 'attempted_at',
+              postgresql_where=success == False, sqlite_where=success == False),
+        Index('ix_login_attempts_ip_failed', 'ip_address', 'attempted_at',
+              postgresql_where=success == False, sqlite_where=success == False),
+        Index('ix_login_attempts_failed_attempted_at', 'attempted_at',
+              postgresql_where=success == False, sqlite_where=success == False),
+    )
+
 class SecurityBlock(db.Model):
     __tablename__ = 'security_blocks'
     
@@ -151,3 +177,42 @@ class SecurityBlock(db.Model):
     blocked_until = Column(DateTime, nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, default=get_sp_now, nullable=False)
+
+    # Índices parciais da busca de bloqueios ativos (por e-mail OU por IP)
+    __table_args__ = (
+        Index('ix_security_blocks_email_active', 'email', 'blocked_until',
+              postgresql_where=is_active == True, sqlite_where=is_active == True),
+        Index('ix_security_blocks_ip_active', 'ip_address', 'blocked_until',
+              postgresql_where=is_active == True, sqlite_where=is_active == True),
+    )
+
+# Últimos logins com coordenadas de cada usuário, mantidos a partir de
+# access_logs (ver location_state.py)
+class UserLocation(db.Model):
+    __tablename__ = 'user_locations'
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, db.ForeignKey('users.id'), nullable=False)
+    access_log_id = Column(String, nullable=False)
+    ip_address = Column(Text, nullable=True)
+    lat = Column(Float, nullable=False)
+    lng = Column(Float, nullable=False)
+    success = Column(Boolean, nullable=False)
+    login_time = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_user_locations_user_login_time', 'user_id', 'login_time'),
+    )
+
+# Famílias de tokens de acesso revogadas no logout (ver tokens.py)
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    
+    sid = Column(String, primary_key=True)
+    user_id = Column(String, db.ForeignKey('users.id'), nullable=False)
+    revoked_at = Column(DateTime, default=get_sp_now, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
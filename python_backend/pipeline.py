@@ -0,0 +1,60 @@
+"""
+Execução concorrente de estágios independentes de uma requisição.
+
+Usado pelo login para sobrepor a verificação de senha (bcrypt) com a
+geolocalização e as leituras de risco no banco. Cada tarefa roda em uma
+thread do pool com o próprio contexto da aplicação (e, portanto, a própria
+sessão do SQLAlchemy).
+
+O pool é FIFO: uma tarefa que espera o resultado de outra submetida antes
+dela nunca fica presa na fila atrás dela.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+from flask import current_app
+from config import Config
+import metrics
+import profiler
+import query_budget
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.LOGIN_PIPELINE_WORKERS,
+                    thread_name_prefix='login-pipeline'
+                )
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """Agenda fn(*args, **kwargs) em outra thread com o contexto da aplicação atual.
+
+    Com LOGIN_PIPELINE_WORKERS = 0 a função roda imediatamente na thread atual
+    (modo sequencial, útil para depuração e comparação de desempenho).
+    """
+    if Config.LOGIN_PIPELINE_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    app = current_app._get_current_object()
+    # Os estágios medidos, as consultas e o perfil da tarefa contam para a requisição
+    route = metrics.current_route()
+    ledger = query_budget.current()
+    profile = profiler.current()
+
+    def run():
+        with app.app_context(), metrics.route_scope(route), query_budget.attach(ledger), profiler.attach(profile):
+            return fn(*args, **kwargs)
+
+    return _get_executor().submit(run)
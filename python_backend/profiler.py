@@ -0,0 +1,382 @@
+"""
+Perfil de execução de requisições reais, ligado sob demanda.
+
+Uma requisição é perfilada quando:
+
+- cai na amostra PROFILE_SAMPLE_RATE (fração das requisições; com
+  PROFILE_ROUTES, só dessas rotas), ou
+- traz o cabeçalho "X-Profile: <PROFILE_TOKEN>" (se o token estiver definido),
+  o que permite perfilar uma rota lenta em produção sem novo deploy
+
+Modos (PROFILE_MODE):
+
+- 'sample': uma thread de fundo lê a pilha das threads que atendem
+  requisições perfiladas a cada PROFILE_INTERVAL e conta as pilhas no
+  formato collapsed ("quadro;quadro;quadro contagem", lido pelo
+  flamegraph.pl e pelo speedscope). As tarefas do pipeline do login entram
+  no perfil da requisição. O código perfilado roda sem instrumentação e o
+  intervalo cresce se a própria amostragem passar de PROFILE_MAX_OVERHEAD
+  do tempo (CPU da thread de amostragem)
+- 'cprofile': cProfile (determinístico, .pstats para pstats/snakeviz) só na
+  thread da requisição; bem mais caro, melhor com o cabeçalho
+
+Saída em PROFILE_DIR (PROFILE_OUTPUT):
+
+- 'request': um arquivo por requisição, <X-Profile-Id>-<duração>ms.collapsed
+  (ou .pstats), até PROFILE_MAX_FILES por processo
+- 'aggregate': um arquivo por rota e processo, aggregate-<rota>-<pid>.*,
+  regravado a cada PROFILE_FLUSH_SECONDS e no encerramento; o mais útil para
+  rotas curtas como o login, em que cada requisição rende poucas amostras
+
+No máximo PROFILE_MAX_CONCURRENT requisições são perfiladas ao mesmo tempo
+por processo; as demais seguem sem perfil. O bcrypt roda no pool de
+processos (hashing.py) e aparece no perfil como espera pelo resultado.
+"""
+import atexit
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from config import Config
+import metrics
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Quadros por pilha (acima disso os mais externos são descartados)
+MAX_DEPTH = 128
+
+# Rótulos dos quadros por objeto de código (limpo ao passar do limite)
+_labels = {}
+_MAX_LABELS = 50000
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]')
+
+# Perfil da requisição em andamento
+_profile = ContextVar('request_profile', default=None)
+
+metrics.describe('amfa_profiles_total', 'counter', 'Requisições perfiladas por modo e gatilho')
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(BACKEND_DIR + os.sep):
+            filename = filename[len(BACKEND_DIR) + 1:]
+        elif 'site-packages' + os.sep in filename:
+            filename = filename.split('site-packages' + os.sep, 1)[1]
+        else:
+            filename = os.path.basename(filename)
+        if len(_labels) >= _MAX_LABELS:
+            _labels.clear()
+        label = _labels[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+    return label
+
+
+def _collapse(frame):
+    """Pilha da raiz até o quadro atual, separada por ';'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+def _write_collapsed(path, stacks):
+    # Grava em um temporário e renomeia: quem lê o diretório nunca vê um arquivo pela metade
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    os.replace(tmp_path, path)
+
+
+class Profile:
+    """Perfil de uma requisição"""
+
+    __slots__ = ('id', 'route', 'started', 'stacks', 'cprofile')
+
+    def __init__(self, profile_id, route):
+        self.id = profile_id
+        self.route = route
+        self.started = time.perf_counter()
+        # pilha collapsed -> amostras (modo 'sample'; só a thread de amostragem escreve)
+        self.stacks = Counter()
+        self.cprofile = None
+
+
+class RequestProfiler:
+    """Perfis das requisições selecionadas e a thread de amostragem do processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        # ident da thread -> Profile que ela está atendendo (modo 'sample')
+        self._active = {}
+        self._running = 0
+        self._sequence = 0
+        # rota -> Counter (sample) ou pstats.Stats (cprofile), modo 'aggregate'
+        self._aggregates = {}
+        self._last_flush = time.monotonic()
+        self._pid = None
+        self._thread = None
+        self.interval = Config.PROFILE_INTERVAL
+        self._counters = {'profiled': 0, 'skipped': 0, 'samples': 0, 'files': 0, 'dropped': 0, 'sampler_seconds': 0.0}
+
+    # Seleção
+
+    def trigger(self, route, headers):
+        """'header', 'sample' ou None (a requisição não é perfilada)"""
+        token = Config.PROFILE_TOKEN
+        if token:
+            value = headers.get('X-Profile')
+            if value is not None and hmac.compare_digest(value.encode(), token.encode()):
+                return 'header'
+        rate = Config.PROFILE_SAMPLE_RATE
+        if rate > 0 and (not Config.PROFILE_ROUTES or route in Config.PROFILE_ROUTES) and random.random() < rate:
+            return 'sample'
+        return None
+
+    # Ciclo de uma requisição
+
+    def begin(self, route, trigger):
+        """Começa o perfil da thread atual; None se o limite de perfis simultâneos foi atingido"""
+        with self._lock:
+            if self._running >= Config.PROFILE_MAX_CONCURRENT:
+                self._counters['skipped'] += 1
+                return None
+            self._running += 1
+            self._sequence += 1
+            sequence = self._sequence
+        if Config.PROFILE_OUTPUT == 'aggregate':
+            profile_id = f'aggregate-{_UNSAFE.sub("_", route)}-{os.getpid()}'
+        else:
+            profile_id = f'{datetime.now():%Y%m%dT%H%M%S}-{_UNSAFE.sub("_", route)}-{os.getpid()}-{sequence}'
+        profile = Profile(profile_id, route)
+        if Config.PROFILE_MODE == 'cprofile':
+            profile.cprofile = cProfile.Profile()
+            try:
+                profile.cprofile.enable()
+            except ValueError:
+                # Outro profiler já ativo
+                with self._lock:
+                    self._running -= 1
+                return None
+        else:
+            self._start()
+            self._register(threading.get_ident(), profile)
+        metrics.inc('amfa_profiles_total', (('mode', Config.PROFILE_MODE), ('trigger', trigger)))
+        return profile
+
+    def end(self, profile):
+        """Encerra o perfil e grava (ou acumula) o resultado"""
+        elapsed = time.perf_counter() - profile.started
+        if profile.cprofile is not None:
+            profile.cprofile.disable()
+        else:
+            self._unregister(threading.get_ident(), None)
+        with self._lock:
+            self._running -= 1
+            self._counters['profiled'] += 1
+        try:
+            if Config.PROFILE_OUTPUT == 'aggregate':
+                self._aggregate(profile)
+            else:
+                self._write(profile, elapsed)
+        except OSError as e:
+            print(f'Falha ao gravar o perfil de {profile.route}: {e}')
+
+    def _register(self, ident, profile):
+        with self._wakeup:
+            previous = self._active.get(ident)
+            self._active[ident] = profile
+            self._wakeup.notify()
+        return previous
+
+    def _unregister(self, ident, previous):
+        with self._lock:
+            if previous is None:
+                self._active.pop(ident, None)
+            else:
+                self._active[ident] = previous
+
+    # Amostragem
+
+    def _start(self):
+        """Inicia a thread de amostragem do processo (no primeiro perfil após o fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._active:
+                    self._wakeup.wait()
+                started = time.thread_time()
+                frames = sys._current_frames()
+                for ident, profile in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.stacks[_collapse(frame)] += 1
+                        self._counters['samples'] += 1
+                del frames
+                cost = time.thread_time() - started
+                self._counters['sampler_seconds'] += cost
+            # Intervalo que mantém a amostragem abaixo de PROFILE_MAX_OVERHEAD
+            self.interval = max(Config.PROFILE_INTERVAL, cost / Config.PROFILE_MAX_OVERHEAD)
+            time.sleep(self.interval)
+
+    # Saída
+
+    def _write(self, profile, elapsed):
+        with self._lock:
+            if self._counters['files'] >= Config.PROFILE_MAX_FILES:
+                self._counters['dropped'] += 1
+                if self._counters['dropped'] == 1:
+                    print(f'Limite de {Config.PROFILE_MAX_FILES} perfis gravados atingido; novos perfis são descartados')
+                return
+            self._counters['files'] += 1
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(Config.PROFILE_DIR, f'{profile.id}-{elapsed * 1000:.0f}ms')
+        if profile.cprofile is not None:
+            profile.cprofile.dump_stats(path + '.pstats')
+        else:
+            _write_collapsed(path + '.collapsed', profile.stacks)
+
+    def _aggregate(self, profile):
+        with self._lock:
+            if profile.cprofile is not None:
+                stats = self._aggregates.get(profile.route)
+                if stats is None:
+                    self._aggregates[profile.route] = pstats.Stats(profile.cprofile)
+                else:
+                    stats.add(profile.cprofile)
+            else:
+                self._aggregates.setdefault(profile.route, Counter()).update(profile.stacks)
+            due = time.monotonic() - self._last_flush >= Config.PROFILE_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Regrava os arquivos agregados (um por rota) com tudo o que foi acumulado"""
+        with self._flush_lock:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                routes = list(self._aggregates)
+            if not routes:
+                return
+            os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+            for route in routes:
+                path = os.path.join(Config.PROFILE_DIR, f'aggregate-{_UNSAFE.sub("_", route)}-{os.getpid()}')
+                with self._lock:
+                    data = self._aggregates[route]
+                    if isinstance(data, pstats.Stats):
+                        data.dump_stats(path + '.pstats')
+                        continue
+                    stacks = Counter(data)
+                _write_collapsed(path + '.collapsed', stacks)
+
+    def stop(self):
+        """Grava os perfis agregados pendentes (encerramento)"""
+        if self._aggregates:
+            try:
+                self.flush()
+            except OSError as e:
+                print(f'Falha ao gravar os perfis agregados: {e}')
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'active': self._running,
+                'interval_ms': self.interval * 1000,
+            }
+
+
+# Instância compartilhada pelo processo
+request_profiler = RequestProfiler()
+atexit.register(request_profiler.stop)
+
+
+def current():
+    return _profile.get()
+
+
+class attach:
+    """Inclui a thread atual no perfil informado durante o bloco (tarefas do pipeline)"""
+
+    __slots__ = ('profile', 'ident', 'previous')
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __enter__(self):
+        # cProfile só acompanha a thread que o ativou
+        if self.profile is not None and self.profile.cprofile is None:
+            self.ident = threading.get_ident()
+            self.previous = request_profiler._register(self.ident, self.profile)
+        return self.profile
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None and self.profile.cprofile is None:
+            request_profiler._unregister(self.ident, self.previous)
+
+
+# Requisições
+
+def _before_request():
+    from flask import g, request
+
+    route = request.endpoint or 'none'
+    trigger = request_profiler.trigger(route, request.headers)
+    if trigger is None:
+        return
+    profile = request_profiler.begin(route, trigger)
+    if profile is not None:
+        g._profile = profile
+        g._profile_token = _profile.set(profile)
+
+
+def _after_request(response):
+    from flask import g
+
+    profile = g.get('_profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+
+def _teardown_request(error=None):
+    from flask import g
+
+    token = g.pop('_profile_token', None)
+    if token is not None:
+        _profile.reset(token)
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        request_profiler.end(profile)
+
+
+def init_app(app):
+    """Perfila as requisições selecionadas (PROFILE_SAMPLE_RATE > 0 ou PROFILE_TOKEN definido)"""
+    if Config.PROFILE_SAMPLE_RATE <= 0 and not Config.PROFILE_TOKEN:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,245 @@
+"""
+Contabilidade das consultas SQL de cada requisição.
+
+Cada requisição abre um registro (Ledger) com o número de instruções
+executadas, as linhas (rowcount do driver: no SQLite só INSERT/UPDATE/DELETE)
+e o tempo no banco, alimentado pelos eventos do engine do SQLAlchemy. As
+tarefas do pipeline do login gravam no registro da requisição que as criou;
+consultas de threads de fundo (auditoria, sincronização) não entram.
+
+Com o registro:
+
+- cabeçalhos X-Query-Count, X-Query-Rows, X-Query-Time-Ms e X-Query-Repeated
+  nas respostas, no modo debug do Flask ou com QUERY_DEBUG_HEADERS (contam
+  até o fim da view: a gravação da sessão acontece depois)
+- orçamento por rota (QUERY_BUDGETS, ex.: 'auth.login': 8), verificado no
+  fim da requisição: acima dele, aviso no log ('warn') ou QueryBudgetExceeded
+  ('raise', para testes), conforme QUERY_BUDGET_MODE
+- a mesma instrução executada QUERY_REPEAT_THRESHOLD vezes ou mais numa
+  requisição (o padrão N+1: um SELECT por item de uma lista) é apontada
+  junto com o texto da instrução
+
+Nos testes, um bloco pode declarar o próprio limite:
+
+    with query_budget.expect_queries(8) as ledger:
+        client.post('/api/auth/login', json={...})
+
+Os registros são encadeados: o da requisição também soma no do bloco.
+"""
+import threading
+import time
+from contextvars import ContextVar
+import metrics
+
+# Registro da requisição (ou bloco) em andamento
+_ledger = ContextVar('query_ledger', default=None)
+
+# Avisos já emitidos (rota, instrução): o log não repete o mesmo aviso a cada requisição
+_reported = set()
+_MAX_REPORTED = 1000
+
+metrics.describe('amfa_query_budget_exceeded_total', 'counter', 'Requisições acima do orçamento de consultas da rota')
+metrics.describe('amfa_query_repeats_total', 'counter', 'Requisições com a mesma instrução SQL repetida (possível N+1)')
+
+
+class QueryBudgetExceeded(Exception):
+    """Requisição (ou bloco de expect_queries) acima do orçamento de consultas"""
+
+
+class Ledger:
+    """Consultas de uma requisição; seguro para as threads do pipeline"""
+
+    __slots__ = ('route', 'parent', 'queries', 'rows', 'seconds', 'statements', '_lock')
+
+    def __init__(self, route=None, parent=None):
+        self.route = route
+        self.parent = parent
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+        # instrução -> execuções
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement, rows, seconds):
+        ledger = self
+        while ledger is not None:
+            with ledger._lock:
+                ledger.queries += 1
+                if rows > 0:
+                    ledger.rows += rows
+                ledger.seconds += seconds
+                ledger.statements[statement] = ledger.statements.get(statement, 0) + 1
+            ledger = ledger.parent
+
+    def repeated(self, threshold):
+        """Instruções executadas threshold vezes ou mais: [(instrução, vezes)], mais repetidas antes"""
+        with self._lock:
+            items = [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+        return sorted(items, key=lambda item: -item[1])
+
+
+def current():
+    return _ledger.get()
+
+
+class attach:
+    """Grava as consultas do bloco no registro informado (tarefas em outras threads)"""
+
+    __slots__ = ('ledger', 'token')
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def __enter__(self):
+        self.token = _ledger.set(self.ledger)
+        return self.ledger
+
+    def __exit__(self, *exc_info):
+        _ledger.reset(self.token)
+
+
+class expect_queries:
+    """Falha (QueryBudgetExceeded) se o bloco executar mais de `max_queries` consultas
+    ou repetir uma instrução `max_repeats` vezes ou mais (None desativa essa checagem)"""
+
+    def __init__(self, max_queries, max_repeats=None):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+
+    def __enter__(self):
+        self.ledger = Ledger(route='expect_queries', parent=_ledger.get())
+        self.token = _ledger.set(self.ledger)
+        return self.ledger
+
+    def __exit__(self, exc_type, exc, tb):
+        _ledger.reset(self.token)
+        if exc_type is not None:
+            return False
+        if self.ledger.queries > self.max_queries:
+            raise QueryBudgetExceeded(
+                f'{self.ledger.queries} consultas (limite {self.max_queries})\n' + _describe(self.ledger)
+            )
+        if self.max_repeats is not None:
+            repeated = self.ledger.repeated(self.max_repeats)
+            if repeated:
+                raise QueryBudgetExceeded(
+                    f'Instrução executada {repeated[0][1]} vezes (limite {self.max_repeats - 1})\n'
+                    + _describe(self.ledger)
+                )
+        return False
+
+
+def _shorten(statement):
+    return ' '.join(statement.split())[:300]
+
+
+def _describe(ledger, limit=10):
+    with ledger._lock:
+        items = sorted(ledger.statements.items(), key=lambda item: -item[1])
+    return '\n'.join(f'  {count}x {_shorten(statement)}' for statement, count in items[:limit])
+
+
+# Eventos do engine
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _ledger.get() is not None:
+        conn.info['query_budget_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('query_budget_start', None)
+    if start is None:
+        return
+    ledger = _ledger.get()
+    if ledger is not None:
+        ledger.record(statement, cursor.rowcount, time.perf_counter() - start)
+
+
+_engine_events = False
+
+
+def _listen_engine_events():
+    global _engine_events
+    if _engine_events:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _engine_events = True
+
+
+# Requisições
+
+def _before_request():
+    from flask import g, request
+
+    ledger = g._query_ledger = Ledger(route=request.endpoint or 'none', parent=_ledger.get())
+    g._query_ledger_token = _ledger.set(ledger)
+
+
+def _after_request(response):
+    from flask import current_app, g
+
+    ledger = g.get('_query_ledger')
+    if ledger is not None and (current_app.debug or current_app.config['QUERY_DEBUG_HEADERS']):
+        response.headers['X-Query-Count'] = str(ledger.queries)
+        response.headers['X-Query-Rows'] = str(ledger.rows)
+        response.headers['X-Query-Time-Ms'] = f'{ledger.seconds * 1000:.2f}'
+        response.headers['X-Query-Repeated'] = str(len(ledger.repeated(current_app.config['QUERY_REPEAT_THRESHOLD'])))
+    return response
+
+
+def _report(key, message):
+    """Imprime o aviso uma vez por chave (rota e problema)"""
+    if key in _reported:
+        return
+    if len(_reported) >= _MAX_REPORTED:
+        _reported.clear()
+    _reported.add(key)
+    print(message)
+
+
+def _teardown_request(error=None):
+    from flask import current_app, g
+
+    token = g.pop('_query_ledger_token', None)
+    if token is not None:
+        _ledger.reset(token)
+    ledger = g.pop('_query_ledger', None)
+    config = current_app.config
+    if ledger is None or config['QUERY_BUDGET_MODE'] == 'off':
+        return
+
+    route = ledger.route
+    problems = []  # (chave do aviso, mensagem)
+
+    budget = config['QUERY_BUDGETS'].get(route)
+    if budget is not None and ledger.queries > budget:
+        metrics.inc('amfa_query_budget_exceeded_total', (('route', route),))
+        problems.append(((route, None), f'{route}: {ledger.queries} consultas (orçamento {budget})'))
+
+    repeated = ledger.repeated(config['QUERY_REPEAT_THRESHOLD'])
+    if repeated:
+        metrics.inc('amfa_query_repeats_total', (('route', route),))
+        for statement, count in repeated:
+            problems.append(((route, statement), f'{route}: instrução repetida {count}x (possível N+1): {_shorten(statement)}'))
+
+    if not problems:
+        return
+    if config['QUERY_BUDGET_MODE'] == 'raise':
+        raise QueryBudgetExceeded('\n'.join(message for _, message in problems) + '\n' + _describe(ledger))
+    for key, message in problems:
+        _report(key, f'Consultas SQL acima do esperado em {message}')
+
+
+def init_app(app):
+    """Conta as consultas de cada requisição (QUERY_BUDGET_MODE diferente de 'off' ou QUERY_DEBUG_HEADERS)"""
+    if app.config['QUERY_BUDGET_MODE'] == 'off' and not app.config['QUERY_DEBUG_HEADERS']:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    _listen_engine_events()
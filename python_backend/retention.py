@@ -0,0 +1,212 @@
+"""
+Partições e retenção de access_logs e login_attempts.
+
+No Postgres as duas tabelas são particionadas por intervalo de tempo
+(login_time / attempted_at; ver a migração 0004). A manutenção:
+
+- cria as partições do período atual e dos PARTITION_PREMAKE_PERIODS
+  seguintes, e as dos períodos que ficaram sem partição (manutenção
+  atrasada). Uma partição DEFAULT recebe o que cair fora delas; as linhas
+  dela no intervalo de uma partição nova são movidas para a partição antes
+  do ATTACH (com linhas do intervalo na DEFAULT o CREATE ... PARTITION OF
+  falharia)
+- remove (DROP) ou apenas desanexa (DETACH, com RETENTION_DETACH_ONLY) as
+  partições cujo limite superior já saiu do prazo de retenção da tabela, e
+  apaga da DEFAULT as linhas fora do prazo. O total de linhas que restam na
+  DEFAULT aparece no resumo (`default_rows`): fora de zero, a manutenção
+  está atrasada ou chegam horários fora do esperado
+
+Nos demais bancos (ex.: SQLite) as linhas expiradas são apagadas com
+DELETE em lotes de RETENTION_DELETE_BATCH.
+
+Uso (ex.: cron diário):
+    python retention.py
+"""
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from config import Config
+from models import get_sp_now
+
+# tabela -> (coluna de partição, intervalo da partição, dias de retenção)
+PARTITIONED_TABLES = {
+    'access_logs': ('login_time', Config.ACCESS_LOG_PARTITION_INTERVAL, Config.ACCESS_LOG_RETENTION_DAYS),
+    'login_attempts': ('attempted_at', Config.LOGIN_ATTEMPT_PARTITION_INTERVAL, Config.LOGIN_ATTEMPT_RETENTION_DAYS),
+}
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def period_start(moment, interval):
+    """Início do período (dia ou mês) que contém o momento"""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'month':
+        start = start.replace(day=1)
+    return start
+
+
+def next_period(start, interval):
+    if interval == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(table, start, interval):
+    return f"{table}_p{start.strftime('%Y%m' if interval == 'month' else '%Y%m%d')}"
+
+
+def is_partitioned(conn, table):
+    return conn.execute(text(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table'
+    ), {'table': table}).first() is not None
+
+
+def list_partitions(conn, table):
+    """Retorna [(nome, limite superior ou None)] das partições da tabela"""
+    rows = conn.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {'table': table}).all()
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND.search(bound or '')
+        upper = datetime.fromisoformat(match.group(1)) if match and match.group(1) != 'MAXVALUE' else None
+        partitions.append((name, upper))
+    return partitions
+
+
+def default_partition(conn, table):
+    """Nome da partição DEFAULT da tabela (ou None)"""
+    return conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table AND pg_get_expr(child.relpartbound, child.oid) = 'DEFAULT'
+    """), {'table': table}).scalar()
+
+
+def _create_partition(conn, table, name, start, end, default):
+    column = PARTITIONED_TABLES[table][0]
+    bounds = f"FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+    params = {'start': start, 'end': end}
+    in_default = default is not None and conn.execute(text(
+        f'SELECT 1 FROM {default} WHERE {column} >= :start AND {column} < :end LIMIT 1'
+    ), params).first() is not None
+    if not in_default:
+        conn.execute(text(f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}'))
+        return
+    # Move as linhas do intervalo para a tabela nova; o ATTACH cria os índices e as chaves
+    conn.execute(text(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)'))
+    moved = conn.execute(text(
+        f'WITH moved AS (DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), params).rowcount
+    conn.execute(text(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}'))
+    print(f'{name}: {moved} linhas movidas de {default}')
+
+
+def ensure_partitions(conn, table, now=None):
+    """Cria as partições do período atual, dos próximos e dos que ficaram sem partição; retorna os nomes criados"""
+    _, interval, retention_days = PARTITIONED_TABLES[table]
+    now = now or get_sp_now()
+    partitions = list_partitions(conn, table)
+    existing = {name for name, _ in partitions}
+    # Períodos antes do maior limite existente já estão cobertos (ex.: pela partição legada)
+    covered = max((upper for _, upper in partitions if upper), default=None)
+    start = period_start(now, interval)
+    end = start
+    for _ in range(Config.PARTITION_PREMAKE_PERIODS + 1):
+        end = next_period(end, interval)
+    if covered is not None and covered < start:
+        # Manutenção atrasada: as linhas desses períodos estão na DEFAULT (as fora da retenção ficam para expire_partitions)
+        start = max(covered, period_start(now - timedelta(days=retention_days), interval))
+    default = default_partition(conn, table)
+    created = []
+    while start < end:
+        name = partition_name(table, start, interval)
+        following = next_period(start, interval)
+        if name not in existing and (covered is None or start >= covered):
+            _create_partition(conn, table, name, start, following, default)
+            created.append(name)
+        start = following
+    return created
+
+
+def expire_partitions(conn, table, now=None):
+    """Remove/desanexa as partições inteiramente fora da retenção e limpa a DEFAULT; retorna os nomes"""
+    column, _, retention_days = PARTITIONED_TABLES[table]
+    cutoff = (now or get_sp_now()) - timedelta(days=retention_days)
+    default = default_partition(conn, table)
+    expired = []
+    for name, upper in list_partitions(conn, table):
+        if upper is None or upper > cutoff:
+            continue
+        conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+        if not Config.RETENTION_DETACH_ONLY:
+            conn.execute(text(f'DROP TABLE {name}'))
+        expired.append(name)
+    if default is not None:
+        # A DEFAULT não tem limite superior: a retenção apaga as linhas dela
+        conn.execute(text(f'DELETE FROM {default} WHERE {column} < :cutoff'), {'cutoff': cutoff})
+    return expired
+
+
+def count_default_rows(conn, table):
+    default = default_partition(conn, table)
+    if default is None:
+        return 0
+    return conn.execute(text(f'SELECT COUNT(*) FROM {default}')).scalar()
+
+
+def delete_expired_rows(engine, table, now=None):
+    """Apaga as linhas fora da retenção em lotes (bancos sem particionamento)"""
+    column, _, retention_days = PARTITIONED_TABLES[table]
+    cutoff = (now or get_sp_now()) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        # Um lote por transação para não segurar locks por muito tempo
+        with engine.begin() as conn:
+            deleted = conn.execute(text(
+                f'DELETE FROM {table} WHERE id IN '
+                f'(SELECT id FROM {table} WHERE {column} < :cutoff LIMIT :batch)'
+            ), {'cutoff': cutoff, 'batch': Config.RETENTION_DELETE_BATCH}).rowcount
+        total += deleted
+        if deleted < Config.RETENTION_DELETE_BATCH:
+            return total
+
+
+def run_maintenance(engine, verbose=True):
+    """Cria partições futuras, aplica a retenção das tabelas de auditoria e limpa revogações expiradas"""
+    summary = {}
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as conn:
+            partitioned = conn.dialect.name == 'postgresql' and is_partitioned(conn, table)
+            if partitioned:
+                created = ensure_partitions(conn, table)
+                expired = expire_partitions(conn, table)
+                default_rows = count_default_rows(conn, table)
+        if partitioned:
+            summary[table] = {'created': created, 'expired': expired, 'default_rows': default_rows}
+        else:
+            summary[table] = {'deleted': delete_expired_rows(engine, table)}
+        if verbose:
+            print(f'{table}: {summary[table]}')
+
+    # Revogações de tokens só importam até o token de renovação expirar
+    with engine.begin() as conn:
+        summary['revoked_tokens'] = {'deleted': conn.execute(
+            text('DELETE FROM revoked_tokens WHERE expires_at <= :now'), {'now': get_sp_now()}
+        ).rowcount}
+    if verbose:
+        print(f"revoked_tokens: {summary['revoked_tokens']}")
+    return summary
+
+
+if __name__ == '__main__':
+    run_maintenance(create_engine(Config.DATABASE_URL))
+    sys.exit(0)
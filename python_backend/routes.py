@@ -1,27 +1,66 @@
-from flask import Blueprint, request, session, jsonify
+from flask import Blueprint, request, session, jsonify, make_response, g
 from datetime import datetime, timedelta
-import bcrypt
-from models import db, User, AccessLog, SecuritySession, LoginAttempt, get_sp_now
+from models import db, User, SecuritySession, get_sp_now
 from email_service import (
     generate_verification_code, hash_verification_code,
     send_verification_code_email, send_security_alert_email
 )
 from security import (
     get_location_from_ip, extract_device_info, get_client_ip,
-    check_brute_force, check_impossible_travel, check_location_proximity
+    check_brute_force, assess_login_risk, record_login_attempt, is_valid_email
 )
 from config import Config
+import pipeline
+import access_log_query
+from hashing import hashing_service, HashingUnavailable
+from audit_writer import audit_writer
+from tokens import issue_tokens, decode_token, bearer_token, denylist, InvalidToken, DenylistUnavailable
+import metrics
 
 auth_bp = Blueprint('auth', __name__)
 
+# Resposta quando o pool de hash está saturado
+HASHING_UNAVAILABLE_RESPONSE = {'message': 'Serviço temporariamente sobrecarregado. Tente novamente em instantes.'}
+
+# Resposta quando a lista de tokens revogados não está carregada
+DENYLIST_UNAVAILABLE_RESPONSE = {'message': 'Verificação de tokens temporariamente indisponível. Tente novamente em instantes.'}
+
 # Criptografia do Hash para evitar ataques
 DUMMY_BCRYPT_HASH = b'$2b$12$C6UzMDM.H6dfI/f/IKcEe.8U1i1r7rGfKQzWvYb1g4E9aW1u6bD7e'
 
-# Exige a autenticação
+# Exige a autenticação (token Bearer e/ou cookie de sessão, conforme AUTH_MODE)
 def require_auth():
-    if 'userId' not in session:
-        return jsonify({'message': 'Autenticação necessária'}), 401
-    return None
+    if Config.AUTH_MODE in ('token', 'both'):
+        token = bearer_token(request)
+        if token:
+            # Verificação só em CPU (assinatura, expiração e lista de revogados em memória)
+            try:
+                claims = decode_token(token, 'access')
+            except InvalidToken as e:
+                return jsonify({'message': str(e)}), 401
+            except DenylistUnavailable:
+                return jsonify(DENYLIST_UNAVAILABLE_RESPONSE), 503
+            g.auth = {'userId': claims['sub'], 'userRole': claims['role'], 'token': claims}
+            return None
+    
+    if Config.AUTH_MODE in ('session', 'both') and 'userId' in session:
+        g.auth = {'userId': session['userId'], 'userRole': session.get('userRole'), 'token': None}
+        return None
+    
+    return jsonify({'message': 'Autenticação necessária'}), 401
+
+# Usuário autenticado da requisição (depois de require_auth)
+def current_user_id():
+    return g.auth['userId']
+
+# Autentica o usuário conforme AUTH_MODE; retorna os tokens a incluir na resposta
+def _sign_in(user):
+    if Config.AUTH_MODE in ('session', 'both'):
+        session['userId'] = user.id
+        session['userRole'] = user.role
+    if Config.AUTH_MODE in ('token', 'both'):
+        return issue_tokens(user)
+    return {}
 
 # POST /api/auth/register
 @auth_bp.route('/register', methods=['POST'])
@@ -34,19 +73,25 @@ def register():
     if not name or not email or not password:
         return jsonify({'message': 'Todos os campos são obrigatórios'}), 400
     
+    if not is_valid_email(email):
+        return jsonify({'message': 'Email inválido'}), 400
+    
     # Check if user exists
     existing_user = User.query.filter_by(email=email).first()
     if existing_user:
         return jsonify({'message': 'Usuário já existe com este email'}), 409
     
-    # Senha Hash
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(Config.BCRYPT_LOG_ROUNDS))
+    # Senha Hash (no pool de processos de hash)
+    try:
+        hashed_password = hashing_service.hash_password(password)
+    except HashingUnavailable:
+        return jsonify(HASHING_UNAVAILABLE_RESPONSE), 503
     
     # Cria usuário
     user = User(
         name=name,
         email=email,
-        password=hashed_password.decode('utf-8')
+        password=hashed_password
     )
     db.session.add(user)
     db.session.commit()
@@ -57,7 +102,7 @@ def register():
     device_info = extract_device_info(request.headers.get('User-Agent', ''))
     
     # Registração de informações em log
-    access_log = AccessLog(
+    audit_writer.log_access(
         user_id=user.id,
         action='register',
         success=True,
@@ -66,8 +111,6 @@ def register():
         location=location,
         device_info=device_info
     )
-    db.session.add(access_log)
-    db.session.commit()
     
     # Gera e envia códigos de verificação
     try:
@@ -89,7 +132,46 @@ def register():
         'requiresEmailVerification': True
     }), 201
 
+# Aguarda a geolocalização e faz as leituras de risco do usuário (roda em paralelo ao bcrypt)
+def _assess_risk(user_id, client_ip, location_future):
+    current_location = location_future.result()
+    return assess_login_risk(user_id, client_ip, current_location, db)
+
+# Cria sessão de segurança e envia o código por email
+def _require_security_check(user, client_ip, current_location):
+    code, expires_at = generate_verification_code()
+    code_hash = hash_verification_code(code)
+    
+    sec_session = SecuritySession(
+        user_id=user.id,
+        ip_address=client_ip,
+        user_agent=request.headers.get('User-Agent'),
+        location=current_location,
+        device_info=extract_device_info(request.headers.get('User-Agent', '')),
+        security_code_hash=code_hash,
+        expires_at=expires_at
+    )
+    db.session.add(sec_session)
+    db.session.commit()
+    
+    # Envia email de alerta 
+    try:
+        send_security_alert_email(user.email, user.name, code, client_ip, current_location)
+    except Exception as e:
+        print(f'Falha ao enviar email de alerta de segurança: {e}')
+    
+    return jsonify({
+        'requiresSecurity': True,
+        'sessionId': sec_session.id,
+        'userEmail': user.email,
+        'message': 'Detectamos acesso de localização desconhecida. Verifique seu email.'
+    }), 200
+
 # POST /api/auth/login
+#
+# Pipeline: a geolocalização começa assim que o IP é conhecido e as leituras
+# de risco do usuário (viagem impossível, IP conhecido, proximidade) rodam
+# enquanto o bcrypt verifica a senha; os resultados são unidos no fim
 @auth_bp.route('/login', methods=['POST'])
 def login():
     data = request.json
@@ -101,9 +183,13 @@ def login():
     
     client_ip = get_client_ip(request)
     
+    # Estágio 1: geolocalização em paralelo (não depende de nada)
+    location_future = pipeline.submit(get_location_from_ip, client_ip)
+    
     # Checa se for ataque de brute_force
     brute_force_check = check_brute_force(email, client_ip, db)
     if brute_force_check['isBlocked']:
+        metrics.inc('amfa_logins_total', (('result', 'blocked'),))
         return jsonify({
             'message': brute_force_check['reason'],
             'error': 'SECURITY_BLOCKED',
@@ -113,27 +199,36 @@ def login():
     # Busca o usuário
     user = User.query.filter_by(email=email).first()
     
+    # Estágio 2: leituras de risco enquanto a senha é verificada
+    risk_future = None
+    if user and user.is_email_confirmed:
+        risk_future = pipeline.submit(_assess_risk, user.id, client_ip, location_future)
+    
     # Verifica senha (ou verificações falsas para prenvenção de ataques)
     is_valid_password = False
-    if user:
-        is_valid_password = bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8'))
-    else:
-        bcrypt.checkpw(password.encode('utf-8'), DUMMY_BCRYPT_HASH)
+    try:
+        if user:
+            is_valid_password = hashing_service.check_password(password, user.password)
+        else:
+            hashing_service.check_password(password, DUMMY_BCRYPT_HASH)
+    except HashingUnavailable:
+        if risk_future:
+            risk_future.cancel()
+        metrics.inc('amfa_logins_total', (('result', 'unavailable'),))
+        return jsonify(HASHING_UNAVAILABLE_RESPONSE), 503
     
     # Checa todas as condições
     if not user or not is_valid_password or not user.is_email_confirmed:
+        if risk_future:
+            risk_future.cancel()
+        
         # Registra falha de login
-        login_attempt = LoginAttempt(
-            email=email,
-            ip_address=client_ip,
-            success=False
-        )
-        db.session.add(login_attempt)
+        record_login_attempt(email, client_ip, False, db)
         
-        location = get_location_from_ip(client_ip)
+        location = location_future.result()
         device_info = extract_device_info(request.headers.get('User-Agent', ''))
         
-        access_log = AccessLog(
+        audit_writer.log_access(
             user_id=user.id if user else None,
             action='login',
             success=False,
@@ -142,117 +237,47 @@ def login():
             location=location,
             device_info=device_info
         )
-        db.session.add(access_log)
-        db.session.commit()
         
+        metrics.inc('amfa_logins_total', (('result', 'invalid'),))
         return jsonify({
             'message': 'Credenciais inválidas ou conta não verificada. Verifique seu email e senha.'
         }), 401
     
-    # Busca a localização para confirmar usuário
-    current_location = get_location_from_ip(client_ip)
+    # Estágio 3: une os resultados para a decisão de risco
+    with metrics.span('risk_join'):
+        current_location = location_future.result()
+        risk = risk_future.result()
     
     # Verifica se viagem impossivel
-    if current_location and current_location.get('lat') and current_location.get('lng'):
-        impossible_travel = check_impossible_travel(user.id, current_location, db)
-        if impossible_travel['isImpossible']:
-            # Cria sessão de segurança
-            code, expires_at = generate_verification_code()
-            code_hash = hash_verification_code(code)
-            
-            sec_session = SecuritySession(
-                user_id=user.id,
-                ip_address=client_ip,
-                user_agent=request.headers.get('User-Agent'),
-                location=current_location,
-                device_info=extract_device_info(request.headers.get('User-Agent', '')),
-                security_code_hash=code_hash,
-                expires_at=expires_at
-            )
-            db.session.add(sec_session)
-            db.session.commit()
-            
-            # Envia email de alerta 
-            try:
-                send_security_alert_email(user.email, user.name, code, client_ip, current_location)
-            except Exception as e:
-                print(f'Falha ao enviar email de alerta de segurança: {e}')
-            
-            return jsonify({
-                'requiresSecurity': True,
-                'sessionId': sec_session.id,
-                'userEmail': user.email,
-                'message': 'Detectamos acesso de localização desconhecida. Verifique seu email.'
-            }), 200
-    
-    # Checa se o ip é conhecido
-    ip_known = AccessLog.query.filter_by(
-        user_id=user.id,
-        ip_address=client_ip,
-        success=True
-    ).first() is not None
-    
-    # Verifica se localização é próxima
-    if current_location and current_location.get('lat') and current_location.get('lng') and not ip_known:
-        proximity = check_location_proximity(user.id, current_location, db)
-        if not proximity['isNearby']:
-            # Criar sessão de segurança
-            code, expires_at = generate_verification_code()
-            code_hash = hash_verification_code(code)
-            
-            sec_session = SecuritySession(
-                user_id=user.id,
-                ip_address=client_ip,
-                user_agent=request.headers.get('User-Agent'),
-                location=current_location,
-                device_info=extract_device_info(request.headers.get('User-Agent', '')),
-                security_code_hash=code_hash,
-                expires_at=expires_at
-            )
-            db.session.add(sec_session)
-            db.session.commit()
-            
-            # Enviar e-mail de alerta de segurança
-            try:
-                send_security_alert_email(user.email, user.name, code, client_ip, current_location)
-            except Exception as e:
-                print(f'Falha ao enviar email de alerta de segurança: {e}')
-            
-            return jsonify({
-                'requiresSecurity': True,
-                'sessionId': sec_session.id,
-                'userEmail': user.email,
-                'message': 'Detectamos acesso de localização desconhecida. Verifique seu email.'
-            }), 200
+    if risk['impossibleTravel']['isImpossible']:
+        metrics.inc('amfa_logins_total', (('result', 'impossible_travel'),))
+        return _require_security_check(user, client_ip, current_location)
+    
+    # Verifica se localização é próxima (apenas para IPs desconhecidos)
+    if risk['proximity'] is not None and not risk['proximity']['isNearby']:
+        metrics.inc('amfa_logins_total', (('result', 'unknown_location'),))
+        return _require_security_check(user, client_ip, current_location)
     
     # Login bem-sucedido
-    login_attempt = LoginAttempt(
-        email=email,
-        ip_address=client_ip,
-        success=True
-    )
-    db.session.add(login_attempt)
+    record_login_attempt(email, client_ip, True, db)
     
-    location = get_location_from_ip(client_ip)
     device_info = extract_device_info(request.headers.get('User-Agent', ''))
     
-    access_log = AccessLog(
+    audit_writer.log_access(
         user_id=user.id,
         action='login',
         success=True,
         ip_address=client_ip,
         user_agent=request.headers.get('User-Agent'),
-        location=location,
+        location=current_location,
         device_info=device_info
     )
-    db.session.add(access_log)
-    db.session.commit()
     
-    # Definir sessão
-    session['userId'] = user.id
-    session['userRole'] = user.role
+    # Definir sessão / emitir tokens
+    tokens = _sign_in(user)
+    metrics.inc('amfa_logins_total', (('result', 'success'),))
     
-    return jsonify({'message': 'Login realizado com sucesso', 'user': user.to_dict()}), 200
+    return jsonify({'message': 'Login realizado com sucesso', 'user': user.to_dict(), **tokens}), 200
 
 # POST /api/auth/verify-code - Verificação de e-mail
 @auth_bp.route('/verify-code', methods=['POST'])
@@ -291,11 +316,10 @@ def verify_code():
     user.email_verification_attempts = 0
     db.session.commit()
     
-    # Criar sessão
-    session['userId'] = user.id
-    session['userRole'] = user.role
+    # Criar sessão / emitir tokens
+    tokens = _sign_in(user)
     
-    return jsonify({'message': 'Email verificado com sucesso', 'user': user.to_dict()}), 200
+    return jsonify({'message': 'Email verificado com sucesso', 'user': user.to_dict(), **tokens}), 200
 
 # POST /api/auth/resend-verification-code
 @auth_bp.route('/resend-verification-code', methods=['POST'])
@@ -370,13 +394,12 @@ def verify_security():
     sec_session.is_confirmed = True
     db.session.commit()
     
-    # Criar sessão de usuário
+    # Criar sessão de usuário / emitir tokens
     user = User.query.get(sec_session.user_id)
-    session['userId'] = user.id
-    session['userRole'] = user.role
+    tokens = _sign_in(user)
     
     # Registrar login bem-sucedido
-    access_log = AccessLog(
+    audit_writer.log_access(
         user_id=user.id,
         action='login',
         success=True,
@@ -385,10 +408,8 @@ def verify_security():
         location=sec_session.location,
         device_info=sec_session.device_info
     )
-    db.session.add(access_log)
-    db.session.commit()
     
-    return jsonify({'message': 'Verificação de segurança aprovada', 'user': user.to_dict()}), 200
+    return jsonify({'message': 'Verificação de segurança aprovada', 'user': user.to_dict(), **tokens}), 200
 
 # POST /api/auth/resend-security-code
 @auth_bp.route('/resend-security-code', methods=['POST'])
@@ -428,21 +449,57 @@ def get_current_user():
     if auth_error:
         return auth_error
     
-    user = User.query.get(session['userId'])
+    user = User.query.get(current_user_id())
     if not user:
         return jsonify({'message': 'Usuário não encontrado'}), 404
     
     return jsonify(user.to_dict()), 200
 
-# GET /api/auth/access-logs
+# GET /api/auth/access-logs?limit=&cursor=&since=&fields=
 @auth_bp.route('/access-logs', methods=['GET'])
 def get_access_logs():
     auth_error = require_auth()
     if auth_error:
         return auth_error
     
-    logs = AccessLog.query.filter_by(user_id=session['userId']).order_by(AccessLog.login_time.desc()).limit(50).all()
-    return jsonify({'logs': [log.to_dict() for log in logs]}), 200
+    try:
+        fields, limit, cursor, since = access_log_query.parse_params(request.args)
+    except access_log_query.InvalidQuery as e:
+        return jsonify({'message': str(e)}), 400
+    
+    user_id = current_user_id()
+    
+    # Lista inalterada: 304 sem buscar nem serializar a página
+    marker = access_log_query.latest_marker(user_id)
+    etag = access_log_query.compute_etag(user_id, marker, request.query_string.decode())
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(access_log_query.fetch_page(user_id, fields, limit, cursor, since))
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# POST /api/auth/refresh - Novo token de acesso a partir do token de renovação
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh_token():
+    if Config.AUTH_MODE not in ('token', 'both'):
+        return jsonify({'message': 'Autenticação por token desativada'}), 404
+    
+    data = request.json or {}
+    try:
+        claims = decode_token(data.get('refreshToken') or '', 'refresh')
+    except InvalidToken as e:
+        return jsonify({'message': str(e)}), 401
+    except DenylistUnavailable:
+        return jsonify(DENYLIST_UNAVAILABLE_RESPONSE), 503
+    
+    # Papel atualizado do usuário no novo token
+    user = User.query.get(claims['sub'])
+    if not user:
+        return jsonify({'message': 'Usuário não encontrado'}), 401
+    
+    return jsonify(issue_tokens(user, sid=claims['sid'])), 200
 
 # POST /api/auth/logout
 @auth_bp.route('/logout', methods=['POST'])
@@ -451,14 +508,14 @@ def logout():
     if auth_error:
         return auth_error
     
-    user_id = session['userId']
+    user_id = current_user_id()
     
     # Registrar logout
     client_ip = get_client_ip(request)
     location = get_location_from_ip(client_ip)
     device_info = extract_device_info(request.headers.get('User-Agent', ''))
     
-    access_log = AccessLog(
+    audit_writer.log_access(
         user_id=user_id,
         action='logout',
         success=True,
@@ -467,8 +524,11 @@ def logout():
         location=location,
         device_info=device_info
     )
-    db.session.add(access_log)
-    db.session.commit()
+    
+    # Revoga a família de tokens (acesso e renovação) usada na requisição
+    claims = g.auth['token']
+    if claims:
+        denylist.revoke(claims['sid'], user_id, claims['iat'] + Config.REFRESH_TOKEN_TTL)
     
     # Limpar sessão
     session.clear()
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """
-Script para iniciar o servidor Flask
+Script para iniciar o servidor Flask (desenvolvimento)
+
+Em produção use serve.py (gunicorn).
 """
-from app import app
+from app import create_app, init_db
 
 if __name__ == '__main__':
     print('=' * 50)
@@ -12,4 +14,6 @@ if __name__ == '__main__':
     print('\nServidor iniciando em http://localhost:5000')
     print('Pressione CTRL+C para parar\n')
     
+    app = create_app()
+    init_db(app)  # Em desenvolvimento o esquema é atualizado a cada início
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -1,11 +1,34 @@
-import requests
+import re
 from datetime import datetime, timedelta
 from math import radians, sin, cos, sqrt, atan2
 from models import get_sp_now
+from config import Config
+from cache import TTLCache
+from shared_cache import create_shared_cache
+from brute_force import brute_force_guard
+from audit_writer import audit_writer
+from geo_scoring import load_history, score_location
+import geoip
+import metrics
+from metrics import timed
 
-# Cache para mapeamentos de IP para localização (TTL de 24 horas)
-location_cache = {}
-LOCATION_CACHE_TTL = 24 * 60 * 60  # 24 horas em segundos
+# Cache para mapeamentos de IP para localização (LRU limitado, TTL de 24 horas
+# para acertos e TTL curto para IPs sem localização ou consultas que falharam)
+location_cache = TTLCache(
+    max_entries=Config.GEO_CACHE_MAX_ENTRIES,
+    ttl=Config.GEO_CACHE_TTL,
+    negative_ttl=Config.GEO_CACHE_NEGATIVE_TTL
+)
+
+# Segundo nível de cache, compartilhado pelos workers do host (None se desativado)
+shared_location_cache = create_shared_cache(Config.GEO_SHARED_CACHE_PATH, Config.GEO_SHARED_CACHE_SLOTS)
+
+# Endereço simples: local@domínio.tld, sem espaços nem quebras de linha (vai para o cabeçalho To:)
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+def is_valid_email(email):
+    """Valida o formato do e-mail (até 254 caracteres, RFC 5321)"""
+    return len(email) <= 254 and EMAIL_PATTERN.fullmatch(email) is not None
 
 def is_private_ip(ip):
     """Verifica se o IP é privado/local"""
@@ -42,18 +65,10 @@ def is_private_ip(ip):
     
     return False
 
-def get_location_from_ip(ip_address):
-    """Obtém informações de localização a partir do endereço IP"""
-    if is_private_ip(ip_address):
-        return None
-    
-    # Verifica o cache
-    now = get_sp_now().timestamp()
-    if ip_address in location_cache:
-        cached = location_cache[ip_address]
-        if (now - cached['timestamp']) < LOCATION_CACHE_TTL:
-            return cached['location']
-    
+@timed('geo_http')
+def fetch_location_http(ip_address):
+    """Consulta a localização do IP na API ipapi.co (requer rede)"""
+    import requests  # Importado só quando o provedor HTTP é usado (início mais rápido)
     try:
         response = requests.get(
             f'https://ipapi.co/{ip_address}/json/',
@@ -71,25 +86,82 @@ def get_location_from_ip(ip_address):
             print(f'Dados de localização inválidos para IP {ip_address}')
             return None
         
-        location = {
+        return {
             'city': data['city'],
             'region': data['region'],
             'country': data['country_name'],
             'lat': data.get('latitude'),
             'lng': data.get('longitude')
         }
-        
-        # Armazena o resultado em cache
-        location_cache[ip_address] = {
-            'location': location,
-            'timestamp': now
-        }
-        
-        return location
     except Exception as e:
         print(f'Erro ao obter localização para IP {ip_address}: {e}')
         return None
 
+@timed('geo_local')
+def fetch_location_local(ip_address):
+    """Consulta a localização do IP na base GeoIP offline (sem rede)"""
+    location = geoip.lookup(ip_address, Config.GEOIP_DATABASE_PATH)
+    
+    # Mantém o mesmo critério da API: cidade, região e país são obrigatórios
+    if not location or not location['city'] or not location['region'] or not location['country']:
+        return None
+    return location
+
+# Provedores de localização disponíveis para GEOIP_PROVIDERS
+LOCATION_PROVIDERS = {
+    'local': fetch_location_local,
+    'http': fetch_location_http
+}
+
+def check_location_providers(providers):
+    """Falha (ValueError) se GEOIP_PROVIDERS citar um provedor inexistente; chamada por create_app"""
+    unknown = [provider for provider in providers if provider not in LOCATION_PROVIDERS]
+    if unknown:
+        raise ValueError(
+            f"GEOIP_PROVIDERS com provedor desconhecido: {', '.join(unknown)} "
+            f"(disponíveis: {', '.join(sorted(LOCATION_PROVIDERS))})"
+        )
+
+def lookup_location(ip_address):
+    """Consulta os provedores na ordem configurada até um deles responder"""
+    for provider in Config.GEOIP_PROVIDERS:
+        location = LOCATION_PROVIDERS[provider](ip_address)
+        if location:
+            return location
+    return None
+
+def load_location(ip_address):
+    """Busca no cache compartilhado entre workers e, se ausente, nos provedores"""
+    if shared_location_cache is None:
+        return lookup_location(ip_address)
+    
+    try:
+        found, location = shared_location_cache.get(ip_address)
+        if found:
+            return location
+    except Exception as e:
+        print(f'Erro ao ler cache compartilhado de localização: {e}')
+    
+    location = lookup_location(ip_address)
+    
+    try:
+        ttl = Config.GEO_CACHE_TTL if location else Config.GEO_CACHE_NEGATIVE_TTL
+        shared_location_cache.set(ip_address, location, ttl)
+    except Exception as e:
+        print(f'Erro ao gravar cache compartilhado de localização: {e}')
+    
+    return location
+
+@timed('geolocation')
+def get_location_from_ip(ip_address):
+    """Obtém informações de localização a partir do endereço IP"""
+    if is_private_ip(ip_address):
+        return None
+    
+    # Cache do processo -> cache compartilhado -> provedores; consultas
+    # simultâneas ao mesmo IP aguardam uma única busca
+    return location_cache.get_or_load(ip_address, load_location)
+
 def calculate_distance(lat1, lng1, lat2, lng2):
     """Calcula a distância entre dois pontos geográficos usando a fórmula de Haversine"""
     R = 6371  # Raio da Terra em quilômetros
@@ -102,103 +174,106 @@ def calculate_distance(lat1, lng1, lat2, lng2):
     
     return R * c
 
-def check_impossible_travel(user_id, current_location, db):
-    """Verifica viagens impossíveis com base em logs de acesso recentes"""
-    from models import AccessLog
-    
+def score_user_location(user_id, current_location):
+    """Pontua a localização atual contra o histórico do usuário (viagem impossível e proximidade)"""
     if not current_location or not current_location.get('lat') or not current_location.get('lng'):
-        return {'isImpossible': False}
-    
-    # Obtém logs de acesso recentes (últimas 48 horas)
-    forty_eight_hours_ago = get_sp_now() - timedelta(hours=48)
-    recent_logs = AccessLog.query.filter(
-        AccessLog.user_id == user_id,
-        AccessLog.login_time >= forty_eight_hours_ago,
-        AccessLog.location.isnot(None)
-    ).order_by(AccessLog.login_time.desc()).all()
-    
-    for log in recent_logs:
-        if log.location and log.location.get('lat') and log.location.get('lng'):
-            distance = calculate_distance(
-                log.location['lat'],
-                log.location['lng'],
-                current_location['lat'],
-                current_location['lng']
-            )
-            
-            time_diff = (get_sp_now() - log.login_time).total_seconds() / 3600  # horas
-            
-            IMPOSSIBLE_DISTANCE_KM = 500
-            MIN_TIME_HOURS = 2
-            
-            if distance > IMPOSSIBLE_DISTANCE_KM and time_diff < MIN_TIME_HOURS:
-                print(f'Impossible travel detected for user {user_id}: {distance:.2f}km in {time_diff:.2f} hours')
-                return {
-                    'isImpossible': True,
-                    'distance': round(distance),
-                    'timeDiff': round(time_diff, 2)
-                }
-    
-    return {'isImpossible': False}
+        return score_location(None, current_location, get_sp_now())
+    
+    score = score_location(load_history(user_id), current_location, get_sp_now())
+    
+    travel = score['impossibleTravel']
+    if travel['isImpossible']:
+        print(f"Impossible travel detected for user {user_id}: {travel['distance']}km in {travel['timeDiff']:.2f} hours")
+    
+    proximity = score['proximity']
+    if 'distance' in proximity:
+        print(f"Location proximity check for user {user_id}: {proximity['distance']}km from nearest known location (nearby: {proximity['isNearby']})")
+    
+    return score
+
+def check_impossible_travel(user_id, current_location, db):
+    """Verifica viagens impossíveis com base nos logins recentes com localização"""
+    return score_user_location(user_id, current_location)['impossibleTravel']
 
 def check_location_proximity(user_id, current_location, db):
-    """Verifica se a nova localização IP está próxima (verificação de proximidade)"""
+    """Verifica se a nova localização IP está próxima de alguma localização conhecida"""
+    return score_user_location(user_id, current_location)['proximity']
+
+@timed('risk_assessment')
+def assess_login_risk(user_id, ip_address, current_location, db):
+    """Reúne as leituras de risco do login (viagem impossível, IP conhecido e proximidade)"""
     from models import AccessLog
     
-    if not current_location or not current_location.get('lat') or not current_location.get('lng'):
-        return {'isNearby': False}
-    
-    # Obtém logs de acesso bem-sucedidos recentes (últimos 30 dias)
-    thirty_days_ago = get_sp_now() - timedelta(days=30)
-    recent_logs = AccessLog.query.filter(
-        AccessLog.user_id == user_id,
-        AccessLog.login_time >= thirty_days_ago,
-        AccessLog.success == True,
-        AccessLog.location.isnot(None)
-    ).order_by(AccessLog.login_time.desc()).all()
-    
-    for log in recent_logs:
-        if log.location and log.location.get('lat') and log.location.get('lng'):
-            distance = calculate_distance(
-                log.location['lat'],
-                log.location['lng'],
-                current_location['lat'],
-                current_location['lng']
-            )
-            
-            PROXIMITY_DISTANCE_KM = 100
-            is_nearby = distance <= PROXIMITY_DISTANCE_KM
-            
-            print(f'Location proximity check for user {user_id}: {distance:.2f}km from last known location (nearby: {is_nearby})')
-            
-            return {
-                'isNearby': is_nearby,
-                'distance': round(distance)
-            }
+    score = score_user_location(user_id, current_location)
+    if score['impossibleTravel']['isImpossible']:
+        return {'impossibleTravel': score['impossibleTravel'], 'ipKnown': False, 'proximity': None}
+    
+    # Acessos ainda na fila do audit_writer também contam; o limite em login_time
+    # restringe a busca às partições dentro da retenção
+    ip_known = audit_writer.has_pending_success(user_id, ip_address) or AccessLog.query.filter_by(
+        user_id=user_id,
+        ip_address=ip_address,
+        success=True
+    ).filter(
+        AccessLog.login_time >= get_sp_now() - timedelta(days=Config.ACCESS_LOG_RETENTION_DAYS)
+    ).first() is not None
+    
+    has_coordinates = bool(current_location and current_location.get('lat') and current_location.get('lng'))
+    proximity = score['proximity'] if has_coordinates and not ip_known else None
     
-    return {'isNearby': False}
+    return {'impossibleTravel': score['impossibleTravel'], 'ipKnown': ip_known, 'proximity': proximity}
 
-def check_brute_force(email, ip_address, db):
-    """Detecta ataques de força bruta"""
-    from models import LoginAttempt, SecurityBlock
+@timed('record_attempt')
+def record_login_attempt(email, ip_address, success, db):
+    """Registra uma tentativa de login para a detecção de força bruta"""
+    if Config.BRUTE_FORCE_BACKEND == 'memory':
+        # Contadores em memória; a linha em login_attempts é gravada em lote depois
+        brute_force_guard.record_attempt(email, ip_address, success)
+        return
     
-    now = get_sp_now()
-    two_minutes_ago = now - timedelta(minutes=2)
+    from models import LoginAttempt
+    
+    # As contagens do modo 'db' leem login_attempts: a gravação precisa ser imediata
+    db.session.add(LoginAttempt(
+        email=email,
+        ip_address=ip_address,
+        success=success
+    ))
+    db.session.commit()
+
+def count_recent_failures(email, ip_address, since):
+    """Conta as tentativas falhas recentes por e-mail e por IP"""
+    from models import LoginAttempt
+    
+    if Config.BRUTE_FORCE_BACKEND == 'memory':
+        return brute_force_guard.failure_counts(email, ip_address)
     
     # Verifica tentativas falhas recentes por e-mail
     recent_email_attempts = LoginAttempt.query.filter(
         LoginAttempt.email == email,
-        LoginAttempt.attempted_at >= two_minutes_ago,
+        LoginAttempt.attempted_at >= since,
         LoginAttempt.success == False
     ).count()
     
     # Verifica tentativas falhas recentes por IP
     recent_ip_attempts = LoginAttempt.query.filter(
         LoginAttempt.ip_address == ip_address,
-        LoginAttempt.attempted_at >= two_minutes_ago,
+        LoginAttempt.attempted_at >= since,
         LoginAttempt.success == False
     ).count()
     
+    return recent_email_attempts, recent_ip_attempts
+
+@timed('brute_force_check')
+def check_brute_force(email, ip_address, db):
+    """Detecta ataques de força bruta"""
+    from models import SecurityBlock
+    
+    now = get_sp_now()
+    window_start = now - timedelta(minutes=Config.BRUTE_FORCE_WINDOW_MINUTES)
+    
+    recent_email_attempts, recent_ip_attempts = count_recent_failures(email, ip_address, window_start)
+    
     # Verifica bloqueios ativos
     active_blocks = SecurityBlock.query.filter(
         db.or_(
@@ -220,11 +295,8 @@ def check_brute_force(email, ip_address, db):
                 'blockedUntil': active_blocks.blocked_until
             }
     
-    MAX_ATTEMPTS_PER_EMAIL = 5
-    MAX_ATTEMPTS_PER_IP = 10
-    
-    if recent_email_attempts >= MAX_ATTEMPTS_PER_EMAIL:
-        blocked_until = now + timedelta(minutes=15)
+    if recent_email_attempts >= Config.MAX_LOGIN_ATTEMPTS_PER_EMAIL:
+        blocked_until = now + timedelta(minutes=Config.EMAIL_BLOCK_MINUTES)
         block = SecurityBlock(
             email=email,
             ip_address=ip_address,
@@ -236,14 +308,15 @@ def check_brute_force(email, ip_address, db):
         db.session.commit()
         
         print(f'Email {email} blocked for brute force until {blocked_until}')
+        metrics.inc('amfa_security_blocks_total', (('scope', 'email'),))
         return {
             'isBlocked': True,
             'reason': 'Muitas tentativas de login falharam para este email',
             'blockedUntil': blocked_until
         }
     
-    if recent_ip_attempts >= MAX_ATTEMPTS_PER_IP:
-        blocked_until = now + timedelta(minutes=30)
+    if recent_ip_attempts >= Config.MAX_LOGIN_ATTEMPTS_PER_IP:
+        blocked_until = now + timedelta(minutes=Config.IP_BLOCK_MINUTES)
         block = SecurityBlock(
             email=email,
             ip_address=ip_address,
@@ -255,6 +328,7 @@ def check_brute_force(email, ip_address, db):
         db.session.commit()
         
         print(f'IP {ip_address} blocked for brute force until {blocked_until}')
+        metrics.inc('amfa_security_blocks_total', (('scope', 'ip'),))
         return {
             'isBlocked': True,
             'reason': 'Muitas tentativas de login falharam a partir deste endereço IP',
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Servidor de produção: a aplicação Flask no gunicorn.
+
+    python serve.py [--init-db] [--bind 0.0.0.0:5000] [--workers N] [--threads N]
+
+run.py (e o __main__ de app.py) continuam sendo o servidor de
+desenvolvimento do Werkzeug: um processo, debug e recarga automática.
+
+- preload: a aplicação (create_app) é criada uma vez no processo mestre e
+  os workers são criados por fork, compartilhando a memória da importação;
+  com --init-db o mestre aplica as migrações antes de criar os workers
+- workers gthread: SERVER_WORKERS processos (padrão: um por núcleo) com
+  SERVER_THREADS threads cada; o bcrypt de cada worker usa no máximo
+  núcleos / workers processos (se HASHING_WORKERS não for definido)
+- após o fork, cada worker descarta as conexões herdadas do pool do
+  SQLAlchemy; as threads de fundo (auditoria e força bruta) iniciam no
+  primeiro uso dentro de cada worker
+- métricas: com mais de um worker e sem METRICS_DIR, o mestre cria um
+  diretório temporário para os workers somarem as métricas (ver metrics.py)
+- encerramento: SIGTERM/SIGINT param de aceitar conexões, terminam as
+  requisições em andamento (até SERVER_GRACEFUL_TIMEOUT) e cada worker grava
+  os registros pendentes da auditoria e da fila de e-mail antes de sair
+- recarga: SIGHUP troca os workers aos poucos pelos novos (sem derrubar
+  conexões); com preload o código não é relido, para isso use USR2 (novo
+  mestre) seguido de TERM no mestre antigo
+"""
+import argparse
+import os
+import tempfile
+from gunicorn.app.base import BaseApplication
+from config import Config
+
+
+class AMFAServer(BaseApplication):
+    """Aplicação do gunicorn com a configuração de config.py"""
+
+    def __init__(self, options, init_db=False):
+        self.options = options
+        self.init_db = init_db
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import create_app, init_db
+        from models import db
+
+        app = create_app()
+        if self.init_db:
+            init_db(app)
+            # Sem conexões abertas no momento do fork (os sockets seriam herdados)
+            with app.app_context():
+                db.engine.dispose()
+        return app
+
+
+def post_fork(server, worker):
+    """Recria o pool de conexões no processo do worker"""
+    from models import db
+
+    with server.app.wsgi().app_context():
+        # Conexões do mestre não podem ser usadas (nem fechadas) pelo filho
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    """Esvazia as filas do worker antes de ele sair"""
+    import metrics
+    from audit_writer import audit_writer
+    from brute_force import brute_force_guard
+    from mail_queue import mail_queue
+
+    audit_writer.stop()
+    mail_queue.stop()
+    brute_force_guard.stop()
+    metrics.write_process_file()
+
+
+def build_options(bind=None, workers=None, threads=None):
+    return {
+        'bind': bind or Config.SERVER_BIND,
+        'workers': workers or Config.SERVER_WORKERS,
+        'worker_class': 'gthread',
+        'threads': threads or Config.SERVER_THREADS,
+        'preload_app': True,
+        'keepalive': Config.SERVER_KEEPALIVE,
+        'timeout': Config.SERVER_TIMEOUT,
+        'graceful_timeout': Config.SERVER_GRACEFUL_TIMEOUT,
+        'max_requests': Config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': Config.SERVER_MAX_REQUESTS_JITTER,
+        'accesslog': os.getenv('SERVER_ACCESS_LOG') or None,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de produção do AMFA (gunicorn)')
+    parser.add_argument('--init-db', action='store_true', help='aplica as migrações antes de iniciar')
+    parser.add_argument('--bind', help=f'endereço:porta (padrão {Config.SERVER_BIND})')
+    parser.add_argument('--workers', type=int, help=f'processos (padrão {Config.SERVER_WORKERS})')
+    parser.add_argument('--threads', type=int, help=f'threads por processo (padrão {Config.SERVER_THREADS})')
+    args = parser.parse_args()
+
+    options = build_options(args.bind, args.workers, args.threads)
+    if 'HASHING_WORKERS' not in os.environ:
+        # Um pool de bcrypt por worker: divide os núcleos entre eles
+        from hashing import hashing_service
+        hashing_service.workers = max(1, (os.cpu_count() or 1) // options['workers'])
+    if options['workers'] > 1 and not Config.METRICS_DIR:
+        # Cada coleta cai em um worker qualquer: os números precisam ser somados entre eles
+        Config.METRICS_DIR = tempfile.mkdtemp(prefix='amfa-metrics-')
+
+    print(f"AMFA em http://{options['bind']} ({options['workers']} workers x {options['threads']} threads)")
+    AMFAServer(options, init_db=args.init_db).run()
+
+
+if __name__ == '__main__':
+    main()
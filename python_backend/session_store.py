@@ -0,0 +1,308 @@
+"""
+Armazenamento das sessões do servidor com cache e gravação só quando muda.
+
+Substitui o SESSION_TYPE = 'sqlalchemy' do Flask-Session (reaproveitando o
+cookie, a assinatura e a serialização dele) por uma camada com backends
+selecionáveis em SESSION_BACKEND:
+
+- 'sqlalchemy': a mesma tabela de sessões do Flask-Session, no banco principal
+- 'sqlite': um arquivo SQLite local (WAL) compartilhado pelos workers do host,
+  sem ida ao banco remoto
+
+Leituras passam por um cache do processo (TTLCache) com validade de
+SESSION_CACHE_TTL segundos, nunca além da expiração da sessão. Toda gravação
+ou remoção (login, logout, revogação) marca a sessão em uma tabela de
+versões compartilhada pelos workers do host (shared_cache.SharedVersions,
+em SESSION_VERSIONS_PATH); um acerto no cache só vale se a sessão não mudou
+depois de ter sido lida, então um logout vale na hora em todos os workers.
+Sem a tabela de versões o cache fica desativado. Com workers em mais de um
+host (backend 'sqlalchemy'), use SESSION_CACHE_TTL = 0.
+
+Depende de ganchos internos de ServerSideSessionInterface
+(_retrieve_session_data, _upsert_session, _delete_session...): a versão do
+Flask-Session é fixada no pyproject.toml.
+
+A sessão só é gravada quando o conteúdo serializado muda ou quando falta
+menos da metade de PERMANENT_SESSION_LIFETIME para ela expirar (em vez de a
+cada requisição, como faz SESSION_REFRESH_EACH_REQUEST).
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from flask_session.defaults import Defaults
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table, delete, insert, select, update
+from cache import TTLCache
+from config import Config
+from shared_cache import create_shared_versions
+import metrics
+
+
+def _utcnow():
+    # Mesma referência de horário do Flask-Session (UTC sem fuso)
+    return datetime.utcnow()
+
+
+class SqlAlchemySessionBackend:
+    """Sessões na tabela do Flask-Session, no banco principal"""
+
+    name = 'sqlalchemy'
+
+    def __init__(self, db, table_name):
+        self.db = db
+        self.table = Table(
+            table_name, MetaData(),
+            Column('id', Integer, primary_key=True),
+            Column('session_id', String(255), unique=True),
+            Column('data', LargeBinary),
+            Column('expiry', DateTime)
+        )
+
+    def init_app(self, app):
+        # Sem acesso ao banco na inicialização: a tabela é criada por `flask init-db`
+        pass
+
+    def create_schema(self):
+        self.table.create(bind=self.db.engine, checkfirst=True)
+
+    def load(self, store_id):
+        """Retorna (dados, expiração) ou None"""
+        with self.db.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.expiry).where(self.table.c.session_id == store_id)
+            ).first()
+        return (bytes(row.data), row.expiry) if row else None
+
+    def save(self, store_id, data, expiry):
+        with self.db.engine.begin() as conn:
+            updated = conn.execute(
+                update(self.table).where(self.table.c.session_id == store_id).values(data=data, expiry=expiry)
+            ).rowcount
+            if not updated:
+                conn.execute(insert(self.table).values(session_id=store_id, data=data, expiry=expiry))
+
+    def delete(self, store_id):
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.session_id == store_id))
+
+    def delete_expired(self, now):
+        with self.db.engine.begin() as conn:
+            return conn.execute(delete(self.table).where(self.table.c.expiry <= now)).rowcount
+
+
+class SqliteSessionBackend:
+    """Sessões em um arquivo SQLite local, compartilhado pelos workers do host"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def init_app(self, app):
+        # Arquivo local: criado já na inicialização (sem ida ao banco)
+        self.create_schema()
+
+    def create_schema(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'session_id TEXT PRIMARY KEY, data BLOB NOT NULL, expiry TEXT NOT NULL)'
+            )
+
+    def _connection(self):
+        # Uma conexão por thread e por processo (conexões não sobrevivem a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, store_id):
+        row = self._connection().execute(
+            'SELECT data, expiry FROM sessions WHERE session_id = ?', (store_id,)
+        ).fetchone()
+        return (bytes(row[0]), datetime.fromisoformat(row[1])) if row else None
+
+    def save(self, store_id, data, expiry):
+        self._connection().execute(
+            'INSERT INTO sessions (session_id, data, expiry) VALUES (?, ?, ?) '
+            'ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry',
+            (store_id, data, expiry.isoformat())
+        )
+
+    def delete(self, store_id):
+        self._connection().execute('DELETE FROM sessions WHERE session_id = ?', (store_id,))
+
+    def delete_expired(self, now):
+        return self._connection().execute('DELETE FROM sessions WHERE expiry <= ?', (now.isoformat(),)).rowcount
+
+
+class StoredSession(ServerSideSession):
+    """Sessão que lembra como estava gravada, para evitar regravar sem mudança"""
+
+    stored_data = None
+    stored_expiry = None
+
+
+class CachedSessionInterface(ServerSideSessionInterface):
+    """SessionInterface do Flask-Session com cache de leitura e backend plugável"""
+
+    session_class = StoredSession
+    ttl = False  # Os backends não expiram sozinhos: limpeza por `flask session_cleanup`
+
+    def __init__(self, app, backend):
+        self.backend = backend
+        self.cache = TTLCache(
+            max_entries=Config.SESSION_CACHE_MAX_ENTRIES,
+            ttl=Config.SESSION_CACHE_TTL,
+            negative_ttl=0
+        )
+        self.versions = create_shared_versions(Config.SESSION_VERSIONS_PATH, Config.SESSION_VERSIONS_SLOTS)
+        self.use_cache = Config.SESSION_CACHE_TTL > 0 and self.versions is not None
+        self._loaded = threading.local()
+        self._counters = {
+            'requests': 0, 'reads': 0, 'cache_hits': 0, 'cache_invalidations': 0, 'backend_reads': 0,
+            'writes': 0, 'skipped_writes': 0, 'deletes': 0
+        }
+        backend.init_app(app)
+        super().__init__(
+            app,
+            key_prefix=app.config.get('SESSION_KEY_PREFIX', Defaults.SESSION_KEY_PREFIX),
+            use_signer=app.config.get('SESSION_USE_SIGNER', Defaults.SESSION_USE_SIGNER),
+            permanent=app.config.get('SESSION_PERMANENT', Defaults.SESSION_PERMANENT),
+            sid_length=app.config.get('SESSION_ID_LENGTH', Defaults.SESSION_ID_LENGTH),
+            serialization_format=app.config.get('SESSION_SERIALIZATION_FORMAT',
+                                                Defaults.SESSION_SERIALIZATION_FORMAT),
+            cleanup_n_requests=app.config.get('SESSION_CLEANUP_N_REQUESTS',
+                                              Defaults.SESSION_CLEANUP_N_REQUESTS)
+        )
+
+    # Leitura
+
+    def open_session(self, app, request):
+        start = time.perf_counter()
+        self._counters['requests'] += 1
+        self._loaded.record = None
+        session = super().open_session(app, request)
+        record = self._loaded.record
+        if record and record[0] == self._get_store_id(session.sid):
+            session.stored_data, session.stored_expiry = record[1], record[2]
+        # A sessão é aberta antes de a rota ser conhecida: a medição é registrada no save_session
+        self._loaded.open_seconds = time.perf_counter() - start
+        return session
+
+    def _retrieve_session_data(self, store_id):
+        self._counters['reads'] += 1
+        record = self.cache.get(store_id) if self.use_cache else None
+        if record is not None and self.versions.get(store_id) >= record[2]:
+            # Gravada ou removida (ex.: logout) por outro worker depois de entrar no cache
+            self.cache.delete(store_id)
+            self._counters['cache_invalidations'] += 1
+            record = None
+        if record is not None:
+            self._counters['cache_hits'] += 1
+        else:
+            self._counters['backend_reads'] += 1
+            # Versão de antes da leitura: uma mudança durante a leitura invalida a entrada
+            loaded_at = time.time_ns()
+            record = self.backend.load(store_id)
+            if record is None:
+                return None
+            if record[1] is None or record[1] <= _utcnow():
+                # Sessão expirada: remove já, como o Flask-Session fazia
+                self.backend.delete(store_id)
+                return None
+            record = (*record, loaded_at)
+            self._cache(store_id, record)
+
+        data, expiry = record[0], record[1]
+        if expiry <= _utcnow():
+            self.cache.delete(store_id)
+            return None
+        self._loaded.record = (store_id, data, expiry)
+        return self.serializer.decode(data)
+
+    def _cache(self, store_id, record):
+        """Guarda (dados, expiração, versão) no cache do processo"""
+        if not self.use_cache:
+            return
+        remaining = (record[1] - _utcnow()).total_seconds() if record[1] else 0
+        if remaining > 0:
+            self.cache.set(store_id, record, ttl=min(Config.SESSION_CACHE_TTL, remaining))
+
+    # Escrita
+
+    def save_session(self, app, session, response):
+        open_seconds = getattr(self._loaded, 'open_seconds', None)
+        if open_seconds is not None:
+            self._loaded.open_seconds = None
+            metrics.record_stage('session_open', open_seconds)
+        with metrics.span('session_save'):
+            return super().save_session(app, session, response)
+
+    def should_set_storage(self, app, session):
+        if not super().should_set_storage(app, session):
+            return False
+        if session.stored_data is None:
+            return True
+        # Sessão igual à gravada: só regrava para renovar a expiração
+        lifetime = app.permanent_session_lifetime
+        if (self.serializer.encode(session) == session.stored_data
+                and session.stored_expiry - _utcnow() > lifetime / 2):
+            self._counters['skipped_writes'] += 1
+            return False
+        return True
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self._counters['writes'] += 1
+        data = self.serializer.encode(session)
+        expiry = _utcnow() + session_lifetime
+        self.backend.save(store_id, data, expiry)
+        if self.versions is not None:
+            # Depois de gravar: os outros workers descartam a cópia antiga
+            self._cache(store_id, (data, expiry, self.versions.bump(store_id) + 1))
+        session.stored_data, session.stored_expiry = data, expiry
+
+    def _delete_session(self, store_id):
+        self._counters['deletes'] += 1
+        self.cache.delete(store_id)
+        self.backend.delete(store_id)
+        if self.versions is not None:
+            self.versions.bump(store_id)
+
+    def _delete_expired_sessions(self):
+        deleted = self.backend.delete_expired(_utcnow())
+        print(f'{deleted} sessões expiradas removidas')
+
+    # Métricas
+
+    def stats(self):
+        counters = dict(self._counters)
+        requests = counters['requests'] or 1
+        return {
+            'backend': self.backend.name,
+            **counters,
+            'reads_per_request': round(counters['backend_reads'] / requests, 3),
+            'writes_per_request': round(counters['writes'] / requests, 3),
+            'cache': self.cache.stats()
+        }
+
+
+def create_backend(db):
+    if Config.SESSION_BACKEND == 'sqlite':
+        return SqliteSessionBackend(Config.SESSION_SQLITE_PATH)
+    if Config.SESSION_BACKEND == 'sqlalchemy':
+        return SqlAlchemySessionBackend(db, Config.SESSION_SQLALCHEMY_TABLE)
+    raise ValueError(f'SESSION_BACKEND desconhecido: {Config.SESSION_BACKEND}')
+
+
+def init_app(app, db):
+    """Instala a interface de sessão configurada na aplicação e a retorna"""
+    app.session_interface = CachedSessionInterface(app, create_backend(db))
+    return app.session_interface
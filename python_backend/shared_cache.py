@@ -0,0 +1,267 @@
+"""
+Cache compartilhado entre os processos (workers) de um mesmo host.
+
+Tabela hash de endereçamento aberto em um arquivo mapeado em memória (de
+preferência em /dev/shm), com slots de tamanho fixo e sondagem linear.
+
+- Leituras não usam lock: cada slot tem um contador de sequência (seqlock).
+  O escritor deixa o contador ímpar durante a escrita; o leitor descarta o
+  slot se o contador estiver ímpar ou mudar durante a cópia. Um worker que
+  morra no meio de uma escrita deixa apenas um slot ímpar, tratado como
+  ausente e sobrescrito na próxima escrita.
+- Escritas usam flock não bloqueante: se outro processo estiver escrevendo,
+  a escrita é descartada (é só cache). O kernel libera o flock quando o
+  processo morre, então um worker travado/morto nunca bloqueia os demais.
+
+Layout do slot:
+    seq(u32) | reservado(u32) | hash(u64) | expira_em(f64) | tam_chave(u16) | tam_valor(u16)
+    chave (KEY_SIZE bytes) | valor JSON (restante do slot)
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import mmap
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, o cache compartilhado fica desativado
+    fcntl = None
+
+MAGIC = b'AMFASHC1'
+FILE_HEADER = struct.Struct('<8sII')
+FILE_HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<IIQdHH')
+SEQ = struct.Struct('<I')
+KEY_SIZE = 48
+SLOT_SIZE = 256
+VALUE_SIZE = SLOT_SIZE - SLOT_HEADER.size - KEY_SIZE
+
+# Quantidade de slots examinados a partir da posição da chave
+MAX_PROBES = 8
+
+
+def _key_hash(key_bytes):
+    # hash() do Python varia por processo; o cache precisa de um hash estável
+    value = int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+    return value or 1  # 0 marca slot vazio
+
+
+class SharedCache:
+    """Cache chave -> valor JSON com TTL, compartilhado via mmap entre processos"""
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._fd = None
+        self._mm = None
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'write_skipped': 0, 'torn_reads': 0}
+
+    def _open(self):
+        """Abre o arquivo uma vez por processo (o flock não pode ser herdado pelo fork)"""
+        if self._pid == os.getpid():
+            return self._mm
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return self._mm
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = FILE_HEADER_SIZE + self.slots * SLOT_SIZE
+            # Inicialização: bloqueia apenas aqui, uma vez por processo
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, FILE_HEADER.size, 0)
+                if len(header) == FILE_HEADER.size and FILE_HEADER.unpack(header)[0] == MAGIC:
+                    _, self.slots, slot_size = FILE_HEADER.unpack(header)
+                    if slot_size != SLOT_SIZE:
+                        raise ValueError(f'Cache compartilhado {self.path} usa slots de {slot_size} bytes')
+                    size = FILE_HEADER_SIZE + self.slots * SLOT_SIZE
+                else:
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, FILE_HEADER.pack(MAGIC, self.slots, SLOT_SIZE), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self._pid = os.getpid()
+            return self._mm
+
+    def _offset(self, index):
+        return FILE_HEADER_SIZE + index * SLOT_SIZE
+
+    def _read_slot(self, mm, offset):
+        """Copia o slot de forma consistente; None se estiver sendo escrito"""
+        (seq_before,) = SEQ.unpack_from(mm, offset)
+        if seq_before & 1:
+            return None
+        data = mm[offset:offset + SLOT_SIZE]
+        (seq_after,) = SEQ.unpack_from(mm, offset)
+        if seq_after != seq_before:
+            return None
+        return data
+
+    def get(self, key):
+        """Retorna (encontrado, valor) sem nunca bloquear"""
+        mm = self._open()
+        key_bytes = key.encode('utf-8')[:KEY_SIZE]
+        key_hash = _key_hash(key_bytes)
+        start = key_hash % self.slots
+        for probe in range(MAX_PROBES):
+            offset = self._offset((start + probe) % self.slots)
+            data = self._read_slot(mm, offset)
+            if data is None:
+                self._counters['torn_reads'] += 1
+                continue
+            _, _, slot_hash, expires_at, key_len, value_len = SLOT_HEADER.unpack_from(data, 0)
+            if slot_hash == 0:
+                break
+            if slot_hash != key_hash or data[SLOT_HEADER.size:SLOT_HEADER.size + key_len] != key_bytes:
+                continue
+            if expires_at <= time.time():
+                break
+            value_offset = SLOT_HEADER.size + KEY_SIZE
+            self._counters['hits'] += 1
+            return True, json.loads(data[value_offset:value_offset + value_len])
+        self._counters['misses'] += 1
+        return False, None
+
+    def set(self, key, value, ttl):
+        """Grava a entrada; descarta a escrita se outro processo estiver escrevendo"""
+        mm = self._open()
+        key_bytes = key.encode('utf-8')[:KEY_SIZE]
+        value_bytes = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        if len(value_bytes) > VALUE_SIZE:
+            return False
+        key_hash = _key_hash(key_bytes)
+        start = key_hash % self.slots
+
+        with self._write_lock:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._counters['write_skipped'] += 1
+                return False
+            try:
+                # Escolhe o slot: mesma chave > vazio > expirado > o que expira antes
+                now = time.time()
+                target, target_expires = None, None
+                for probe in range(MAX_PROBES):
+                    offset = self._offset((start + probe) % self.slots)
+                    seq, _, slot_hash, expires_at, key_len, _ = SLOT_HEADER.unpack_from(mm, offset)
+                    if seq & 1 or slot_hash == 0:
+                        # Vazio ou deixado pela metade por um worker que morreu
+                        target = offset
+                        break
+                    if slot_hash == key_hash and mm[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + key_len] == key_bytes:
+                        target = offset
+                        break
+                    if target is None or expires_at < target_expires:
+                        target, target_expires = offset, expires_at
+                    if expires_at <= now:
+                        break
+
+                (seq,) = SEQ.unpack_from(mm, target)
+                seq = (seq | 1) & 0xFFFFFFFF
+                SEQ.pack_into(mm, target, seq)
+                SLOT_HEADER.pack_into(mm, target, seq, 0, key_hash, now + ttl, len(key_bytes), len(value_bytes))
+                key_start = target + SLOT_HEADER.size
+                mm[key_start:key_start + len(key_bytes)] = key_bytes
+                mm[key_start + KEY_SIZE:key_start + KEY_SIZE + len(value_bytes)] = value_bytes
+                SEQ.pack_into(mm, target, (seq + 1) & 0xFFFFFFFF)
+                self._counters['writes'] += 1
+                return True
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def stats(self):
+        return {'slots': self.slots, **self._counters}
+
+
+VERSIONS_MAGIC = b'AMFASHV1'
+VERSION = struct.Struct('<Q')
+
+
+class SharedVersions:
+    """Versão (time.time_ns() da última mudança) por chave, compartilhada via mmap entre processos
+
+    Cada chave cai em um slot de 8 bytes pelo hash; chaves no mesmo slot
+    dividem a versão (uma mudança invalida as duas, nunca deixa de invalidar).
+    Leituras não usam lock; escritas usam flock bloqueante (são raras e curtas).
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._fd = None
+        self._mm = None
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _open(self):
+        """Abre o arquivo uma vez por processo (o flock não pode ser herdado pelo fork)"""
+        if self._pid == os.getpid():
+            return self._mm
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return self._mm
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, FILE_HEADER.size, 0)
+                if len(header) == FILE_HEADER.size and FILE_HEADER.unpack(header)[0] == VERSIONS_MAGIC:
+                    self.slots = FILE_HEADER.unpack(header)[1]
+                else:
+                    os.ftruncate(fd, FILE_HEADER_SIZE + self.slots * VERSION.size)
+                    os.pwrite(fd, FILE_HEADER.pack(VERSIONS_MAGIC, self.slots, VERSION.size), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._mm = mmap.mmap(fd, FILE_HEADER_SIZE + self.slots * VERSION.size,
+                                 mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self._pid = os.getpid()
+            return self._mm
+
+    def _offset(self, key):
+        return FILE_HEADER_SIZE + _key_hash(key.encode('utf-8')) % self.slots * VERSION.size
+
+    def get(self, key):
+        """Versão atual da chave (0 se nunca mudou)"""
+        mm = self._open()
+        offset = self._offset(key)
+        while True:
+            # Lê duas vezes: descarta uma leitura no meio de uma escrita
+            (version,) = VERSION.unpack_from(mm, offset)
+            if VERSION.unpack_from(mm, offset)[0] == version:
+                return version
+
+    def bump(self, key):
+        """Marca a chave como alterada agora; retorna a versão gravada"""
+        mm = self._open()
+        offset = self._offset(key)
+        with self._write_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                version = max(time.time_ns(), VERSION.unpack_from(mm, offset)[0] + 1)
+                VERSION.pack_into(mm, offset, version)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return version
+
+
+def create_shared_versions(path, slots):
+    """Cria a tabela de versões compartilhada ou retorna None se estiver desativada/indisponível"""
+    if not path or fcntl is None:
+        return None
+    return SharedVersions(path, slots)
+
+
+def create_shared_cache(path, slots):
+    """Cria o cache compartilhado ou retorna None se estiver desativado/indisponível"""
+    if not path or fcntl is None:
+        return None
+    return SharedCache(path, slots)
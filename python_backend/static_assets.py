@@ -0,0 +1,194 @@
+"""
+Arquivos do frontend servidos da memória, com fingerprint e pré-compressão.
+
+Na inicialização (create_app) todos os arquivos de frontend/ são lidos uma
+vez e mantidos em um manifesto em memória:
+
+- cada arquivo ganha um nome com o hash do conteúdo (js/app.3f9c2a1b7d0e.js),
+  servido com Cache-Control imutável de STATIC_MAX_AGE; o index.html é
+  reescrito para apontar para esses nomes
+- os nomes originais (e o index.html, também usado como fallback da SPA)
+  continuam disponíveis com `no-cache`: o navegador revalida pelo ETag e
+  recebe 304 enquanto o conteúdo não muda
+- variantes gzip e brotli (pacote opcional `brotli`) são geradas uma vez, para
+  arquivos a partir de STATIC_COMPRESS_MIN_SIZE bytes, e escolhidas pelo
+  Accept-Encoding da requisição
+
+Nenhuma requisição acessa o sistema de arquivos. Em modo debug o manifesto é
+refeito quando algum arquivo muda.
+"""
+import copy
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from flask import Response, current_app, request
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # Sem o pacote: só gzip
+    brotli = None
+
+INDEX = 'index.html'
+
+# Codificações na ordem de preferência quando o cliente aceita as duas
+ENCODINGS = ('br', 'gzip')
+
+# Referências locais do index.html reescritas para os nomes com fingerprint
+_REFERENCE = re.compile(r'(\b(?:href|src)=")([^"#?:]+)(")')
+
+
+class Asset:
+    """Um arquivo do frontend e as variantes comprimidas"""
+
+    def __init__(self, path, content, immutable):
+        self.path = path
+        self.immutable = immutable
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        self.variants = {'identity': content}
+        if len(content) >= Config.STATIC_COMPRESS_MIN_SIZE:
+            compressed = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(content, quality=11)
+            for encoding, data in compressed.items():
+                # Só mantém a variante se ela for menor
+                if len(data) < len(content):
+                    self.variants[encoding] = data
+
+    def fingerprinted_path(self):
+        base, ext = os.path.splitext(self.path)
+        return f'{base}.{self.digest}{ext}'
+
+    def with_fingerprint(self):
+        """Cópia servida pelo nome com fingerprint (mesmo conteúdo, cache imutável)"""
+        asset = copy.copy(self)
+        asset.path = self.fingerprinted_path()
+        asset.immutable = True
+        return asset
+
+    def etag(self, encoding):
+        # ETag forte: um valor por representação
+        return self.digest if encoding == 'identity' else f'{self.digest}-{encoding}'
+
+
+class StaticAssets:
+    """Manifesto em memória dos arquivos do frontend"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._fingerprints = {}
+        self._mtime = None
+        self._counters = {'requests': 0, 'not_modified': 0, 'compressed': 0, 'bytes_sent': 0}
+        self.build()
+
+    # Construção
+
+    def _scan(self):
+        """[(caminho relativo com '/', caminho absoluto)] dos arquivos do frontend"""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                full_path = os.path.join(directory, name)
+                files.append((os.path.relpath(full_path, self.root).replace(os.sep, '/'), full_path))
+        return sorted(files)
+
+    def _latest_mtime(self, files):
+        return max((os.stat(full_path).st_mtime_ns for _, full_path in files), default=0)
+
+    def build(self):
+        """Lê, aplica fingerprint e comprime todos os arquivos"""
+        files = self._scan()
+        assets = {}
+        fingerprints = {}
+        for path, full_path in files:
+            if path == INDEX:
+                continue
+            with open(full_path, 'rb') as f:
+                asset = Asset(path, f.read(), immutable=False)
+            assets[path] = asset
+            fingerprinted = asset.fingerprinted_path()
+            fingerprints[path] = fingerprinted
+            assets[fingerprinted] = asset.with_fingerprint()
+
+        index_path = os.path.join(self.root, INDEX)
+        if os.path.isfile(index_path):
+            with open(index_path, encoding='utf-8') as f:
+                html = _REFERENCE.sub(
+                    lambda m: m.group(1) + fingerprints.get(m.group(2).lstrip('/'), m.group(2)) + m.group(3),
+                    f.read()
+                )
+            assets[INDEX] = Asset(INDEX, html.encode('utf-8'), immutable=False)
+
+        with self._lock:
+            self._assets = assets
+            self._fingerprints = fingerprints
+            self._mtime = self._latest_mtime(files)
+        print(f'{len(fingerprints) + (INDEX in assets)} arquivos estáticos em memória'
+              f" ({'gzip e brotli' if brotli else 'gzip'})")
+
+    def _reload_if_changed(self):
+        if self._latest_mtime(self._scan()) != self._mtime:
+            self.build()
+
+    # Consulta
+
+    def get(self, path):
+        """Asset do caminho (sem a barra inicial) ou None"""
+        if current_app.debug:
+            self._reload_if_changed()
+        return self._assets.get(path)
+
+    @property
+    def index(self):
+        return self.get(INDEX)
+
+    def url_for(self, path):
+        """Caminho com fingerprint de um arquivo (para templates e e-mails)"""
+        return self._fingerprints.get(path, path)
+
+    # Resposta
+
+    def _choose_encoding(self, asset):
+        accepted = request.accept_encodings
+        for encoding in ENCODINGS:
+            if encoding in asset.variants and accepted.quality(encoding) > 0:
+                return encoding
+        return 'identity'
+
+    def response(self, asset):
+        self._counters['requests'] += 1
+        encoding = self._choose_encoding(asset)
+        etag = asset.etag(encoding)
+
+        if request.if_none_match.contains_weak(etag):
+            self._counters['not_modified'] += 1
+            response = Response(status=304)
+        else:
+            body = asset.variants[encoding]
+            response = Response(body, content_type=asset.content_type)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+                self._counters['compressed'] += 1
+            self._counters['bytes_sent'] += len(body)
+
+        response.set_etag(etag)
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        if asset.immutable:
+            response.headers['Cache-Control'] = f'public, max-age={Config.STATIC_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def stats(self):
+        return {'assets': len(self._assets), 'brotli': brotli is not None, **self._counters}
@@ -0,0 +1,65 @@
+"""
+Aplicação de teste: SQLite temporário, sem SMTP nem rede (geolocalização fixa),
+bcrypt barato e gravações de auditoria/força bruta síncronas, para que as
+consultas de cada requisição sejam determinísticas.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Antes de importar a configuração (lida das variáveis de ambiente na importação)
+_TMP = tempfile.mkdtemp(prefix='amfa-tests-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_TMP, 'test.db')}",
+    RATELIMIT_STORAGE_URI=f"sqlite:///{os.path.join(_TMP, 'ratelimit.db')}",
+    RATELIMIT_DEFAULT='1000000 per hour',
+    SESSION_SQLITE_PATH=os.path.join(_TMP, 'sessions.db'),
+    SESSION_VERSIONS_PATH=os.path.join(_TMP, 'session-versions.bin'),
+    MAIL_SPOOL_DIR=os.path.join(_TMP, 'mail_spool'),
+    AUDIT_DEAD_LETTER_DIR=os.path.join(_TMP, 'audit_dead_letter'),
+    GEO_SHARED_CACHE_PATH='',
+    SMTP_USER='',
+    METRICS_ENABLED='false',
+    QUERY_BUDGET_MODE='raise',
+    BRUTE_FORCE_BACKEND='db',
+    AUDIT_WRITE_BEHIND='false',
+    AUTH_MODE='session',
+)
+
+import pytest  # noqa: E402
+from config import Config  # noqa: E402
+
+Config.BCRYPT_LOG_ROUNDS = 4
+
+VERIFICATION_CODE = '123456'
+PASSWORD = 'Senha-de-teste-123'
+
+
+def fake_location(ip_address):
+    return {'city': 'São Paulo', 'region': 'São Paulo', 'country': 'Brazil', 'lat': -23.5505, 'lng': -46.6333}
+
+
+@pytest.fixture(scope='session')
+def app():
+    import security
+    import routes
+    from datetime import timedelta
+    from app import create_app, init_db
+    from models import get_sp_now
+
+    security.LOCATION_PROVIDERS['fake'] = fake_location
+    Config.GEOIP_PROVIDERS = ['fake']
+    routes.generate_verification_code = lambda: (VERIFICATION_CODE, get_sp_now() + timedelta(minutes=15))
+
+    app = create_app()
+    app.testing = True
+    init_db(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
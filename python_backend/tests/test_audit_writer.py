@@ -0,0 +1,68 @@
+"""Lotes com falha na gravação em segundo plano (audit_writer.py)"""
+import json
+import os
+from sqlalchemy.exc import OperationalError
+from config import Config
+from models import db, AccessLog, LoginAttempt, generate_uuid, get_sp_now
+from audit_writer import AuditWriter
+
+
+def access_row(row_id=None):
+    return {'id': row_id or generate_uuid(), 'user_id': None, 'action': 'login', 'success': False,
+            'ip_address': '10.1.0.1', 'user_agent': None, 'location': None, 'device_info': None,
+            'login_time': get_sp_now(), 'blocked_reason': None, 'session_blocked': False}
+
+
+def attempt_row():
+    return {'id': generate_uuid(), 'email': 'lote@example.com', 'ip_address': '10.1.0.1',
+            'success': False, 'attempted_at': get_sp_now()}
+
+
+def test_bad_row_does_not_block_the_queue(app):
+    writer = AuditWriter()
+    with app.app_context():
+        existing = access_row()
+        writer._write(db.session.connection(), [existing], [])
+        db.session.commit()
+
+        # A linha com id repetido falha sempre (chave primária); as demais devem ser gravadas
+        good = [access_row() for _ in range(9)]
+        writer._access_logs.extend(good[:4] + [access_row(existing['id'])] + good[4:])
+        attempts = [attempt_row() for _ in range(3)]
+        writer._login_attempts.extend(attempts)
+        writer._flush()
+
+        stats = writer.stats()
+        assert stats['pending'] == 0
+        assert stats['persisted'] == len(good) + len(attempts)
+        assert stats['dead_letter'] == 1 and stats['lost'] == 0
+        assert AccessLog.query.filter(AccessLog.id.in_([row['id'] for row in good])).count() == len(good)
+        assert LoginAttempt.query.filter(LoginAttempt.id.in_([row['id'] for row in attempts])).count() == 3
+
+        path = os.path.join(Config.AUDIT_DEAD_LETTER_DIR, f'audit-{os.getpid()}.jsonl')
+        with open(path, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        assert [entry['row']['id'] for entry in entries] == [existing['id']]
+
+
+def test_connection_errors_are_retried_up_to_the_limit(app, monkeypatch):
+    writer = AuditWriter()
+    calls = []
+
+    def unavailable(conn, access_logs, login_attempts):
+        calls.append(len(access_logs))
+        raise OperationalError('INSERT', {}, Exception('banco fora do ar'))
+
+    monkeypatch.setattr(writer, '_write', unavailable)
+    with app.app_context():
+        writer._access_logs.extend(access_row() for _ in range(2))
+        for _ in range(Config.AUDIT_MAX_RETRIES):
+            writer._flush()
+            # O lote volta inteiro para a fila a cada tentativa
+            assert writer.stats()['pending'] == 2
+        writer._flush()
+
+    # Esgotadas as tentativas, o lote é gravado em partes e as linhas vão para o dead-letter
+    assert calls == [2] * (Config.AUDIT_MAX_RETRIES + 2) + [1, 1]
+    stats = writer.stats()
+    assert stats['pending'] == 0 and stats['dead_letter'] == 2
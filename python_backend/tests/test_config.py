@@ -0,0 +1,13 @@
+"""Verificações da configuração em create_app"""
+import pytest
+from config import Config
+from app import create_app
+
+
+class TypoProviderConfig(Config):
+    GEOIP_PROVIDERS = ['local', 'htpp']
+
+
+def test_unknown_location_provider_is_rejected():
+    with pytest.raises(ValueError, match='htpp'):
+        create_app(TypoProviderConfig)
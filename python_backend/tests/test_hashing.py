@@ -0,0 +1,25 @@
+"""Recuperação do pool de processos do bcrypt (hashing.py)"""
+import os
+import signal
+import time
+import pytest
+from hashing import HashingService, HashingUnavailable
+
+
+def test_pool_is_rebuilt_after_a_process_dies():
+    service = HashingService(workers=1)
+    hashed = service.hash_password('senha-antes')
+    executor = service._executor
+
+    for pid in list(executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    deadline = time.monotonic() + 10
+    while not executor._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # A requisição que encontra o pool quebrado recebe 503; a seguinte usa um pool novo
+    with pytest.raises(HashingUnavailable):
+        service.check_password('senha-antes', hashed)
+    assert service.check_password('senha-antes', hashed) is True
+    assert service._executor is not executor
+    assert service.stats()['broken'] == 1
@@ -0,0 +1,36 @@
+"""Medição do armazenamento do limitador (limiter_storage.StorageTimer)"""
+import threading
+import pytest
+from limiter_storage import StorageTimer
+
+
+class CountingStorage:
+    def incr(self, key, expiry, amount=1):
+        if key == 'falha':
+            raise ConnectionError('armazenamento fora do ar')
+        return amount
+
+    def get(self, key):
+        return 0
+
+
+def test_counters_are_exact_under_concurrency():
+    timer = StorageTimer()
+    storage = timer.instrument(CountingStorage())
+    threads, calls = 8, 2000
+
+    def hammer():
+        for _ in range(calls):
+            storage.incr('chave', 60)
+
+    workers = [threading.Thread(target=hammer) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with pytest.raises(ConnectionError):
+        storage.incr('falha', 60)
+
+    incr = timer.stats()['operations']['incr']
+    assert incr['calls'] == threads * calls + 1
+    assert incr['errors'] == 1
@@ -0,0 +1,33 @@
+"""Corte do estado de localização por usuário (location_state.py)"""
+from datetime import timedelta
+from config import Config
+from models import db, User, UserLocation, get_sp_now
+from location_state import record_locations, recent_locations
+
+
+def log(index, user_id, success, when, lat):
+    return {'id': f'log-{user_id}-{index}', 'user_id': user_id, 'ip_address': f'10.0.0.{index % 250}',
+            'location': {'lat': lat, 'lng': -46.6}, 'success': success, 'login_time': when}
+
+
+def test_failed_logins_do_not_evict_successful_history(app):
+    size = Config.LOCATION_STATE_SIZE
+    with app.app_context():
+        user = User(name='Estado', email='estado@example.com', password='x', is_email_confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        start = get_sp_now() - timedelta(days=1)
+
+        with db.engine.begin() as connection:
+            record_locations(connection, [log(0, user.id, True, start, -23.5)])
+            # Uma rajada de falhas, bem mais que o tamanho do estado
+            record_locations(connection, [
+                log(i, user.id, False, start + timedelta(minutes=i), 40.7) for i in range(1, 3 * size)
+            ])
+
+        rows = recent_locations(user.id)
+        successes = [row for row in rows if row[3]]
+        assert len(successes) == 1 and successes[0][1] == -23.5
+        assert len(rows) - len(successes) == size
+        assert UserLocation.query.filter_by(user_id=user.id, success=True).count() == 1
+        assert UserLocation.query.filter_by(user_id=user.id, success=False).count() == size
@@ -0,0 +1,48 @@
+"""Cabeçalhos das mensagens montadas por mail_queue.build_message"""
+import time
+import pytest
+from mail_queue import PermanentDeliveryError, build_message
+
+
+def record(**overrides):
+    return {
+        'id': 'teste-1', 'to': 'destino@example.com', 'subject': 'Assunto', 'html': '<p>Olá</p>',
+        'text': 'Olá', 'attempts': 0, 'enqueued_at': time.time(), 'next_attempt_at': 0, **overrides,
+    }
+
+
+def test_headers():
+    message = build_message(record(subject='Código de verificação'))
+    head = message.split(b'\r\n\r\n', 1)[0]
+    assert b'To: destino@example.com\r\n' in head
+    assert b'Subject: =?utf-8?' in head
+
+
+@pytest.mark.parametrize('field, value', [
+    ('to', 'a@b.com\r\nBcc: x@y.com'),
+    ('to', 'a@b.com\nBcc: x@y.com'),
+    ('subject', 'Assunto\r\nBcc: x@y.com'),
+])
+def test_header_injection_rejected(field, value):
+    with pytest.raises(PermanentDeliveryError):
+        build_message(record(**{field: value}))
+
+
+@pytest.mark.parametrize('email', ['a@b.com\r\nbcc: x@y.com', 'sem-arroba', 'a b@c.com', 'a@b'])
+def test_register_rejects_invalid_email(client, email):
+    response = client.post('/api/auth/register', json={'name': 'X', 'email': email, 'password': 'Senha-123'})
+    assert response.status_code == 400
+
+
+def test_folded_subject_uses_crlf():
+    from email_templates import get_catalog
+
+    subject, html_body, text_body = get_catalog('pt_BR').render(
+        'security_alert', name='Usuária', code='123456', ip_address='203.0.113.7',
+        location='São Paulo, São Paulo, Brazil', timestamp='01/01/2026 12:00', expiry_minutes=15
+    )
+    message = build_message(record(subject=subject, html=html_body, text=text_body))
+    head = message.split(b'\r\n\r\n', 1)[0]
+    # O assunto longo é dobrado em mais de uma linha
+    assert b'Subject: =?utf-8?' in head and b'\r\n =?utf-8?' in head
+    assert message.count(b'\n') == message.count(b'\r\n')
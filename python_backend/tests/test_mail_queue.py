@@ -0,0 +1,27 @@
+"""Varredura do spool da fila de emails (mail_queue.py)"""
+import os
+import time
+from mail_queue import MailQueue, SPOOL_SUBDIRS
+
+
+def spooled_queue(tmp_path, *msg_ids):
+    queue = MailQueue(spool_dir=str(tmp_path), workers=1)
+    for subdir in SPOOL_SUBDIRS:
+        os.makedirs(tmp_path / subdir, exist_ok=True)
+    for msg_id in msg_ids:
+        queue._write_record('pending', {'id': msg_id, 'to': 'a@example.com', 'subject': 's', 'html': '',
+                                        'text': None, 'attempts': 1, 'enqueued_at': time.time(),
+                                        'next_attempt_at': time.time() + 300})
+    return queue
+
+
+def test_rescan_skips_messages_already_queued_or_scheduled(tmp_path):
+    queue = spooled_queue(tmp_path, 'agendada', 'orfa')
+    queue._schedule('agendada', time.time() + 300)
+
+    queue._recover_spool()
+    queue._recover_spool()
+
+    assert queue._ready.qsize() == 1 and queue._ready.get_nowait() == 'orfa'
+    assert len(queue._delayed) == 1
+    assert queue.stats()['depth'] == 1
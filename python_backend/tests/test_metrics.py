@@ -0,0 +1,52 @@
+"""Soma das métricas entre processos (METRICS_DIR em metrics.py)"""
+import multiprocessing
+import os
+import re
+import pytest
+from config import Config
+import metrics
+
+
+def _worker_requests(count):
+    for _ in range(count):
+        metrics.inc('amfa_logins_total', (('result', 'success'),))
+        metrics.observe('amfa_stage_duration_seconds', (('route', 'auth.login'), ('stage', 'bcrypt_check')), 0.2)
+    metrics.write_process_file()
+
+
+def value(text, series):
+    match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_counters_are_summed_across_processes(metrics_dir):
+    login = 'amfa_logins_total{result="success"}'
+    stage = 'amfa_stage_duration_seconds_count{route="auth.login",stage="bcrypt_check"}'
+    before = metrics.render()
+
+    context = multiprocessing.get_context('fork')
+    for count in (3, 4):
+        worker = context.Process(target=_worker_requests, args=(count,))
+        worker.start()
+        worker.join()
+        assert worker.exitcode == 0
+    metrics.inc('amfa_logins_total', (('result', 'success'),))
+
+    # Os workers encerrados continuam somados (o contador não volta)
+    text = metrics.render()
+    assert value(text, login) == value(before, login) + 8
+    assert value(text, stage) == value(before, stage) + 7
+    assert sorted(os.listdir(metrics_dir)) == ['.lock', f'metrics-{os.getpid()}.json', 'metrics-retired.json']
+    assert value(metrics.render(), login) == value(text, login)
+
+
+def test_gauges_are_labeled_by_process(metrics_dir, monkeypatch):
+    monkeypatch.setitem(metrics._collectors, 'test_queue', lambda: {'pending': 2})
+    text = metrics.render()
+    assert f'amfa_test_queue_pending{{pid="{os.getpid()}"}} 2' in text
@@ -0,0 +1,109 @@
+"""
+Orçamento de consultas SQL das rotas de autenticação (ver query_budget.py).
+
+A aplicação de teste roda com QUERY_BUDGET_MODE='raise': uma requisição acima
+de Config.QUERY_BUDGETS, ou que repete a mesma instrução, falha o teste. Cada
+caso também declara o próprio limite com expect_queries. Aumentar um limite
+aqui deve ser uma decisão explícita na revisão.
+"""
+import itertools
+import pytest
+from config import Config
+from query_budget import QueryBudgetExceeded, expect_queries
+from conftest import PASSWORD, VERIFICATION_CODE
+
+HEADERS = {'X-Forwarded-For': '200.160.0.8', 'User-Agent': 'pytest'}
+
+_emails = (f'usuario{i}@example.com' for i in itertools.count())
+
+
+def budget(route):
+    return expect_queries(Config.QUERY_BUDGETS[route], max_repeats=Config.QUERY_REPEAT_THRESHOLD)
+
+
+@pytest.fixture
+def account(client):
+    """Usuário cadastrado e confirmado, sem sessão aberta"""
+    email = next(_emails)
+    response = client.post('/api/auth/register', json={'name': 'Teste', 'email': email, 'password': PASSWORD},
+                           headers=HEADERS)
+    assert response.status_code == 201
+    response = client.post('/api/auth/verify-code', json={'email': email, 'code': VERIFICATION_CODE}, headers=HEADERS)
+    assert response.status_code == 200
+    client.post('/api/auth/logout', headers=HEADERS)
+    return email
+
+
+def login(client, email, password=PASSWORD):
+    return client.post('/api/auth/login', json={'email': email, 'password': password}, headers=HEADERS)
+
+
+def test_register_budget(client):
+    with budget('auth.register'):
+        response = client.post('/api/auth/register', json={
+            'name': 'Novo', 'email': next(_emails), 'password': PASSWORD
+        }, headers=HEADERS)
+    assert response.status_code == 201
+
+
+def test_login_budget(client, account):
+    with budget('auth.login') as ledger:
+        response = login(client, account)
+    assert response.status_code == 200
+    assert 'requiresSecurity' not in response.get_json()
+    assert ledger.queries > 0
+
+
+def test_failed_login_budget(client, account):
+    with budget('auth.login'):
+        assert login(client, account, password='senha-errada').status_code == 401
+    with budget('auth.login'):
+        assert login(client, 'inexistente@example.com').status_code == 401
+
+
+def test_me_budget(client, account):
+    assert login(client, account).status_code == 200
+    with budget('auth.get_current_user'):
+        response = client.get('/api/auth/me', headers=HEADERS)
+    assert response.status_code == 200
+
+
+def test_access_logs_budget(client, account):
+    assert login(client, account).status_code == 200
+    with budget('auth.get_access_logs'):
+        response = client.get('/api/auth/access-logs?limit=20', headers=HEADERS)
+    assert response.status_code == 200
+
+
+def test_expect_queries_fails_above_limit(client, account):
+    with pytest.raises(QueryBudgetExceeded):
+        with expect_queries(1):
+            login(client, account)
+
+
+def test_route_budget_enforced(app, client, account):
+    budgets = app.config['QUERY_BUDGETS']
+    original = budgets['auth.get_current_user']
+    assert login(client, account).status_code == 200
+    budgets['auth.get_current_user'] = 0
+    try:
+        with pytest.raises(QueryBudgetExceeded, match='auth.get_current_user'):
+            client.get('/api/auth/me', headers=HEADERS)
+    finally:
+        budgets['auth.get_current_user'] = original
+
+
+def test_repeated_statement_detected(app):
+    from models import User
+
+    with app.app_context():
+        with pytest.raises(QueryBudgetExceeded, match='vezes'):
+            with expect_queries(100, max_repeats=Config.QUERY_REPEAT_THRESHOLD):
+                for i in range(Config.QUERY_REPEAT_THRESHOLD):
+                    User.query.filter_by(email=f'n-mais-um-{i}@example.com').first()
+
+        # Instruções diferentes não são repetição
+        with expect_queries(100, max_repeats=Config.QUERY_REPEAT_THRESHOLD) as ledger:
+            User.query.filter_by(email='a@example.com').first()
+            User.query.filter_by(id='x').first()
+        assert ledger.queries == 2
@@ -0,0 +1,24 @@
+"""Cache de sessões entre workers (session_store.py)"""
+from datetime import timedelta
+from config import Config
+from session_store import CachedSessionInterface, SqliteSessionBackend, StoredSession
+
+
+def test_logout_in_one_worker_is_seen_by_the_others(app):
+    # Dois workers do mesmo host: mesmo arquivo de sessões e mesma tabela de versões
+    worker_a = CachedSessionInterface(app, SqliteSessionBackend(Config.SESSION_SQLITE_PATH))
+    worker_b = CachedSessionInterface(app, SqliteSessionBackend(Config.SESSION_SQLITE_PATH))
+    store_id = 'session:entre-workers'
+    lifetime = timedelta(hours=1)
+
+    worker_a._upsert_session(lifetime, StoredSession({'userId': 'u1'}, sid='entre-workers'), store_id)
+    assert worker_b._retrieve_session_data(store_id) == {'userId': 'u1'}
+    assert worker_b._retrieve_session_data(store_id) == {'userId': 'u1'}
+    assert worker_b.stats()['cache_hits'] == 1
+
+    worker_a._upsert_session(lifetime, StoredSession({'userId': 'u1', 'userRole': 'admin'}, sid='entre-workers'), store_id)
+    assert worker_b._retrieve_session_data(store_id) == {'userId': 'u1', 'userRole': 'admin'}
+
+    worker_a._delete_session(store_id)
+    assert worker_b._retrieve_session_data(store_id) is None
+    assert worker_b.stats()['cache_invalidations'] == 2
@@ -0,0 +1,9 @@
+"""Rota do frontend (serve em app.py)"""
+from static_assets import INDEX
+
+
+def test_missing_index_returns_404(app, client, monkeypatch):
+    assets = app.extensions['static_assets']
+    monkeypatch.delitem(assets._assets, INDEX, raising=False)
+    monkeypatch.setattr(app, 'debug', False)
+    assert client.get('/pagina/inexistente').status_code == 404
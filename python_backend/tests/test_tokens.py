@@ -0,0 +1,48 @@
+"""Chave dos tokens e lista de revogados (tokens.py)"""
+import time
+import pytest
+from config import Config
+from app import create_app
+from tokens import TokenDenylist, DenylistUnavailable, encode_token
+
+
+class TokenConfig(Config):
+    AUTH_MODE = 'token'
+    TOKEN_SECRET = ''
+
+
+class UnavailableApp:
+    def app_context(self):
+        raise RuntimeError('banco fora do ar')
+
+
+def test_token_mode_requires_an_explicit_secret():
+    with pytest.raises(ValueError, match='TOKEN_SECRET'):
+        create_app(TokenConfig)
+
+
+def test_denylist_loads_in_the_background(app):
+    denylist = TokenDenylist()
+    denylist.init_app(app)
+    assert denylist.is_revoked('família-qualquer') is False
+    assert denylist.stats()['reloads'] >= 1
+
+
+def test_denylist_fails_closed_when_it_cannot_load(monkeypatch):
+    monkeypatch.setattr(Config, 'TOKEN_DENYLIST_WAIT', 0.2)
+    denylist = TokenDenylist()
+    denylist.init_app(UnavailableApp())
+    with pytest.raises(DenylistUnavailable):
+        denylist.is_revoked('família-qualquer')
+    stats = denylist.stats()
+    assert stats['reload_errors'] >= 1 and stats['unavailable'] == 1
+
+
+def test_unavailable_denylist_returns_503(client, monkeypatch):
+    monkeypatch.setattr(Config, 'AUTH_MODE', 'token')
+    monkeypatch.setattr(Config, 'TOKEN_SECRET', 'segredo-de-teste')
+    monkeypatch.setattr(Config, 'TOKEN_DENYLIST_WAIT', 0.1)
+    now = int(time.time())
+    token = encode_token({'sub': 'u', 'role': 'user', 'iat': now, 'exp': now + 60, 'sid': 's', 'typ': 'access'})
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 503
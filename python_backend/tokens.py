@@ -0,0 +1,194 @@
+"""
+Tokens de acesso assinados (modo de autenticação sem estado).
+
+Com AUTH_MODE = 'token' ou 'both', login, verify-code e verify-security
+retornam um token de acesso curto (ACCESS_TOKEN_TTL) e um token de renovação
+(REFRESH_TOKEN_TTL). O token é `payload.assinatura`, ambos em base64url:
+
+- payload: JSON com sub (id do usuário), role, iat, exp, typ
+  ('access' ou 'refresh') e sid (família: os dois tokens de um mesmo login)
+- assinatura: HMAC-SHA256 do payload com TOKEN_SECRET
+
+A verificação é só CPU. Para o logout valer, a família revogada é gravada em
+revoked_tokens e cada processo mantém em memória as revogações ainda não
+expiradas, recarregadas por uma thread de fundo a cada
+TOKEN_DENYLIST_REFRESH_SECONDS (revogações feitas em outro worker valem
+depois desse intervalo). A requisição nunca consulta o banco: enquanto a
+primeira carga não termina (até TOKEN_DENYLIST_WAIT) ou se a última carga
+bem-sucedida passou de TOKEN_DENYLIST_MAX_STALENESS, os tokens são recusados
+com DenylistUnavailable (a rota responde 503).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import timedelta
+from config import Config
+from models import db, RevokedToken, get_sp_now
+
+
+class InvalidToken(Exception):
+    """Token malformado, com assinatura inválida, expirado ou revogado"""
+
+
+class DenylistUnavailable(Exception):
+    """Lista de revogados não carregada ou desatualizada: o token não pode ser aceito"""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(payload_b64):
+    return hmac.new(Config.TOKEN_SECRET.encode(), payload_b64.encode(), hashlib.sha256).digest()
+
+
+def encode_token(claims):
+    payload_b64 = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{payload_b64}.{_b64encode(_signature(payload_b64))}'
+
+
+def decode_token(token, expected_type):
+    """Valida assinatura, tipo e expiração; retorna as claims"""
+    try:
+        payload_b64, signature_b64 = token.split('.')
+        signature = _b64decode(signature_b64)
+    except ValueError:
+        raise InvalidToken('Token malformado')
+    if not hmac.compare_digest(signature, _signature(payload_b64)):
+        raise InvalidToken('Assinatura inválida')
+    claims = json.loads(_b64decode(payload_b64))
+    if claims.get('typ') != expected_type:
+        raise InvalidToken('Tipo de token inválido')
+    if claims.get('exp', 0) <= time.time():
+        raise InvalidToken('Token expirado')
+    if denylist.is_revoked(claims['sid']):
+        raise InvalidToken('Token revogado')
+    return claims
+
+
+def issue_tokens(user, sid=None):
+    """Emite o par de tokens de um login novo; com `sid`, só um novo token de acesso da família"""
+    now = int(time.time())
+    base = {'sub': user.id, 'role': user.role, 'iat': now, 'sid': sid or secrets.token_urlsafe(12)}
+    tokens = {
+        'accessToken': encode_token({**base, 'typ': 'access', 'exp': now + Config.ACCESS_TOKEN_TTL}),
+        'tokenType': 'Bearer',
+        'expiresIn': Config.ACCESS_TOKEN_TTL
+    }
+    if sid is None:
+        tokens['refreshToken'] = encode_token({**base, 'typ': 'refresh', 'exp': now + Config.REFRESH_TOKEN_TTL})
+    return tokens
+
+
+def bearer_token(request):
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip()
+    return None
+
+
+class TokenDenylist:
+    """Famílias de tokens revogadas, em memória, recarregadas do banco por uma thread de fundo"""
+
+    def __init__(self):
+        self._revoked = {}
+        # time.monotonic() da última carga bem-sucedida
+        self._loaded_at = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._app = None
+        self._pid = None
+        self._counters = {'checks': 0, 'reloads': 0, 'reload_errors': 0, 'unavailable': 0, 'revoked': 0}
+
+    # Ciclo de vida
+
+    def init_app(self, app):
+        # A thread de fundo inicia com a primeira verificação (is_revoked)
+        self._app = app
+
+    def start(self):
+        if self._pid == os.getpid() or self._app is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='token-denylist', daemon=True).start()
+            self._pid = os.getpid()
+
+    # API usada pelas rotas
+
+    def revoke(self, sid, user_id, expires_at_ts):
+        """Revoga a família até a expiração do token de renovação"""
+        expires_at = get_sp_now() + timedelta(seconds=max(0, expires_at_ts - time.time()))
+        if db.session.get(RevokedToken, sid) is None:
+            db.session.add(RevokedToken(sid=sid, user_id=user_id, expires_at=expires_at))
+            db.session.commit()
+        with self._lock:
+            self._revoked[sid] = expires_at_ts
+            self._counters['revoked'] += 1
+
+    def is_revoked(self, sid):
+        """Se a família foi revogada; DenylistUnavailable se a lista não está carregada e atualizada"""
+        self.start()
+        with self._lock:
+            self._counters['checks'] += 1
+        if not self._fresh():
+            # Primeira carga do processo em andamento
+            self._loaded.wait(Config.TOKEN_DENYLIST_WAIT)
+            if not self._fresh():
+                with self._lock:
+                    self._counters['unavailable'] += 1
+                raise DenylistUnavailable('Lista de tokens revogados indisponível')
+        return sid in self._revoked
+
+    def _fresh(self):
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at <= Config.TOKEN_DENYLIST_MAX_STALENESS
+
+    # Thread de fundo
+
+    def _run(self):
+        while True:
+            self._reload()
+            time.sleep(Config.TOKEN_DENYLIST_REFRESH_SECONDS)
+
+    def _reload(self):
+        try:
+            with self._app.app_context():
+                rows = db.session.query(RevokedToken.sid, RevokedToken.expires_at) \
+                    .filter(RevokedToken.expires_at > get_sp_now()).all()
+        except Exception as e:
+            # Mantém a lista anterior; sem carga por TOKEN_DENYLIST_MAX_STALENESS os tokens são recusados
+            with self._lock:
+                self._counters['reload_errors'] += 1
+            print(f'Falha ao recarregar tokens revogados: {e}')
+            return
+        offset = time.time() - get_sp_now().timestamp()
+        revoked = {sid: expires_at.timestamp() + offset for sid, expires_at in rows}
+        with self._lock:
+            # Revogações deste processo feitas durante a consulta continuam valendo
+            now = time.time()
+            for sid, expires_at_ts in self._revoked.items():
+                if expires_at_ts > now:
+                    revoked.setdefault(sid, expires_at_ts)
+            self._revoked = revoked
+            self._counters['reloads'] += 1
+        self._loaded_at = time.monotonic()
+        self._loaded.set()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._revoked), **self._counters}
+
+
+# Instância compartilhada pelo processo
+denylist = TokenDenylist()